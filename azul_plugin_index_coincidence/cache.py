@@ -0,0 +1,122 @@
+"""Cache results by key, in a bounded in-process LRU backed by an optional SQLite store on local disk.
+
+Values are stored as JSON, so anything json.dumps accepts can be cached, and floats come back exactly as stored.
+"""
+
+import collections
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+# Results kept in memory.
+MEMORY_ENTRIES = 1024
+
+# Bytes of stored results kept on disk before the least recently used are evicted.
+STORE_SIZE = 64 * 1024 * 1024
+
+
+def cache_key(*parts):
+    """Return a key for the given JSON-serialisable parts, such as a content hash, version and settings."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+
+class ResultCache:
+    """Cache of results, checked in memory first and then in the SQLite store at path, if one is given.
+
+    The hits, memory_hits, store_hits and misses counters record how lookups were served.
+    """
+
+    def __init__(self, memory_entries=MEMORY_ENTRIES, path=None, store_size=STORE_SIZE):
+        self.memory_entries = memory_entries
+        self.store_size = store_size
+        self.memory = collections.OrderedDict()
+        self.memory_hits = 0
+        self.store_hits = 0
+        self.misses = 0
+        # Jobs may be run from more than one thread, so the connection is shared under a lock.
+        self.lock = threading.Lock()
+        self.store = None
+        if path:
+            self.store = sqlite3.connect(path, check_same_thread=False)
+            with self.store:
+                self.store.execute(
+                    "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT, size INTEGER, used REAL)"
+                )
+
+    @property
+    def hits(self):
+        """Return the number of lookups served from memory or the store."""
+        return self.memory_hits + self.store_hits
+
+    def stats(self):
+        """Return the lookup counters as a dictionary."""
+        return {
+            "hits": self.hits,
+            "memory_hits": self.memory_hits,
+            "store_hits": self.store_hits,
+            "misses": self.misses,
+        }
+
+    def get(self, key):
+        """Return the value cached for key, or None if it isn't cached."""
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.memory_hits += 1
+                return json.loads(self.memory[key])
+
+            if self.store is not None:
+                row = self.store.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    with self.store:
+                        self.store.execute("UPDATE results SET used = ? WHERE key = ?", (time.time(), key))
+                    self._remember(key, row[0])
+                    self.store_hits += 1
+                    return json.loads(row[0])
+
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        """Cache value for key, evicting the least recently used results to stay within the size limits."""
+        encoded = json.dumps(value)
+        with self.lock:
+            self._remember(key, encoded)
+            if self.store is None or len(encoded) > self.store_size:
+                return
+            with self.store:
+                self.store.execute(
+                    "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)", (key, encoded, len(encoded), time.time())
+                )
+                self._evict()
+
+    def _remember(self, key, encoded):
+        """Keep an encoded value in memory, dropping the least recently used beyond memory_entries."""
+        if self.memory_entries <= 0:
+            return
+        self.memory[key] = encoded
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def _evict(self):
+        """Delete the least recently used stored results until they fit in store_size bytes."""
+        (total,) = self.store.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()
+        if total <= self.store_size:
+            return
+        excess = total - self.store_size
+        evicted = []
+        for key, size in self.store.execute("SELECT key, size FROM results ORDER BY used, rowid"):
+            if excess <= 0:
+                break
+            evicted.append((key,))
+            excess -= size
+        self.store.executemany("DELETE FROM results WHERE key = ?", evicted)
+
+    def close(self):
+        """Close the store, results in memory stay available."""
+        if self.store is not None:
+            self.store.close()
+            self.store = None
@@ -1,27 +1,213 @@
 """Calculate shannon entropy over data."""
 
-from _entropy import block_entropies, count_entropies, entropy
+import contextlib
+import io
+import math
+import mmap
+import os
+from typing import NamedTuple
 
+import numpy as np
+from _entropy import block_entropies, count_entropies, entropy, sliding_entropies
 
-def block_entropies_file(filepath, block_size):
-    """Return a list of entropies for given file, with block_size length."""
-    with open(filepath, "rb") as fh:
-        buf = fh.read()
+__all__ = [
+    "block_entropies",
+    "block_entropies_file",
+    "count_entropies",
+    "count_entropies_file",
+    "entropy",
+    "entropy_file",
+    "entropy_regions",
+    "entropy_stream",
+    "map_file",
+    "preflight_entropy",
+    "sliding_entropies",
+]
+
+# Bytes read from a file at a time.
+CHUNK_SIZE = 1024 * 1024
+
+# Smallest block the block entropy functions will use, matching the _entropy extension.
+MIN_BLOCK_SIZE = 256
+
+# Block size used to find high entropy regions.
+REGION_BLOCK_SIZE = 64 * 1024
+
+# Bytes read from the start of a file by an entropy preflight.
+PREFLIGHT_SIZE = 512 * 1024
+
+
+class Preflight(NamedTuple):
+    """Entropies of the parts of a file read by a preflight, see preflight_entropy."""
+
+    # Entropy of every byte read, taken together.
+    entropy: float
+    # Highest entropy of any block read.
+    block_maximum: float
+    # Bytes read.
+    size: int
+    # Whether the whole file was read, so the entropy is that of the file.
+    complete: bool
+
+
+def _read_blocks(fh, block_size, chunk_size):
+    """Yield chunks from a file-like object, each a whole number of block_size blocks apart from the last."""
+    chunk_size = max(block_size, chunk_size - chunk_size % block_size)
+    pending = b""
+    while True:
+        chunk = fh.read(chunk_size - len(pending))
+        if not chunk:
+            break
+        pending += chunk
+        if len(pending) == chunk_size:
+            yield pending
+            pending = b""
+    if pending:
+        yield pending
+
+
+def _stream_block_entropies(fh, block_size, chunk_size):
+    """Return block entropies for a file-like object in the same form as block_entropies, reading it in chunks."""
+    block_size = max(block_size, MIN_BLOCK_SIZE)
+    ents = []
+    length = 0
+    for chunk in _read_blocks(fh, block_size, chunk_size):
+        length += len(chunk)
+        # A trailing partial block is ignored, as block_entropies does.
+        if len(chunk) >= block_size:
+            ents.extend(block_entropies(chunk, block_size)[0])
+
+    if length < MIN_BLOCK_SIZE:
+        return [[], 0, 0]
+    return [ents, block_size, len(ents)]
+
+
+def _counts_entropy(counts, length):
+    """Calculate the entropy of length bytes from a count of each byte value."""
+    answer = 0.0
+    for count in counts[counts > 0].tolist():
+        pr = count / length
+        answer -= pr * math.log2(pr)
+    return answer
 
-    return block_entropies(buf, block_size)
 
+def entropy_stream(fh, chunk_size=CHUNK_SIZE):
+    """Calculate the entropy of a file-like object, reading it in chunks."""
+    counts = np.zeros(256, dtype=np.int64)
+    length = 0
+    while chunk := fh.read(chunk_size):
+        counts += np.bincount(np.frombuffer(chunk, dtype=np.uint8), minlength=256)
+        length += len(chunk)
+    return _counts_entropy(counts, length)
 
-def count_entropies_file(filepath, block_count):
-    """Return a list of length block_count of entropies for given file."""
+
+def preflight_entropy(fh, prefix_size=PREFLIGHT_SIZE, probes=0, block_size=REGION_BLOCK_SIZE):
+    """Return a Preflight for the first prefix_size bytes of a file-like object, and blocks probed after them.
+
+    If the file is seekable and longer than the prefix, probes blocks of block_size bytes are read at
+    evenly strided offsets after the prefix, the last ending at the end of the file. The file is left at
+    an unspecified position.
+    """
+    pieces = [fh.read(prefix_size)]
+    complete = len(pieces[0]) < prefix_size
+    if probes > 0 and not complete and fh.seekable():
+        size = fh.seek(0, io.SEEK_END)
+        # Probes closer together than a block would overlap, so the rest is read whole.
+        if size - prefix_size <= probes * block_size:
+            reads = [(prefix_size, size - prefix_size)]
+            complete = True
+        else:
+            strides = range(1, probes + 1)
+            reads = [
+                (prefix_size + (size - prefix_size - block_size) * stride // probes, block_size) for stride in strides
+            ]
+        for offset, length in reads:
+            fh.seek(offset)
+            pieces.append(fh.read(length))
+
+    counts = np.zeros(256, dtype=np.int64)
+    block_maximum = 0.0
+    for piece in pieces:
+        counts += np.bincount(np.frombuffer(piece, dtype=np.uint8), minlength=256)
+        # A piece shorter than a block, such as a short file, is taken as one block.
+        if len(piece) >= MIN_BLOCK_SIZE:
+            ents, _, _ = block_entropies(piece, min(block_size, len(piece)))
+            block_maximum = max([block_maximum, *ents])
+    size = sum(len(piece) for piece in pieces)
+    return Preflight(_counts_entropy(counts, size), block_maximum, size, complete)
+
+
+def entropy_regions(data, minimum_entropy, block_size=REGION_BLOCK_SIZE, maximum_size=None):
+    """Return (offset, size) tuples for the runs of adjacent blocks with at least minimum_entropy.
+
+    If maximum_size is given, the largest regions are kept until their total size would exceed it,
+    and the last region kept is cut short to fit. Regions are returned in order of offset.
+    """
+    ents, block_size, _ = block_entropies(data, block_size)
+    regions = []
+    for index, ent in enumerate(ents):
+        if ent < minimum_entropy:
+            continue
+        # Extend the region if this block follows on from it.
+        if regions and regions[-1][0] + regions[-1][1] == index * block_size:
+            regions[-1][1] += block_size
+        else:
+            regions.append([index * block_size, block_size])
+
+    if maximum_size is not None:
+        kept = []
+        for offset, size in sorted(regions, key=lambda region: -region[1]):
+            if maximum_size <= 0:
+                break
+            kept.append([offset, min(size, maximum_size)])
+            maximum_size -= size
+        regions = sorted(kept)
+    return [(offset, size) for offset, size in regions]
+
+
+@contextlib.contextmanager
+def map_file(fh):
+    """Memory-map an open file read-only, empty files can't be mapped so give empty bytes instead."""
+    if not os.fstat(fh.fileno()).st_size:
+        yield b""
+        return
+    with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        yield buf
+
+
+def block_entropies_file(filepath, block_size, chunk_size=CHUNK_SIZE, use_mmap=False):
+    """Return a list of entropies for given file, with block_size length.
+
+    The file is read in chunks, or memory-mapped and processed in one call if use_mmap is set.
+    """
     with open(filepath, "rb") as fh:
-        buf = fh.read()
+        if use_mmap:
+            with map_file(fh) as buf:
+                return block_entropies(buf, block_size)
+        return _stream_block_entropies(fh, block_size, chunk_size)
 
-    return count_entropies(buf, block_count)
 
+def count_entropies_file(filepath, block_count, chunk_size=CHUNK_SIZE, use_mmap=False):
+    """Return a list of length block_count of entropies for given file.
 
-def entropy_file(filepath):
-    """Calculate the entropy of a given file."""
+    The file is read in chunks, or memory-mapped and processed in one call if use_mmap is set.
+    """
     with open(filepath, "rb") as fh:
-        buf = fh.read()
+        if use_mmap:
+            with map_file(fh) as buf:
+                return count_entropies(buf, block_count)
+        # Block size comes from the file size, as count_entropies does.
+        size = os.fstat(fh.fileno()).st_size
+        return _stream_block_entropies(fh, size // block_count if block_count else 0, chunk_size)
 
-    return entropy(buf)
+
+def entropy_file(filepath, chunk_size=CHUNK_SIZE, use_mmap=False):
+    """Calculate the entropy of a given file.
+
+    The file is read in chunks, or memory-mapped and processed in one call if use_mmap is set.
+    """
+    with open(filepath, "rb") as fh:
+        if use_mmap:
+            with map_file(fh) as buf:
+                return entropy(buf)
+        return entropy_stream(fh, chunk_size)
@@ -2,81 +2,227 @@
 #include <Python.h>
 
 #include <math.h>
+#include <stdint.h>
 
 #define MIN_BLOCK_SIZE 256
 
+// sliding windows recount the running sum from the histogram this often,
+// so rounding errors from incremental updates can't build up
+#define SLIDE_RESYNC 65536
+
+// windows up to this many bytes look up n log2 n in a table sized to the window,
+// smaller windows use the module table
+#define SLIDE_TABLE_MAX (1 << 20)
+
+// counts below this look n log2 n up in a table built when the module loads
+#define NLOG2N_TABLE_SIZE (1 << 16)
+
+// bytes counted into the 32 bit lane counters before they are added to the
+// histogram, so no lane can overflow
+#define LANE_RUN (1 << 30)
+
+static double nlog2n_table[NLOG2N_TABLE_SIZE];
+
 struct entropy_block_info {
-    unsigned int size;
-    unsigned int count;
+    size_t size;
+    size_t count;
 };
 
-double entropy(const char *b, unsigned int sz)
+static double count_log2_count(size_t n)
+{
+    if (n < NLOG2N_TABLE_SIZE) {
+        return nlog2n_table[n];
+    }
+    return (double)n * log2((double)n);
+}
+
+static void build_nlog2n_table(void)
+{
+    size_t n;
+
+    nlog2n_table[0] = 0.0;
+    for (n = 1; n < NLOG2N_TABLE_SIZE; n++) {
+        nlog2n_table[n] = (double)n * log2((double)n);
+    }
+}
+
+// add the byte counts of b to cts, spreading consecutive bytes over four
+// lanes so repeated values don't wait on the previous increment of the
+// same counter
+static void count_bytes(const unsigned char *b, size_t sz, size_t *cts)
+{
+    uint32_t lanes[4][256];
+    size_t i, run, stop;
+
+    for (run = 0; run < sz; run += LANE_RUN) {
+        stop = sz - run < LANE_RUN ? sz - run : LANE_RUN;
+        memset(lanes, 0, sizeof(lanes));
+        for (i = 0; i + 4 <= stop; i += 4) {
+            lanes[0][b[run + i]]++;
+            lanes[1][b[run + i + 1]]++;
+            lanes[2][b[run + i + 2]]++;
+            lanes[3][b[run + i + 3]]++;
+        }
+        for (; i < stop; i++) {
+            lanes[0][b[run + i]]++;
+        }
+        for (i = 0; i < 256; i++) {
+            cts[i] += (size_t)lanes[0][i] + lanes[1][i] + lanes[2][i] +
+                      lanes[3][i];
+        }
+    }
+}
+
+// shannon entropy is (N log2 N - sum(n log2 n)) / N over the byte counts n
+double entropy(const unsigned char *b, size_t sz)
 {
     double answer;
-    double pr;
-    double result;
-    unsigned int i;
-    unsigned int cts[256];
+    double sum = 0.0;
+    size_t i;
+    size_t cts[256];
+
+    if (sz == 0) {
+        return 0.0;
+    }
 
     memset(cts, 0, sizeof(cts));
+    count_bytes(b, sz, cts);
 
-    for (i = 0; i < sz; i++) {
-        cts[b[i] & 0xFF]++;
+    for (i = 0; i < 256; i++) {
+        sum += count_log2_count(cts[i]);
     }
 
-    answer = 0.0;
+    // rounding can leave a single repeated byte just above or below zero
+    answer = (count_log2_count(sz) - sum) / (double)sz;
+    return answer > 0.0 ? answer : 0.0;
+}
+
+// n log2 n from the table when there is one, counts never exceed the window
+#define NLOG2N(table, n) ((table) ? (table)[n] : count_log2_count(n))
+
+static double histogram_sum(const size_t *cts, const double *table)
+{
+    double sum = 0.0;
+    size_t i;
+
     for (i = 0; i < 256; i++) {
-        if (cts[i]) {
-            pr = cts[i] / (double)sz;
-	    __asm__ ("fyl2x" : "=t" (result) : "0" (pr), "u" (pr) : "st(1)");
-            answer += result;
+        sum += NLOG2N(table, cts[i]);
+    }
+    return sum;
+}
+
+// entropy is log2 N - sum(n log2 n) / N, clamped as rounding can take it just below zero
+static double window_entropy(double log2_window, double sum, size_t window)
+{
+    double ent = log2_window - sum / (double)window;
+
+    return ent > 0.0 ? ent : 0.0;
+}
+
+// entropy of every window of window bytes starting at a multiple of step,
+// with the sum of n log2 n over the histogram updated as bytes enter and leave
+static void sliding_entropy_values(const unsigned char *b, size_t window,
+                                   size_t step, size_t count, double *values,
+                                   double *table)
+{
+    size_t cts[256];
+    size_t i, j, start;
+    size_t updates = 0;
+    double sum;
+    double log2_window = log2((double)window);
+    unsigned char in, out;
+
+    if (table) {
+        for (i = 0; i <= window; i++) {
+            table[i] = count_log2_count(i);
         }
     }
 
-    if (answer == 0.0) {
-        return 0.0;
+    memset(cts, 0, sizeof(cts));
+    count_bytes(b, window, cts);
+    sum = histogram_sum(cts, table);
+    values[0] = window_entropy(log2_window, sum, window);
+
+    for (i = 1; i < count; i++) {
+        start = i * step;
+        if (step >= window) {
+            // windows don't overlap, so counting afresh is cheaper
+            memset(cts, 0, sizeof(cts));
+            count_bytes(&b[start], window, cts);
+            sum = histogram_sum(cts, table);
+        } else {
+            for (j = start - step; j < start; j++) {
+                out = b[j];
+                in = b[j + window];
+                if (in == out) {
+                    continue;
+                }
+                sum += NLOG2N(table, cts[out] - 1) - NLOG2N(table, cts[out]);
+                cts[out]--;
+                sum += NLOG2N(table, cts[in] + 1) - NLOG2N(table, cts[in]);
+                cts[in]++;
+            }
+            updates += step;
+            if (updates >= SLIDE_RESYNC) {
+                sum = histogram_sum(cts, table);
+                updates = 0;
+            }
+        }
+        values[i] = window_entropy(log2_window, sum, window);
     }
-    return -answer;
 }
 
-static PyObject *entropies(const char *b, struct entropy_block_info *ebi)
+static PyObject *entropies(const unsigned char *b, struct entropy_block_info *ebi)
 {
     PyObject *ents;
     PyObject *py_ent;
-    unsigned int i;
-    double ent;
+    double *values;
+    size_t i;
+
+    values = PyMem_Malloc((ebi->count ? ebi->count : 1) * sizeof(double));
+    if (!values) {
+        return PyErr_NoMemory();
+    }
+
+    // calculate the entropy for each block in the buf
+    Py_BEGIN_ALLOW_THREADS
+    for (i = 0; i < ebi->count; i++) {
+        values[i] = entropy(&b[i * ebi->size], ebi->size);
+    }
+    Py_END_ALLOW_THREADS
 
     // initialise the python list
-    ents = PyList_New(ebi->count);
+    ents = PyList_New((Py_ssize_t)ebi->count);
     if (!ents) {
+        PyMem_Free(values);
         return NULL;
     }
 
-    // calculate the entropy for each block in the buf
+    // build a float for each block and put into the list
     for (i = 0; i < ebi->count; i++) {
-        ent = entropy(&b[i * ebi->size], ebi->size);
-
-        // build a float and put into the list
-        py_ent = PyFloat_FromDouble(ent);
+        py_ent = PyFloat_FromDouble(values[i]);
         if (!py_ent) {
             Py_DECREF(ents);
+            PyMem_Free(values);
             return NULL;
         }
-        PyList_SetItem(ents, i, py_ent);
+        PyList_SET_ITEM(ents, (Py_ssize_t)i, py_ent);
     }
 
+    PyMem_Free(values);
+
     // returning the python list of entropies
     return ents;
 }
 
-void get_ebi_byblocksize(unsigned int size, unsigned int block_size,
+void get_ebi_byblocksize(size_t size, size_t block_size,
                          struct entropy_block_info *ebi)
 {
     ebi->size = block_size < MIN_BLOCK_SIZE ? MIN_BLOCK_SIZE : block_size;
     ebi->count = size / ebi->size;
 }
 
-void get_ebi_bycount(unsigned int size, unsigned int count,
+void get_ebi_bycount(size_t size, size_t count,
                      struct entropy_block_info *ebi)
 {
     if (count == 0) {
@@ -90,49 +236,137 @@ static PyObject *py_entropy(PyObject *self, PyObject *args, PyObject *kwds)
 {
     static char *kwlist[] = {"buf", NULL};
 
-    const char *b;
-    Py_ssize_t n;
+    Py_buffer view;
     double ent;
 
-    if (!PyArg_ParseTupleAndKeywords(args, kwds, "s#", kwlist, &b, &n)) {
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "s*", kwlist, &view)) {
         return NULL;
     }
 
-    // calculate the entropy
-    ent = entropy(b, (unsigned int)n);
+    // calculate the entropy, the buffer is held by view so the GIL can go
+    Py_BEGIN_ALLOW_THREADS
+    ent = entropy(view.buf, (size_t)view.len);
+    Py_END_ALLOW_THREADS
+    PyBuffer_Release(&view);
 
     // return the result
     return Py_BuildValue("d", ent);
 }
 
-static PyObject *py_block_entropies(PyObject *self, PyObject *args,
-                                    PyObject *kwds)
+static PyObject *py_sliding_entropies(PyObject *self, PyObject *args,
+                                      PyObject *kwds)
 {
-    static char *kwlist[] = {"buf", "block_size", NULL};
+    static char *kwlist[] = {"buf", "window", "step", NULL};
+
+    Py_buffer view;
+    Py_ssize_t window;
+    Py_ssize_t step = 1;
+    size_t count = 0;
+    double *values;
+    double *table = NULL;
+    PyObject *array_module, *ents, *res;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "s*n|n", kwlist,
+                                     &view, &window, &step)) {
+        return NULL;
+    }
+    if (window <= 0 || step <= 0) {
+        PyBuffer_Release(&view);
+        PyErr_SetString(PyExc_ValueError, "window and step must be positive");
+        return NULL;
+    }
+    if (view.len >= window) {
+        count = (size_t)(view.len - window) / (size_t)step + 1;
+    }
 
-    struct entropy_block_info ebi;
-    PyObject *ents;
-    const char *b;
-    Py_ssize_t n;
-    unsigned int block_size;
+    values = PyMem_Malloc((count ? count : 1) * sizeof(double));
+    if (!values) {
+        PyBuffer_Release(&view);
+        return PyErr_NoMemory();
+    }
+    if (count && window >= NLOG2N_TABLE_SIZE && window <= SLIDE_TABLE_MAX) {
+        table = PyMem_Malloc(((size_t)window + 1) * sizeof(double));
+        if (!table) {
+            PyMem_Free(values);
+            PyBuffer_Release(&view);
+            return PyErr_NoMemory();
+        }
+    }
+    if (count) {
+        Py_BEGIN_ALLOW_THREADS
+        sliding_entropy_values(view.buf, (size_t)window, (size_t)step, count,
+                               values, table);
+        Py_END_ALLOW_THREADS
+    }
+    PyMem_Free(table);
+    PyBuffer_Release(&view);
 
-    if (!PyArg_ParseTupleAndKeywords(args, kwds, "s#I", kwlist,
-                                     &b, &n, &block_size)) {
+    // pack the doubles into an array rather than a float object per window
+    array_module = PyImport_ImportModule("array");
+    if (!array_module) {
+        PyMem_Free(values);
+        return NULL;
+    }
+    ents = PyObject_CallMethod(array_module, "array", "s", "d");
+    Py_DECREF(array_module);
+    if (!ents) {
+        PyMem_Free(values);
+        return NULL;
+    }
+    res = PyObject_CallMethod(ents, "frombytes", "y#", (const char *)values,
+                              (Py_ssize_t)(count * sizeof(double)));
+    PyMem_Free(values);
+    if (!res) {
+        Py_DECREF(ents);
         return NULL;
     }
+    Py_DECREF(res);
+    return ents;
+}
+
+static PyObject *build_entropies(Py_buffer *view, struct entropy_block_info *ebi)
+{
+    PyObject *ents;
 
-    if (n < MIN_BLOCK_SIZE) {
-        ebi.size = 0;
-        ebi.count = 0;
+    if (view->len < MIN_BLOCK_SIZE) {
+        ebi->size = 0;
+        ebi->count = 0;
         ents = PyList_New(0);
     } else {
         // calculate the entropies
-        get_ebi_byblocksize(n, block_size, &ebi);
-        ents = entropies(b, &ebi);
+        ents = entropies(view->buf, ebi);
+    }
+    PyBuffer_Release(view);
+    if (!ents) {
+        return NULL;
     }
 
     // return the result
-    return Py_BuildValue("[OII]", ents, ebi.size, ebi.count);
+    return Py_BuildValue("[Nnn]", ents, (Py_ssize_t)ebi->size,
+                         (Py_ssize_t)ebi->count);
+}
+
+static PyObject *py_block_entropies(PyObject *self, PyObject *args,
+                                    PyObject *kwds)
+{
+    static char *kwlist[] = {"buf", "block_size", NULL};
+
+    struct entropy_block_info ebi;
+    Py_buffer view;
+    Py_ssize_t block_size;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "s*n", kwlist,
+                                     &view, &block_size)) {
+        return NULL;
+    }
+    if (block_size < 0) {
+        PyBuffer_Release(&view);
+        PyErr_SetString(PyExc_ValueError, "block_size must not be negative");
+        return NULL;
+    }
+
+    get_ebi_byblocksize((size_t)view.len, (size_t)block_size, &ebi);
+    return build_entropies(&view, &ebi);
 }
 
 static PyObject *py_count_entropies(PyObject *self, PyObject *args,
@@ -141,28 +375,21 @@ static PyObject *py_count_entropies(PyObject *self, PyObject *args,
     static char *kwlist[] = {"buf", "count", NULL};
 
     struct entropy_block_info ebi;
-    PyObject *ents;
-    const char *b;
-    Py_ssize_t n;
-    unsigned int count;
+    Py_buffer view;
+    Py_ssize_t count;
 
-    if (!PyArg_ParseTupleAndKeywords(args, kwds, "s#I", kwlist,
-                                     &b, &n, &count)) {
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "s*n", kwlist,
+                                     &view, &count)) {
         return NULL;
     }
-
-    if (n < MIN_BLOCK_SIZE) {
-        ebi.size = 0;
-        ebi.count = 0;
-        ents = PyList_New(0);
-    } else {
-        // calculate the entropies
-        get_ebi_bycount(n, count, &ebi);
-        ents = entropies(b, &ebi);
+    if (count < 0) {
+        PyBuffer_Release(&view);
+        PyErr_SetString(PyExc_ValueError, "count must not be negative");
+        return NULL;
     }
 
-    // return the result
-    return Py_BuildValue("[OII]", ents, ebi.size, ebi.count);
+    get_ebi_bycount((size_t)view.len, (size_t)count, &ebi);
+    return build_entropies(&view, &ebi);
 }
 
 PyDoc_STRVAR(module_doc,
@@ -179,6 +406,11 @@ PyDoc_STRVAR(block_entropies_doc,
     "block_entropies(buf, block_size)\n"
     "\n"
     "Return a list of entropies for this buffer, with block_size length.");
+PyDoc_STRVAR(sliding_entropies_doc,
+    "sliding_entropies(buf, window, step=1)\n"
+    "\n"
+    "Return an array('d') of the entropies of every window bytes of this buffer,\n"
+    "starting every step bytes. Overlapping windows are updated incrementally.");
 PyDoc_STRVAR(count_entropies_doc,
     "count_entropies(buf, count)\n"
     "\n"
@@ -191,6 +423,8 @@ static PyMethodDef entropy_methods[] = {
      METH_VARARGS | METH_KEYWORDS, block_entropies_doc},
     {"count_entropies", (PyCFunction)py_count_entropies,
      METH_VARARGS | METH_KEYWORDS, count_entropies_doc},
+    {"sliding_entropies", (PyCFunction)py_sliding_entropies,
+     METH_VARARGS | METH_KEYWORDS, sliding_entropies_doc},
     {NULL, NULL, 0, NULL}
 };
 
@@ -209,11 +443,13 @@ static struct PyModuleDef moduledef = {
 
 PyMODINIT_FUNC PyInit__entropy(void)
 {
+    build_nlog2n_table();
     return PyModule_Create(&moduledef);
 }
 #else
 PyMODINIT_FUNC init_entropy(void)
 {
+    build_nlog2n_table();
     Py_InitModule3("_entropy", entropy_methods, module_doc);
 }
 #endif
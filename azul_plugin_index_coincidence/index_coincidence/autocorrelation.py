@@ -0,0 +1,125 @@
+"""Score every key width at once by autocorrelating the per-byte-value indicator streams.
+
+The number of positions where data matches itself shifted along by a width is the sum, over each byte value,
+of the autocorrelation of that value's indicator stream (1 where the byte has that value, 0 elsewhere).
+Common byte values are autocorrelated with an FFT, which costs the same whatever the width range.
+Rare byte values are cheaper to autocorrelate by pairing up their positions that sit within range of each other.
+Either way the counts are exact, so scores match the direct engine.
+"""
+
+import math
+
+import numpy as np
+
+# Approximate seconds per unit of work, used to pick the cheapest way of counting.
+# FFTs cost one unit per point per log2(points).
+FFT_COST = 2.5e-9
+# Pairing positions costs one unit per pair of positions examined,
+# plus a step unit per pass over a byte value's positions.
+PAIR_COST = 8e-9
+STEP_COST = 5e-6
+# Grouping positions by byte value costs one unit per byte of data.
+SORT_COST = 40e-9
+
+
+def transform_size(minimum):
+    """Return the smallest size of at least minimum with only 2, 3 and 5 as factors, which FFTs handle quickly."""
+    best = 1 << max(minimum - 1, 0).bit_length()
+    power5 = 1
+    while power5 < best:
+        power35 = power5
+        while power35 < best:
+            size = power35
+            while size < minimum:
+                size *= 2
+            best = min(best, size)
+            power35 *= 3
+        power5 *= 5
+    return best
+
+
+def _fft_cost(size):
+    """Return the estimated cost of autocorrelating one indicator stream with an FFT."""
+    return FFT_COST * size * math.log2(size)
+
+
+def _pair_cost(count, length, maximum_width):
+    """Return the estimated cost of pairing up count positions, spread across length bytes, within maximum_width."""
+    steps = 1 + count * maximum_width / length
+    return PAIR_COST * count * steps + STEP_COST * steps
+
+
+def estimate_cost(histogram, maximum_width):
+    """Return the estimated cost of autocorrelation_matches for data with the given byte histogram."""
+    length = int(sum(histogram))
+    maximum_width = min(maximum_width, length - 1)
+    if maximum_width <= 0:
+        return 0.0
+
+    fft_cost = _fft_cost(transform_size(length + maximum_width))
+    cost = SORT_COST * length
+    for count in histogram:
+        if count:
+            cost += min(fft_cost, _pair_cost(int(count), length, maximum_width))
+    return cost
+
+
+def _pair_matches(positions, maximum_width):
+    """Return the number of pairs of positions separated by each distance from 0 to maximum_width."""
+    gaps = []
+    for step in range(1, positions.size):
+        # Positions are sorted, so distances only grow as step does.
+        distances = positions[step:] - positions[:-step]
+        distances = distances[distances <= maximum_width]
+        if not distances.size:
+            break
+        gaps.append(distances)
+
+    if not gaps:
+        return np.zeros(maximum_width + 1, dtype=np.int64)
+    return np.bincount(np.concatenate(gaps), minlength=maximum_width + 1)
+
+
+def autocorrelation_matches(data, maximum_width):
+    """Return a list of the number of positions i where data[i] == data[i + width], for each width.
+
+    Widths run from 1 up to maximum_width or the length of the data, the same as the width_matches kernel.
+    """
+    values = np.frombuffer(data, dtype=np.uint8)
+    length = values.size
+    maximum_width = min(maximum_width, length - 1)
+    if maximum_width <= 0:
+        return []
+
+    histogram = np.bincount(values, minlength=256)
+
+    # Zero pad the FFTs so shifts up to maximum_width never wrap around onto the start of the data.
+    size = transform_size(length + maximum_width)
+    fft_cost = _fft_cost(size)
+
+    # Group positions by byte value, each group stays in ascending order.
+    order = np.argsort(values, kind="stable")
+    ends = np.cumsum(histogram)
+
+    counts = np.zeros(maximum_width + 1, dtype=np.int64)
+    power = None
+    for value in np.flatnonzero(histogram):
+        count = int(histogram[value])
+        if _pair_cost(count, length, maximum_width) <= fft_cost:
+            counts += _pair_matches(order[ends[value] - count : ends[value]], maximum_width)
+            continue
+
+        # Sum power spectra so a single inverse transform gives the combined autocorrelation.
+        spectrum = np.fft.rfft(values == value, n=size)
+        spectrum = spectrum.real**2 + spectrum.imag**2
+        if power is None:
+            power = spectrum
+        else:
+            power += spectrum
+
+    if power is not None:
+        correlation = np.fft.irfft(power, n=size)[: maximum_width + 1]
+        counts += np.rint(correlation).astype(np.int64)
+
+    # Distance 0 pairs every position with itself, widths start at 1.
+    return counts[1:].tolist()
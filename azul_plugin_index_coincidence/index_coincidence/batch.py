@@ -0,0 +1,163 @@
+"""Analyse many files at once across a pool of processes, writing one JSON record per file.
+
+Files are memory-mapped so the entropy gate pass also gives each file's entropy, see analyse_gated.
+"""
+
+import functools
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from ..entropy import map_file
+from .fingerprint import fingerprint
+from .main import MAXIMUM_WIDTH, analyse_gated, analyse_keys, analyse_transforms
+
+# Path that reads a newline-delimited list of paths from stdin.
+STDIN_PATH = "-"
+
+# Records added to a fingerprint index in each transaction.
+INDEX_BATCH_SIZE = 256
+
+
+def iter_paths(paths, stdin=None):
+    """Yield the files to analyse from a list of file paths, directories and STDIN_PATH.
+
+    Directories are walked recursively in sorted order, and STDIN_PATH reads one path per line from stdin.
+    """
+    for path in paths:
+        if path == STDIN_PATH:
+            stdin = stdin or sys.stdin
+            yield from iter_paths(line.rstrip("\n") for line in stdin if line.strip())
+        elif os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def _analyse_into(
+    record, data, maximum_width, sampling_size, adaptive=False, plaintext=None, transforms=False, workers=1
+):
+    """Add the size of data and the results of analysing it to record.
+
+    With a plaintext byte, a key is recovered for each width and added as [width, hex key, decoded entropy],
+    and with transforms, transform widths are added as [transform, width, score], see analyse_keys and
+    analyse_transforms.
+    """
+    record["size"] = len(data)
+    # Widths are scored on pairs of bytes, so shorter data, or no width to score, has no results.
+    if len(data) < 2 or maximum_width < 1:
+        record["error"] = "too little data to analyse"
+        return
+    # A minimum entropy of zero always passes, the gate is only run for the entropy it reports.
+    analysis = analyse_gated(data, 0.0, maximum_width, sampling_size, workers, adaptive=adaptive)
+    record["baseline"] = analysis.baseline
+    record["entropy"] = analysis.entropy
+    record["widths"] = [[width, score] for width, score in analysis.widths]
+    record["scores"] = [[width, score] for width, score in analysis.scores]
+    record["estimated"] = sorted(analysis.estimated)
+    record["fingerprint"] = fingerprint(analysis.scores).hex()
+    if plaintext is not None:
+        analysis = analyse_keys(data, analysis, plaintext)
+        record["keys"] = [[recovery.width, recovery.key.hex(), recovery.entropy] for recovery in analysis.keys]
+    if transforms:
+        analysis = analyse_transforms(data, analysis, maximum_width, workers=workers)
+        record["transforms"] = [list(transformed) for transformed in analysis.transforms]
+
+
+def analyse_file(
+    path, maximum_width=MAXIMUM_WIDTH, sampling_size=None, adaptive=False, plaintext=None, transforms=False, workers=1
+):
+    """Analyse a single file and return its JSON-serialisable record, see _analyse_into.
+
+    Files that can't be read or analysed give a record with an error instead of results,
+    so one bad file doesn't stop the batch.
+    """
+    start = time.perf_counter()
+    record = {"path": path}
+    try:
+        with open(path, "rb") as f, map_file(f) as data:
+            _analyse_into(record, data, maximum_width, sampling_size, adaptive, plaintext, transforms, workers)
+    except (OSError, ValueError) as e:
+        record["error"] = str(e)
+    record["seconds"] = time.perf_counter() - start
+    return record
+
+
+def analyse_buffer(data, maximum_width=MAXIMUM_WIDTH, sampling_size=None):
+    """Analyse a buffer and return its JSON-serialisable record, the same as analyse_file without a path."""
+    start = time.perf_counter()
+    record = {}
+    try:
+        _analyse_into(record, data, maximum_width, sampling_size)
+    except ValueError as e:
+        record["error"] = str(e)
+    record["seconds"] = time.perf_counter() - start
+    return record
+
+
+def run_batch(
+    paths,
+    maximum_width=MAXIMUM_WIDTH,
+    sampling_size=None,
+    processes=None,
+    ordered=False,
+    adaptive=False,
+    plaintext=None,
+    transforms=False,
+    workers=1,
+):
+    """Yield a record for each path, analysing files across a pool of processes, see analyse_file.
+
+    Records are yielded as soon as each file is done, or in the order of paths if ordered is set,
+    which can hold finished records back behind a slow file.
+    """
+    analyse_path = functools.partial(
+        analyse_file,
+        maximum_width=maximum_width,
+        sampling_size=sampling_size,
+        adaptive=adaptive,
+        plaintext=plaintext,
+        transforms=transforms,
+        workers=workers,
+    )
+    with multiprocessing.Pool(processes or None) as pool:
+        mapper = pool.imap if ordered else pool.imap_unordered
+        yield from mapper(analyse_path, paths)
+
+
+def index_records(records, index, similar=False, batch_size=INDEX_BATCH_SIZE):
+    """Yield each record, adding its fingerprint to a FingerprintIndex under its absolute path.
+
+    Records are added batch_size at a time. If similar is set, each record is first given a list of the
+    [path, similarity] of the similar fingerprints already in the index, and is added before the next is
+    looked up, so files in the same batch find each other.
+    """
+    pending = []
+    try:
+        for record in records:
+            if "fingerprint" in record:
+                # Daemons are sent absolute paths, so a file is indexed under the same name either way.
+                path = os.path.abspath(record["path"])
+                value = bytes.fromhex(record["fingerprint"])
+                if similar:
+                    record["similar"] = [[other, score] for other, score in index.query(value) if other != path]
+                pending.append((path, value))
+                if similar or len(pending) >= batch_size:
+                    index.add_many(pending)
+                    pending = []
+            yield record
+    finally:
+        index.add_many(pending)
+
+
+def write_records(records, out=None):
+    """Write each record as a line of JSON, flushing so results can be followed as they arrive."""
+    out = out or sys.stdout
+    for record in records:
+        out.write(json.dumps(record) + "\n")
+        out.flush()
@@ -0,0 +1,259 @@
+"""Command-line interface to the index of coincidence analysis, and to the daemon serving it.
+
+Only the standard library is imported up front. Files are sent to a running daemon when one is listening,
+so the analysis library is only loaded when analysing in this process.
+"""
+
+import argparse
+import json
+import mmap
+import os
+import sys
+
+from .client import connect
+
+
+def print_results(baseline, widths, estimated=(), keys=(), transforms=()):
+    """Display a baseline index of coincidence, the widths raising it, and any keys recovered or transform widths."""
+    print("Index of coincidence: %s" % baseline)
+    if widths:
+        print("Widths:")
+        for width, score in widths:
+            sampled = " (sampled)" if width in estimated else ""
+            print("\tWidth %d raises index to %s%s" % (width, score, sampled))
+    if transforms:
+        print("Transform widths:")
+    for transformed in transforms:
+        print("\tWidth %d raises index of %s to %s" % (transformed.width, transformed.transform, transformed.score))
+    for recovery in keys:
+        print("Key for width %d: %s (decoded entropy %.3f)" % (recovery.width, recovery.key.hex(), recovery.entropy))
+
+
+def print_similar(similar):
+    """Display the files with fingerprints similar to the file analysed, most similar first."""
+    if similar:
+        print("Similar files:")
+    for path, score in similar:
+        print("\t%s (similarity %.3f)" % (path, score))
+
+
+def run_client(client, args, batch, index=None):
+    """Analyse the files on the daemon behind client, adding them to any FingerprintIndex, returning the exit status."""
+    if batch or index is not None:
+        # Loading the library once is nothing next to a batch, and keeps paths expanded the same way.
+        from .batch import index_records, iter_paths, write_records
+
+    if batch:
+        records = (
+            client.analyse_file(path, args.maximum_width, args.sampling_size) for path in iter_paths(args.filepaths)
+        )
+        write_records(records if index is None else index_records(records, index, args.similar))
+        return 0
+
+    record = client.analyse_file(args.filepaths[0], args.maximum_width, args.sampling_size)
+    if "error" in record:
+        print("%s: %s" % (args.filepaths[0], record["error"]), file=sys.stderr)
+        return 1
+    if index is not None:
+        (record,) = index_records([record], index, args.similar)
+    print_results(record["baseline"], record["widths"], record["estimated"])
+    print_similar(record.get("similar", []))
+    return 0
+
+
+def run_local(args, batch, index=None):
+    """Analyse the files in this process, adding them to any FingerprintIndex, returning the exit status."""
+    # Imported here so a client of the daemon never loads the analysis library.
+    from .main import MAXIMUM_WIDTH, analyse, analyse_keys, analyse_stream, analyse_transforms
+    from .xor import PLAINTEXT_BYTE
+
+    maximum_width = MAXIMUM_WIDTH if args.maximum_width is None else args.maximum_width
+    plaintext = PLAINTEXT_BYTE if args.plaintext_byte is None else args.plaintext_byte
+    if batch:
+        from .batch import index_records, iter_paths, run_batch, write_records
+
+        records = run_batch(
+            iter_paths(args.filepaths),
+            maximum_width,
+            args.sampling_size,
+            args.processes,
+            args.ordered,
+            adaptive=args.adaptive,
+            plaintext=plaintext if args.recover_keys else None,
+            transforms=args.transforms,
+            # Files are already spread across processes, so each is scored on one thread unless asked otherwise.
+            workers=1 if args.workers is None else args.workers,
+        )
+        write_records(records if index is None else index_records(records, index, args.similar))
+        return 0
+
+    workers = 0 if args.workers is None else args.workers
+    # Compute baseline index of coincidence and possible widths.
+    # Streaming holds only a chunk of the file in memory, mapping gives random access without reading it in.
+    with open(args.filepaths[0], "rb") as f:
+        if args.mmap or args.adaptive or args.recover_keys or args.transforms or args.sampling_size is not None:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as file_data:
+                analysis = analyse(file_data, maximum_width, args.sampling_size, workers, adaptive=args.adaptive)
+                if args.recover_keys:
+                    analysis = analyse_keys(file_data, analysis, plaintext)
+                if args.transforms:
+                    analysis = analyse_transforms(file_data, analysis, maximum_width, workers=workers)
+        else:
+            analysis = analyse_stream(f, maximum_width, workers=workers)
+
+    print_results(analysis.baseline, analysis.widths, analysis.estimated, analysis.keys, analysis.transforms)
+    if index is not None:
+        from .batch import index_records
+        from .fingerprint import fingerprint
+
+        record = {"path": args.filepaths[0], "fingerprint": fingerprint(analysis.scores).hex()}
+        (record,) = index_records([record], index, args.similar)
+        print_similar(record.get("similar", []))
+    return 0
+
+
+def main():
+    """Calculate and display the index of coincidence on the supplied file."""
+    # Use argparse to provide a user interface and collect arguments.
+    description = "Compute index of coincidence and find obfuscation widths."
+    parser = argparse.ArgumentParser(description=description)
+
+    # Only required argument is a file to scan, several files or directories are analysed as a batch.
+    parser.add_argument(
+        "filepaths",
+        nargs="*",
+        metavar="filepath",
+        help="File to analyse, or files and directories to analyse as a batch, - reads a list of paths from stdin.",
+    )
+    # Defaults of None stand for the library's defaults, which a client leaves to the daemon.
+    parser.add_argument(
+        "--maximum-width",
+        type=int,
+        help="Largest key width to test (default: 300).",
+    )
+    parser.add_argument(
+        "--sampling-size",
+        type=int,
+        help="Score files larger than this many bytes from a sample, implies --mmap.",
+    )
+    parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="Score exactly only the widths a sample shows could be chosen, implies --mmap and --no-daemon.",
+    )
+    parser.add_argument(
+        "--recover-keys",
+        action="store_true",
+        help="Recover a key for each width by frequency analysis, implies --mmap and --no-daemon.",
+    )
+    parser.add_argument(
+        "--plaintext-byte",
+        type=lambda value: int(value, 0),
+        help="Byte assumed most common in the plaintext when recovering keys (default: 0).",
+    )
+    parser.add_argument(
+        "--transforms",
+        action="store_true",
+        help="Also score the differences and running sums of the file's bytes, implies --mmap and --no-daemon.",
+    )
+    parser.add_argument(
+        "--mmap",
+        action="store_true",
+        help="Memory-map the file instead of streaming it, which allows faster scoring engines.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Threads to score each file with, zero uses every available CPU "
+        "(default: every CPU for one file, one per process for a batch).",
+    )
+    parser.add_argument(
+        "--jsonl",
+        action="store_true",
+        help="Write a JSON record per file, implied by analysing several files, a directory or stdin.",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        help="Processes to analyse a batch of files with, or for a daemon to keep (default: every CPU).",
+    )
+    parser.add_argument(
+        "--ordered",
+        action="store_true",
+        help="Write batch records in the order of the paths, rather than as each file finishes.",
+    )
+    parser.add_argument(
+        "--fingerprint-index",
+        help="Add a fingerprint of the width scores of each file analysed to the index at this path.",
+    )
+    parser.add_argument(
+        "--similar",
+        action="store_true",
+        help="List the files already in the --fingerprint-index with similar fingerprints to each file analysed.",
+    )
+    parser.add_argument(
+        "--clusters",
+        action="store_true",
+        help="Write each group of files in the --fingerprint-index with similar fingerprints as a line of JSON.",
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Keep a pool of processes warm and analyse files sent to the socket, until interrupted.",
+    )
+    parser.add_argument(
+        "--socket",
+        help="Socket of the daemon to serve or send files to (default: $INDEX_COINCIDENCE_SOCKET, "
+        "or a socket in $XDG_RUNTIME_DIR).",
+    )
+    parser.add_argument(
+        "--no-daemon",
+        action="store_true",
+        help="Analyse in this process even if a daemon is running.",
+    )
+    args = parser.parse_args()
+    if args.maximum_width is not None and args.maximum_width < 1:
+        parser.error("--maximum-width must be at least 1")
+
+    if args.daemon:
+        # Imported here as the daemon module loads the analysis library.
+        from .daemon import serve
+
+        try:
+            serve(args.socket, args.processes)
+        except OSError as e:
+            parser.exit(1, f"{parser.prog}: {e}\n")
+        return
+    if (args.similar or args.clusters) and not args.fingerprint_index:
+        parser.error("--similar and --clusters need a --fingerprint-index")
+    # Imported here as the index loads NumPy, which a client of the daemon otherwise avoids.
+    index = None
+    if args.fingerprint_index:
+        from .fingerprint import FingerprintIndex
+
+        index = FingerprintIndex(args.fingerprint_index)
+    if args.clusters:
+        for cluster in index.clusters():
+            print(json.dumps(cluster))
+        return
+    if not args.filepaths:
+        parser.error("a filepath is required unless running a --daemon or listing --clusters")
+
+    batch = args.jsonl or len(args.filepaths) > 1 or any(path == "-" or os.path.isdir(path) for path in args.filepaths)
+    # The daemon only runs the analysis a batch record holds.
+    local = args.no_daemon or args.adaptive or args.recover_keys or args.transforms
+    client = None
+    if not local:
+        try:
+            client = connect(args.socket)
+        except PermissionError as e:
+            # A socket that can't be trusted is no reason not to analyse, so only say why it's ignored.
+            print(f"{parser.prog}: {e}, analysing in process", file=sys.stderr)
+    if client is None:
+        sys.exit(run_local(args, batch, index))
+    with client:
+        sys.exit(run_client(client, args, batch, index))
+
+
+if __name__ == "__main__":
+    main()
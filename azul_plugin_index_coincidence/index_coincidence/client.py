@@ -0,0 +1,113 @@
+"""Send analysis requests to a daemon over a Unix domain socket, see daemon.py.
+
+Only the standard library is imported, so a command-line client starts quickly and leaves the work to the daemon.
+"""
+
+import json
+import os
+import socket
+import stat
+import struct
+import tempfile
+
+# Environment variable giving the socket path, which otherwise lives in the user's runtime directory.
+SOCKET_ENV = "INDEX_COINCIDENCE_SOCKET"
+
+
+def default_socket_path():
+    """Return the socket path clients and the daemon use unless given another."""
+    if os.environ.get(SOCKET_ENV):
+        return os.environ[SOCKET_ENV]
+    if os.environ.get("XDG_RUNTIME_DIR"):
+        return os.path.join(os.environ["XDG_RUNTIME_DIR"], f"index-coincidence-{os.getuid()}.sock")
+    return os.path.join(private_directory(), "index-coincidence.sock")
+
+
+def private_directory():
+    """Return a directory in the temporary directory only this user may enter, creating it if needed.
+
+    Anyone may create files in the temporary directory, so one already there is used only if this user owns it
+    and nobody else has access, otherwise PermissionError is raised.
+    """
+    path = os.path.join(tempfile.gettempdir(), f"index-coincidence-{os.getuid()}")
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    # Not following links, so a link planted in place of the directory is refused.
+    status = os.lstat(path)
+    if not stat.S_ISDIR(status.st_mode) or status.st_uid != os.getuid() or status.st_mode & 0o077:
+        raise PermissionError(f"{path} isn't a directory private to this user")
+    return path
+
+
+def peer_uid(sock):
+    """Return the user id of the process at the other end of a connected Unix domain socket."""
+    if hasattr(socket, "SO_PEERCRED"):
+        credentials = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+        _pid, uid, _gid = struct.unpack("3i", credentials)
+        return uid
+    # Without peer credentials, the owner of the socket file is the user that bound it.
+    return os.stat(sock.getpeername()).st_uid
+
+
+class Client:
+    """Connection to a daemon, sending one request at a time and returning each record."""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.reader = sock.makefile("rb")
+
+    def analyse_file(self, path, maximum_width=None, sampling_size=None):
+        """Return the daemon's record for the file at path, which is made absolute for the daemon.
+
+        The daemon scores widths up to maximum_width, or its default if None.
+        """
+        return self._request({"path": os.path.abspath(path)}, maximum_width, sampling_size)
+
+    def analyse_buffer(self, data, maximum_width=None, sampling_size=None):
+        """Return the daemon's record for a buffer, which is sent to it."""
+        return self._request({"size": len(data)}, maximum_width, sampling_size, data)
+
+    def _request(self, request, maximum_width, sampling_size, data=b""):
+        if maximum_width is not None:
+            request["maximum_width"] = maximum_width
+        request["sampling_size"] = sampling_size
+        self.sock.sendall(json.dumps(request).encode() + b"\n")
+        if data:
+            self.sock.sendall(data)
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError("daemon closed the connection")
+        return json.loads(line)
+
+    def close(self):
+        """Close the connection."""
+        self.reader.close()
+        self.sock.close()
+
+    def __enter__(self):
+        """Return the client, to be closed when the block exits."""
+        return self
+
+    def __exit__(self, *exc_info):
+        """Close the connection."""
+        self.close()
+
+
+def connect(path=None):
+    """Return a Client connected to the daemon at path or the default socket, or None if none is running.
+
+    PermissionError is raised if the daemon is run by another user, who could otherwise forge its results.
+    """
+    path = path or default_socket_path()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+    if peer_uid(sock) != os.getuid():
+        sock.close()
+        raise PermissionError(f"the daemon listening on {path} is run by another user")
+    return Client(sock)
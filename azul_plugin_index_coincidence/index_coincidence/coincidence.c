@@ -0,0 +1,629 @@
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+
+#include <math.h>
+#include <stdint.h>
+#include <string.h>
+
+// positions are scored a block at a time so the block and its shifted
+// counterpart stay in cache while every width is evaluated against it
+#define BLOCK_SIZE 16384
+
+// byte sized match counters are summed before they can overflow, keeping the
+// counting loop in a form compilers turn into vector compares
+#define LANES 16
+#define LANE_RUN (LANES * 255)
+
+// the entropy gate counts bytes this far ahead of the match counting, so
+// buffers that fail the gate early are never scored
+#define LOOKAHEAD (1 << 20)
+
+#define LOW_SEVEN_BITS 0x7F7F7F7F7F7F7F7FULL
+
+static inline uint64_t load_word(const unsigned char *p)
+{
+    uint64_t word;
+
+    // memcpy keeps unaligned loads well defined, compilers emit a single mov
+    memcpy(&word, p, sizeof(word));
+    return word;
+}
+
+static inline unsigned int popcount_word(uint64_t word)
+{
+#if defined(__GNUC__) || defined(__clang__)
+    return (unsigned int)__builtin_popcountll(word);
+#else
+    word = word - ((word >> 1) & 0x5555555555555555ULL);
+    word = (word & 0x3333333333333333ULL) + ((word >> 2) & 0x3333333333333333ULL);
+    word = (word + (word >> 4)) & 0x0F0F0F0F0F0F0F0FULL;
+    return (unsigned int)((word * 0x0101010101010101ULL) >> 56);
+#endif
+}
+
+static inline unsigned int zero_bytes(uint64_t word)
+{
+    uint64_t t;
+
+    // the high bit of each byte is set if any of its low seven bits are set,
+    // or'ing in the word itself catches bytes with only the high bit set
+    t = (word & LOW_SEVEN_BITS) + LOW_SEVEN_BITS;
+    t = ~(t | word | LOW_SEVEN_BITS);
+    return popcount_word(t);
+}
+
+// count positions i in [start, stop) where b[i] == b[i + width]
+// caller guarantees stop + width <= length of b
+static size_t count_matches(const unsigned char *b, size_t start, size_t stop,
+                            size_t width)
+{
+    const unsigned char *shifted = b + width;
+    unsigned char lanes[LANES];
+    size_t total = 0;
+    size_t i = start;
+    size_t j;
+    size_t k;
+
+    // each lane counts at most 255 matches before it is emptied
+    for (; i + LANE_RUN <= stop; i += LANE_RUN) {
+        memset(lanes, 0, sizeof(lanes));
+        for (j = 0; j < LANE_RUN; j += LANES) {
+            for (k = 0; k < LANES; k++) {
+                lanes[k] += b[i + j + k] == shifted[i + j + k];
+            }
+        }
+        for (k = 0; k < LANES; k++) {
+            total += lanes[k];
+        }
+    }
+
+    // equal bytes xor to zero, so count the zero bytes a word at a time
+    for (; i + sizeof(uint64_t) <= stop; i += sizeof(uint64_t)) {
+        total += zero_bytes(load_word(&b[i]) ^ load_word(&shifted[i]));
+    }
+    for (; i < stop; i++) {
+        total += b[i] == shifted[i];
+    }
+
+    return total;
+}
+
+// accumulate match counts for widths min_width..max_width into counts,
+// only pairs whose first position is in [start, stop) are counted
+static void width_matches(const unsigned char *b, size_t sz, size_t start,
+                          size_t stop, size_t min_width, size_t max_width,
+                          size_t *counts)
+{
+    size_t block_start;
+    size_t block_stop;
+    size_t pair_stop;
+    size_t width;
+
+    for (block_start = start; block_start < stop; block_start += BLOCK_SIZE) {
+        block_stop = stop - block_start < BLOCK_SIZE ? stop : block_start + BLOCK_SIZE;
+        for (width = min_width; width <= max_width; width++) {
+            // pairs must have both positions inside the buffer
+            pair_stop = sz - width < block_stop ? sz - width : block_stop;
+            if (pair_stop <= block_start) {
+                break;
+            }
+            counts[width - min_width] += count_matches(b, block_start, pair_stop, width);
+        }
+    }
+}
+
+static PyObject *py_width_matches(PyObject *self, PyObject *args, PyObject *kwds)
+{
+    static char *kwlist[] = {"buf", "maximum_width", "start", "stop",
+                             "minimum_width", NULL};
+
+    Py_buffer view;
+    Py_ssize_t max_width;
+    Py_ssize_t start = 0;
+    Py_ssize_t stop = -1;
+    Py_ssize_t min_width = 1;
+    Py_ssize_t n_widths;
+    PyObject *matches;
+    PyObject *py_count;
+    size_t *counts;
+    Py_ssize_t i;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "y*n|nnn", kwlist,
+                                     &view, &max_width, &start, &stop,
+                                     &min_width)) {
+        return NULL;
+    }
+
+    // widths stop once they reach the length of the data
+    if (min_width < 1) {
+        min_width = 1;
+    }
+    if (max_width >= view.len) {
+        max_width = view.len - 1;
+    }
+    n_widths = max_width >= min_width ? max_width - min_width + 1 : 0;
+
+    // positions are clamped to the buffer, a negative stop means the end
+    if (stop < 0 || stop > view.len) {
+        stop = view.len;
+    }
+    if (start < 0) {
+        start = 0;
+    }
+    if (start > stop) {
+        start = stop;
+    }
+
+    counts = PyMem_Calloc(n_widths ? (size_t)n_widths : 1, sizeof(size_t));
+    if (!counts) {
+        PyBuffer_Release(&view);
+        return PyErr_NoMemory();
+    }
+
+    // the buffer is held by view, so the scan can run without the GIL
+    if (n_widths) {
+        Py_BEGIN_ALLOW_THREADS
+        width_matches(view.buf, (size_t)view.len, (size_t)start, (size_t)stop,
+                      (size_t)min_width, (size_t)max_width, counts);
+        Py_END_ALLOW_THREADS
+    }
+    PyBuffer_Release(&view);
+
+    // build the python list of match counts, index 0 is min_width
+    matches = PyList_New(n_widths);
+    if (!matches) {
+        PyMem_Free(counts);
+        return NULL;
+    }
+    for (i = 0; i < n_widths; i++) {
+        py_count = PyLong_FromSize_t(counts[i]);
+        if (!py_count) {
+            Py_DECREF(matches);
+            PyMem_Free(counts);
+            return NULL;
+        }
+        PyList_SET_ITEM(matches, i, py_count);
+    }
+
+    PyMem_Free(counts);
+    return matches;
+}
+
+// byte transforms scored by transform_width_matches, numbered in the order
+// of TRANSFORMS in transform.py
+enum {
+    TRANSFORM_SUB_DELTA,    // b[i + 1] - b[i]
+    TRANSFORM_XOR_DELTA,    // b[i + 1] ^ b[i]
+    TRANSFORM_ADD_SUM,      // b[0] + ... + b[i]
+    TRANSFORM_XOR_SUM,      // b[0] ^ ... ^ b[i]
+    TRANSFORM_COUNT
+};
+
+// number of positions in the transform of sz bytes
+static size_t transform_length(int transform, size_t sz)
+{
+    if (transform == TRANSFORM_SUB_DELTA || transform == TRANSFORM_XOR_DELTA) {
+        return sz ? sz - 1 : 0;
+    }
+    return sz;
+}
+
+// write positions [start, stop) of the transform of b into out. running sums
+// start again from the first byte at start, which leaves the difference
+// between any two sums, and so whether they match, unchanged
+static void transform_block(int transform, const unsigned char *b,
+                            size_t start, size_t stop, unsigned char *out)
+{
+    size_t n = stop - start;
+    unsigned char sum;
+    size_t i;
+
+    b += start;
+    switch (transform) {
+    case TRANSFORM_SUB_DELTA:
+        for (i = 0; i < n; i++) {
+            out[i] = (unsigned char)(b[i + 1] - b[i]);
+        }
+        break;
+    case TRANSFORM_XOR_DELTA:
+        for (i = 0; i < n; i++) {
+            out[i] = b[i + 1] ^ b[i];
+        }
+        break;
+    case TRANSFORM_ADD_SUM:
+        for (i = 0, sum = 0; i < n; i++) {
+            sum = (unsigned char)(sum + b[i]);
+            out[i] = sum;
+        }
+        break;
+    case TRANSFORM_XOR_SUM:
+        for (i = 0, sum = 0; i < n; i++) {
+            sum ^= b[i];
+            out[i] = sum;
+        }
+        break;
+    }
+}
+
+// accumulate match counts for widths 1..max_width of each transform into
+// counts, max_width per transform, for pairs whose first position is in
+// [start, stop). each block of the buffer is transformed into scratch, which
+// holds BLOCK_SIZE + max_width bytes, while the block is still in cache
+static void transform_matches(const unsigned char *b, size_t sz, size_t start,
+                              size_t stop, size_t max_width,
+                              const int *transforms, size_t n_transforms,
+                              unsigned char *scratch, size_t *counts)
+{
+    size_t block_start;
+    size_t block_stop;
+    size_t span_stop;
+    size_t pair_stop;
+    size_t length;
+    size_t width;
+    size_t t;
+
+    for (block_start = start; block_start < stop; block_start += BLOCK_SIZE) {
+        for (t = 0; t < n_transforms; t++) {
+            length = transform_length(transforms[t], sz);
+            block_stop = stop - block_start < BLOCK_SIZE ? stop : block_start + BLOCK_SIZE;
+            if (block_stop > length) {
+                block_stop = length;
+            }
+            if (block_stop <= block_start) {
+                continue;
+            }
+            // the block's pairs reach up to max_width positions past it
+            span_stop = length - block_stop < max_width ? length : block_stop + max_width;
+            transform_block(transforms[t], b, block_start, span_stop, scratch);
+
+            for (width = 1; width <= max_width && width < length; width++) {
+                pair_stop = length - width < block_stop ? length - width : block_stop;
+                if (pair_stop <= block_start) {
+                    break;
+                }
+                counts[t * max_width + width - 1] +=
+                    count_matches(scratch, 0, pair_stop - block_start, width);
+            }
+        }
+    }
+}
+
+static PyObject *py_transform_width_matches(PyObject *self, PyObject *args,
+                                            PyObject *kwds)
+{
+    static char *kwlist[] = {"buf", "maximum_width", "transforms", "start",
+                             "stop", NULL};
+
+    Py_buffer view;
+    Py_ssize_t max_width;
+    PyObject *py_transforms;
+    PyObject *sequence = NULL;
+    Py_ssize_t start = 0;
+    Py_ssize_t stop = -1;
+    Py_ssize_t n_transforms;
+    size_t n_counts;
+    int transforms[TRANSFORM_COUNT];
+    unsigned char *scratch = NULL;
+    size_t *counts = NULL;
+    PyObject *result = NULL;
+    PyObject *matches;
+    PyObject *py_count;
+    long transform;
+    Py_ssize_t i;
+    Py_ssize_t j;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "y*nO|nn", kwlist,
+                                     &view, &max_width, &py_transforms,
+                                     &start, &stop)) {
+        return NULL;
+    }
+
+    sequence = PySequence_Fast(py_transforms, "transforms must be a sequence");
+    if (!sequence) {
+        goto done;
+    }
+    n_transforms = PySequence_Fast_GET_SIZE(sequence);
+    if (n_transforms > TRANSFORM_COUNT) {
+        PyErr_SetString(PyExc_ValueError, "too many transforms");
+        goto done;
+    }
+    for (i = 0; i < n_transforms; i++) {
+        transform = PyLong_AsLong(PySequence_Fast_GET_ITEM(sequence, i));
+        if (transform == -1 && PyErr_Occurred()) {
+            goto done;
+        }
+        if (transform < 0 || transform >= TRANSFORM_COUNT) {
+            PyErr_Format(PyExc_ValueError, "unknown transform %ld", transform);
+            goto done;
+        }
+        transforms[i] = (int)transform;
+    }
+
+    // widths stop once they reach the length of the data
+    if (max_width >= view.len) {
+        max_width = view.len - 1;
+    }
+    if (max_width < 0) {
+        max_width = 0;
+    }
+
+    // positions are clamped to the buffer, a negative stop means the end
+    if (stop < 0 || stop > view.len) {
+        stop = view.len;
+    }
+    if (start < 0) {
+        start = 0;
+    }
+    if (start > stop) {
+        start = stop;
+    }
+
+    n_counts = (size_t)n_transforms * (size_t)max_width;
+    counts = PyMem_Calloc(n_counts ? n_counts : 1, sizeof(size_t));
+    scratch = PyMem_Malloc(BLOCK_SIZE + (size_t)max_width);
+    if (!counts || !scratch) {
+        PyErr_NoMemory();
+        goto done;
+    }
+
+    // the buffer is held by view, so the scan can run without the GIL
+    if (n_transforms && max_width) {
+        Py_BEGIN_ALLOW_THREADS
+        transform_matches(view.buf, (size_t)view.len, (size_t)start, (size_t)stop,
+                          (size_t)max_width, transforms, (size_t)n_transforms,
+                          scratch, counts);
+        Py_END_ALLOW_THREADS
+    }
+
+    // a list of match counts for each transform, index 0 is width 1
+    result = PyList_New(n_transforms);
+    if (!result) {
+        goto done;
+    }
+    for (i = 0; i < n_transforms; i++) {
+        matches = PyList_New(max_width);
+        if (!matches) {
+            Py_CLEAR(result);
+            goto done;
+        }
+        PyList_SET_ITEM(result, i, matches);
+        for (j = 0; j < max_width; j++) {
+            py_count = PyLong_FromSize_t(counts[i * max_width + j]);
+            if (!py_count) {
+                Py_CLEAR(result);
+                goto done;
+            }
+            PyList_SET_ITEM(matches, j, py_count);
+        }
+    }
+
+done:
+    Py_XDECREF(sequence);
+    PyMem_Free(scratch);
+    PyMem_Free(counts);
+    PyBuffer_Release(&view);
+    return result;
+}
+
+// shannon entropy of the first sz bytes counted in histogram
+static double histogram_entropy(const size_t *histogram, size_t sz)
+{
+    double answer = 0.0;
+    double pr;
+    int i;
+
+    for (i = 0; i < 256; i++) {
+        if (histogram[i]) {
+            pr = histogram[i] / (double)sz;
+            answer -= pr * log2(pr);
+        }
+    }
+    return answer;
+}
+
+// upper bound on the entropy of sz bytes, given the histogram of the first
+// counted of them. the rest could be anything, so treat them as an 8 bit
+// source mixed in with the counted bytes
+static double entropy_bound(const size_t *histogram, size_t counted, size_t sz)
+{
+    double seen;
+    double mixing = 0.0;
+
+    if (counted == sz) {
+        return histogram_entropy(histogram, sz);
+    }
+    seen = counted / (double)sz;
+    if (counted) {
+        mixing = -seen * log2(seen) - (1.0 - seen) * log2(1.0 - seen);
+    }
+    return seen * histogram_entropy(histogram, counted) + (1.0 - seen) * 8.0 + mixing;
+}
+
+// count the byte histogram and the matches for widths 1..max_width in one
+// pass, return 0 as soon as the entropy is known to be below min_entropy
+static int entropy_scan(const unsigned char *b, size_t sz, size_t max_width,
+                        double min_entropy, size_t *histogram, size_t *counts,
+                        double *ent)
+{
+    size_t counted = 0;
+    size_t matched = 0;
+    size_t limit;
+    size_t stop;
+    size_t i;
+
+    while (counted < sz) {
+        // keep the histogram ahead of the matching, checking the gate per block
+        limit = sz - matched < LOOKAHEAD ? sz : matched + LOOKAHEAD;
+        while (counted < limit) {
+            stop = sz - counted < BLOCK_SIZE ? sz : counted + BLOCK_SIZE;
+            for (i = counted; i < stop; i++) {
+                histogram[b[i]]++;
+            }
+            counted = stop;
+
+            *ent = entropy_bound(histogram, counted, sz);
+            if (*ent < min_entropy) {
+                return 0;
+            }
+        }
+
+        // score the block while it is still in cache from being counted
+        stop = sz - matched < BLOCK_SIZE ? sz : matched + BLOCK_SIZE;
+        width_matches(b, sz, matched, stop, 1, max_width, counts);
+        matched = stop;
+    }
+    if (matched < sz) {
+        width_matches(b, sz, matched, sz, 1, max_width, counts);
+    }
+
+    *ent = histogram_entropy(histogram, sz);
+    return *ent >= min_entropy;
+}
+
+static PyObject *py_entropy_width_matches(PyObject *self, PyObject *args,
+                                          PyObject *kwds)
+{
+    static char *kwlist[] = {"buf", "maximum_width", "minimum_entropy", NULL};
+
+    Py_buffer view;
+    Py_ssize_t max_width;
+    double min_entropy;
+    double ent = 0.0;
+    int passed;
+    size_t histogram[256];
+    PyObject *py_histogram;
+    PyObject *matches;
+    PyObject *py_count;
+    size_t *counts;
+    Py_ssize_t i;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "y*nd", kwlist,
+                                     &view, &max_width, &min_entropy)) {
+        return NULL;
+    }
+
+    // widths stop once they reach the length of the data
+    if (max_width >= view.len) {
+        max_width = view.len - 1;
+    }
+    if (max_width < 0) {
+        max_width = 0;
+    }
+
+    counts = PyMem_Calloc(max_width ? (size_t)max_width : 1, sizeof(size_t));
+    if (!counts) {
+        PyBuffer_Release(&view);
+        return PyErr_NoMemory();
+    }
+    memset(histogram, 0, sizeof(histogram));
+
+    Py_BEGIN_ALLOW_THREADS
+    passed = entropy_scan(view.buf, (size_t)view.len, (size_t)max_width,
+                          min_entropy, histogram, counts, &ent);
+    Py_END_ALLOW_THREADS
+
+    if (!passed) {
+        PyBuffer_Release(&view);
+        PyMem_Free(counts);
+        return Py_BuildValue("(dOO)", ent, Py_None, Py_None);
+    }
+
+    PyBuffer_Release(&view);
+
+    // the histogram is returned so callers needn't count the bytes again
+    py_histogram = PyList_New(256);
+    if (!py_histogram) {
+        PyMem_Free(counts);
+        return NULL;
+    }
+    for (i = 0; i < 256; i++) {
+        py_count = PyLong_FromSize_t(histogram[i]);
+        if (!py_count) {
+            Py_DECREF(py_histogram);
+            PyMem_Free(counts);
+            return NULL;
+        }
+        PyList_SET_ITEM(py_histogram, i, py_count);
+    }
+
+    // build the python list of match counts, index 0 is width 1
+    matches = PyList_New(max_width);
+    if (!matches) {
+        Py_DECREF(py_histogram);
+        PyMem_Free(counts);
+        return NULL;
+    }
+    for (i = 0; i < max_width; i++) {
+        py_count = PyLong_FromSize_t(counts[i]);
+        if (!py_count) {
+            Py_DECREF(py_histogram);
+            Py_DECREF(matches);
+            PyMem_Free(counts);
+            return NULL;
+        }
+        PyList_SET_ITEM(matches, i, py_count);
+    }
+    PyMem_Free(counts);
+
+    return Py_BuildValue("(dNN)", ent, py_histogram, matches);
+}
+
+PyDoc_STRVAR(module_doc,
+    "Coincidence\n"
+    "\n"
+    "Counts matching bytes between a buffer and shifted copies of itself\n");
+
+PyDoc_STRVAR(width_matches_doc,
+    "width_matches(buf, maximum_width, start=0, stop=-1, minimum_width=1)\n"
+    "\n"
+    "Return a list of the number of positions i where buf[i] == buf[i + width],\n"
+    "for each width from minimum_width up to maximum_width or the length of buf.\n"
+    "Only positions i from start up to stop are counted, a negative stop is the\n"
+    "end of buf.");
+
+PyDoc_STRVAR(entropy_width_matches_doc,
+    "entropy_width_matches(buf, maximum_width, minimum_entropy)\n"
+    "\n"
+    "Calculate the shannon entropy and the width_matches counts of buf in a\n"
+    "single pass. Return a tuple of (entropy, histogram, matches), where\n"
+    "histogram is a list of the number of times each byte value occurs in buf.\n"
+    "If the entropy is below minimum_entropy the scan stops as\n"
+    "soon as that is certain, and (bound, None, None) is returned, where bound is\n"
+    "an upper bound on the entropy that is below minimum_entropy.");
+
+PyDoc_STRVAR(transform_width_matches_doc,
+    "transform_width_matches(buf, maximum_width, transforms, start=0, stop=-1)\n"
+    "\n"
+    "Return a list of width_matches counts for each transform of buf, numbered\n"
+    "sub_delta (0), xor_delta (1), add_sum (2) and xor_sum (3), for widths up\n"
+    "to maximum_width, all counted in a single pass without copying the\n"
+    "transformed buffer. Delta transforms are one position shorter than buf,\n"
+    "and their counts for widths reaching that length are zero. Only positions\n"
+    "i of the transform from start up to stop are counted.");
+
+static PyMethodDef coincidence_methods[] = {
+    {"entropy_width_matches", (PyCFunction)py_entropy_width_matches,
+     METH_VARARGS | METH_KEYWORDS, entropy_width_matches_doc},
+    {"transform_width_matches", (PyCFunction)py_transform_width_matches,
+     METH_VARARGS | METH_KEYWORDS, transform_width_matches_doc},
+    {"width_matches", (PyCFunction)py_width_matches,
+     METH_VARARGS | METH_KEYWORDS, width_matches_doc},
+    {NULL, NULL, 0, NULL}
+};
+
+static struct PyModuleDef moduledef = {
+    PyModuleDef_HEAD_INIT,
+    "_coincidence",
+    module_doc,
+    0,
+    coincidence_methods,
+    NULL,
+    NULL,
+    NULL,
+    NULL
+};
+
+PyMODINIT_FUNC PyInit__coincidence(void)
+{
+    return PyModule_Create(&moduledef);
+}
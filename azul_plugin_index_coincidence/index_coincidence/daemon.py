@@ -0,0 +1,95 @@
+"""Serve analyses from a warm pool of processes over a Unix domain socket.
+
+Starting a process and loading the extensions for every small file costs more than analysing it, so a daemon
+keeps a pool of processes ready and answers requests over a socket. Each request is a line of JSON holding
+either the path of a file to analyse, or the size of a buffer whose raw bytes follow the line. Each response
+is a line of JSON with the same record as a batch analysis, see analyse_file. Send requests with client.py.
+"""
+
+import contextlib
+import errno
+import json
+import multiprocessing
+import os
+import signal
+import socketserver
+
+from .batch import analyse_buffer, analyse_file
+from .client import connect, default_socket_path
+from .main import MAXIMUM_WIDTH
+
+
+def _init_worker():
+    """Leave interrupting and terminating to the daemon, which stops its workers itself."""
+    # Signals sent to the whole process group would otherwise kill workers while they hold the pool's locks.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """Answer each request on a connection in turn, until the client closes it."""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                options = (request.get("maximum_width", MAXIMUM_WIDTH), request.get("sampling_size"))
+                if "path" in request:
+                    record = self.server.pool.apply(analyse_file, (request["path"], *options))
+                else:
+                    data = self.rfile.read(request["size"])
+                    if len(data) < request["size"]:
+                        return
+                    record = self.server.pool.apply(analyse_buffer, (data, *options))
+            except (ValueError, KeyError, TypeError) as e:
+                # The connection can't be trusted to be in step after a bad request.
+                self.wfile.write(json.dumps({"error": f"bad request: {e}"}).encode() + b"\n")
+                return
+            self.wfile.write(json.dumps(record).encode() + b"\n")
+
+
+class AnalysisServer(socketserver.ThreadingUnixStreamServer):
+    """Listen on a Unix domain socket at path, analysing requests across a pool of processes.
+
+    Connections are handled on their own threads, so requests from several clients share the pool.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path, processes=None):
+        client = connect(path)
+        if client is not None:
+            client.close()
+            raise OSError(errno.EADDRINUSE, "a daemon is already listening", path)
+        # A socket left behind by a daemon that didn't shut down cleanly would stop this one binding.
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(path)
+        super().__init__(path, _Handler)
+        self.path = path
+        self.pool = multiprocessing.Pool(processes or None, _init_worker)
+
+    def server_bind(self):
+        """Bind the socket so that only this user may connect to it."""
+        # Requests name files to read with the daemon's permissions.
+        umask = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(umask)
+
+    def server_close(self):
+        """Stop listening, remove the socket and stop the pool once it finishes any analyses in progress."""
+        super().server_close()
+        self.pool.close()
+        self.pool.join()
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.path)
+
+
+def serve(path=None, processes=None):
+    """Run a daemon on the socket at path, or the default socket, until interrupted or terminated."""
+    # Terminating interrupts serving too, so the socket is removed either way.
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    with AnalysisServer(path or default_socket_path(), processes) as server:
+        with contextlib.suppress(KeyboardInterrupt):
+            server.serve_forever()
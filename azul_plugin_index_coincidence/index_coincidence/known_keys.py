@@ -0,0 +1,137 @@
+"""Test known XOR keys against data in one pass, by searching for plaintext markers encoded with each of them.
+
+Every marker is encoded with every key, starting at every offset into the key, as the key may start anywhere
+before the marker. The first PREFIX_SIZE bytes of each encoded marker go in a sorted table, and every window of
+PREFIX_SIZE bytes in the data is looked up in it at once with NumPy, so the cost barely depends on the number of
+keys. Windows found in the table are then compared with the whole encoded marker.
+"""
+
+from typing import NamedTuple
+
+import numpy as np
+
+from .stream import CHUNK_SIZE
+from .xor import xor_bytes
+
+# Bytes of each encoded marker looked up in the table, as one little-endian 64 bit integer.
+PREFIX_SIZE = 8
+
+# Low bits of each prefix marked in a filter, so that the few windows with a marked value are all
+# that need looking up in the table. Four MiB of filter passes about one window in a hundred for 32,000 prefixes.
+FILTER_BITS = 22
+
+# Plaintext markers by name, and whether they're only looked for at the start of the data.
+# Short headers are only looked for at the start, taken with the fixed bytes that usually follow them
+# so they're unlikely to match other content by chance. Markers found anywhere must be at least PREFIX_SIZE bytes.
+MARKERS = {
+    "MZ": (b"MZ\x90\x00\x03\x00\x00\x00", True),
+    "PK": (b"PK\x03\x04", True),
+    "ELF": (b"\x7fELF", True),
+    "PDF": (b"%PDF-1.", True),
+    "DOS stub": (b"This program cannot be run in DOS mode", False),
+    "Win32 stub": (b"This program must be run under Win32", False),
+}
+
+
+class KnownKeyMatch(NamedTuple):
+    """A key found encoding a marker in the data, with the offset of the encoded marker."""
+
+    key: bytes
+    marker: str
+    offset: int
+
+
+class KeyScanner:
+    """Find which of a list of keys encodes a marker in data, see scan.
+
+    Keys can be added while other threads scan, and are found by scans starting after they were added.
+    """
+
+    def __init__(self, keys=(), markers=MARKERS):
+        # Markers at the start of the data are compared directly, with the key starting at the data.
+        self.anchored = [(name, marker) for name, (marker, anchored) in markers.items() if anchored]
+        self.floating = [(name, marker) for name, (marker, anchored) in markers.items() if not anchored]
+        if any(len(marker) < PREFIX_SIZE for _, marker in self.floating):
+            raise ValueError(f"markers found anywhere must be at least {PREFIX_SIZE} bytes")
+        self.longest = max((len(marker) for _, marker in self.floating), default=PREFIX_SIZE)
+
+        self.keys = []
+        # Anchored markers encoded with each key, as (key index, marker name, encoded marker).
+        self.headers = []
+        # Markers by the prefix they encode to, as (key index, marker name, marker, phase into the key).
+        self.patterns = {}
+        prefixes = [prefix for key in keys for prefix in self._add_patterns(key)]
+        self.prefixes = np.unique(np.array(prefixes, dtype=np.uint64))
+        self.filter = np.zeros(1 << FILTER_BITS, dtype=bool)
+        self.filter[self.prefixes & np.uint64((1 << FILTER_BITS) - 1)] = True
+
+    def add(self, key):
+        """Add key to those scanned for, without building the scanner again."""
+        prefixes = np.unique(np.array(self._add_patterns(key), dtype=np.uint64))
+        # The filter is marked before the table is replaced, so a scan never finds a prefix the filter drops.
+        self.filter[prefixes & np.uint64((1 << FILTER_BITS) - 1)] = True
+        # New prefixes are inserted in place, rather than sorting the whole table again.
+        slots = np.searchsorted(self.prefixes, prefixes)
+        new = np.ones(len(prefixes), dtype=bool)
+        if len(self.prefixes):
+            new = self.prefixes[np.minimum(slots, len(self.prefixes) - 1)] != prefixes
+        self.prefixes = np.insert(self.prefixes, slots[new], prefixes[new])
+
+    def _add_patterns(self, key):
+        """Add the markers encoded with key to the patterns, and return the prefixes they encode to."""
+        if not key:
+            return []
+        key_index = len(self.keys)
+        self.keys.append(key)
+        prefixes = []
+        for name, marker in self.floating:
+            # The key repeated for as long as a prefix starting at any phase needs.
+            stream = np.resize(np.frombuffer(key, dtype=np.uint8), len(key) + PREFIX_SIZE - 1)
+            windows = np.lib.stride_tricks.sliding_window_view(stream, PREFIX_SIZE)
+            plain = np.frombuffer(marker[:PREFIX_SIZE], dtype=np.uint8)
+            encoded = np.ascontiguousarray(windows ^ plain).view("<u8").ravel().tolist()
+            for phase, prefix in enumerate(encoded):
+                self.patterns.setdefault(prefix, []).append((key_index, name, marker, phase))
+            prefixes += encoded
+        self.headers += [(key_index, name, xor_bytes(marker, key)) for name, marker in self.anchored]
+        return prefixes
+
+    def scan(self, data, chunk_size=CHUNK_SIZE):
+        """Return a KnownKeyMatch for each key encoding a marker in data, with the first marker found for it.
+
+        Data is searched chunk_size bytes at a time, so the working memory doesn't grow with the data.
+        """
+        found = {}
+        with memoryview(data) as view:
+            for key_index, name, header in self.headers:
+                if len(view) >= len(header) and view[: len(header)] == header:
+                    found.setdefault(key_index, KnownKeyMatch(self.keys[key_index], name, 0))
+
+            if len(self.prefixes):
+                # Chunks overlap by enough to find a marker starting anywhere in the chunk.
+                for start in range(0, len(view), chunk_size):
+                    with view[start : start + chunk_size + self.longest - 1] as segment:
+                        for offset, key_index, name in self._scan_segment(segment, chunk_size):
+                            match = found.get(key_index)
+                            if match is None or start + offset < match.offset:
+                                found[key_index] = KnownKeyMatch(self.keys[key_index], name, start + offset)
+        return sorted(found.values(), key=lambda match: (match.offset, match.key))
+
+    def _scan_segment(self, segment, limit):
+        """Yield (offset, key index, marker name) for each encoded marker starting before limit in segment."""
+        # The table is taken once, as keys added meanwhile replace it.
+        prefixes = self.prefixes
+        # Windows starting at each shift, then every PREFIX_SIZE bytes, are read in place as integers.
+        for shift in range(min(PREFIX_SIZE, len(segment) - PREFIX_SIZE + 1)):
+            windows = np.frombuffer(segment, dtype="<u8", count=(len(segment) - shift) // PREFIX_SIZE, offset=shift)
+            indices = np.flatnonzero(self.filter[windows & np.uint64((1 << FILTER_BITS) - 1)])
+            candidates = windows[indices]
+            slots = np.minimum(np.searchsorted(prefixes, candidates), len(prefixes) - 1)
+            hits = prefixes[slots] == candidates
+            for index, prefix in zip(indices[hits].tolist(), candidates[hits].tolist(), strict=True):
+                offset = shift + index * PREFIX_SIZE
+                if offset >= limit:
+                    continue
+                for key_index, name, marker, phase in self.patterns[prefix]:
+                    if segment[offset : offset + len(marker)] == xor_bytes(marker, self.keys[key_index], phase):
+                        yield offset, key_index, name
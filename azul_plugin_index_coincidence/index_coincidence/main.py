@@ -1,6 +1,20 @@
-"""Index of coincidence analysis library and command-line."""
+"""Index of coincidence analysis library, with its command-line in cli.py."""
 
-import argparse
+import itertools
+import math
+import time
+from typing import NamedTuple
+
+import numpy as np
+from _coincidence import entropy_width_matches
+
+from ..metrics import count, stage
+from .autocorrelation import autocorrelation_matches, estimate_cost
+from .parallel import available_workers, match_scores, parallel_width_matches, resolve_workers, split_ranges
+from .sampling import SAMPLE_SIZE, estimate_width_scores
+from .stream import CHUNK_SIZE, stream_width_matches
+from .transform import TRANSFORMS, TransformWidth, transform_width_scores
+from .xor import PLAINTEXT_BYTE, recover_keys
 
 # Index of coincidence must increase by at least this factor in order to be a possible key width.
 # Factors will likely be quite large, often a factor of 20 or more.
@@ -15,108 +29,466 @@ SIGNIFICANT_SCORE_RATIO = 0.333333333
 # Maximum width size for computing index of coincidence
 MAXIMUM_WIDTH = 300
 
+# Scoring engines, which produce identical scores at different costs.
+# The direct engine scans the data once per width, so its cost grows with the width range.
+# The autocorrelation engine scores all widths at once, at a cost that barely depends on the width range.
+ENGINE_DIRECT = "direct"
+ENGINE_AUTOCORRELATION = "autocorrelation"
+ENGINES = (ENGINE_DIRECT, ENGINE_AUTOCORRELATION)
+
+# Approximate seconds for the direct engine to compare one pair of bytes.
+DIRECT_COST = 0.045e-9
+
+# Approximate seconds for the entropy gate to count one byte, when it isn't also counting width matches.
+GATE_COST = 1.2e-9
+
+# Adaptive scoring first estimates every width from a sample of this many positions,
+# then grows the sample by ADAPTIVE_GROWTH times each round for the widths still in contention.
+ADAPTIVE_SAMPLE_SIZE = 64 * 1024
+ADAPTIVE_GROWTH = 4
+
+# Under a time budget, every width is only scored exactly if that is expected to take at most this fraction
+# of the time left. Otherwise large data is scored from a sample, and smaller data a batch of
+# BUDGET_WIDTH_BATCH widths at a time, from width 1 up, until the time runs out.
+BUDGET_FRACTION = 0.5
+BUDGET_WIDTH_BATCH = 32
+
 
 def index_of_coincidence(d1, d2):
     """Return probability d1 and d2 share the same byte value at any position."""
     return sum(1 for i in range(len(d1)) if d1[i] == d2[i]) / len(d1)
 
 
-def compute_width_scores(data):
+def time_left(deadline):
+    """Return the seconds left before a time.monotonic() deadline, or infinity if there is no deadline."""
+    if deadline is None:
+        return math.inf
+    return deadline - time.monotonic()
+
+
+def scoring_cost(data, maximum_width=MAXIMUM_WIDTH, engine=ENGINE_DIRECT, histogram=None):
+    """Return the approximate seconds an engine takes to score widths up to maximum_width on the given data.
+
+    The byte histogram of the data is counted for the autocorrelation engine unless one is given.
+    """
+    if engine == ENGINE_AUTOCORRELATION:
+        if histogram is None:
+            histogram = np.bincount(np.frombuffer(data, dtype=np.uint8), minlength=256)
+        return estimate_cost(histogram, maximum_width)
+    return DIRECT_COST * len(data) * max(0, min(maximum_width, len(data) - 1))
+
+
+def choose_engine(data, maximum_width=MAXIMUM_WIDTH, histogram=None):
+    """Return the engine expected to score widths up to maximum_width on the given data fastest.
+
+    The byte histogram of the data is counted unless one is given.
+    """
+    if min(maximum_width, len(data) - 1) <= 0:
+        return ENGINE_DIRECT
+
+    if histogram is None:
+        histogram = np.bincount(np.frombuffer(data, dtype=np.uint8), minlength=256)
+    if scoring_cost(data, maximum_width, ENGINE_AUTOCORRELATION, histogram) < scoring_cost(data, maximum_width):
+        return ENGINE_AUTOCORRELATION
+    return ENGINE_DIRECT
+
+
+def compute_width_scores(data, maximum_width=MAXIMUM_WIDTH, engine=ENGINE_DIRECT, workers=1):
     """Compute the index of coincidence for the given data.
 
-    Key widths are tested up to MAXIMUM_WIDTH.
+    Key widths are tested up to maximum_width.
     Choose possible key widths based on the resulting scores.
+
+    Match counts come from the native width_matches kernel, which scans the
+    original buffer without slicing, or from autocorrelation_matches when the
+    autocorrelation engine is selected. Results are identical to scoring each
+    width with index_of_coincidence(data[:-width], data[width:]).
+
+    The direct engine splits large data between workers threads, where zero or None means every available CPU.
     """
-    # Compute the index of coincidence for a range of key widths.
+    # Count the positions where the data matches itself after shifting it
+    # along by each key width. Widths stop at the length of the data.
+    if engine == ENGINE_AUTOCORRELATION:
+        matches = autocorrelation_matches(data, maximum_width)
+    elif engine == ENGINE_DIRECT:
+        matches = parallel_width_matches(data, maximum_width, workers)
+    else:
+        raise ValueError(f"unknown scoring engine {engine!r}, expected one of {ENGINES}")
+
+    return match_scores(matches, len(data))
+
+
+class Analysis(NamedTuple):
+    """Results of scoring data for possible key widths."""
+
+    # Selected width/score tuples.
+    widths: list
+    # Index of coincidence of the data with itself shifted by one byte.
+    baseline: float
+    # Every scored width/score tuple.
+    scores: list
+    # Widths whose score was estimated from a sample rather than computed exactly.
+    estimated: frozenset = frozenset()
+    # Shannon entropy of the data, if it was computed.
+    entropy: float | None = None
+    # KeyRecovery for each selected width, if keys were recovered.
+    keys: tuple = ()
+    # TransformWidth for each width a transform of the data raises the index at, if transforms were scored.
+    transforms: tuple = ()
+    # Whether the time budget ran out before scoring finished, leaving widths unscored or scored from less data.
+    partial: bool = False
+
+
+def compute_budgeted_width_scores(data, maximum_width=MAXIMUM_WIDTH, workers=1, deadline=None):
+    """Compute exact index of coincidence scores a batch of widths at a time, from width 1 up.
+
+    Batches stop once the next is expected to finish after the time.monotonic() deadline,
+    though the first batch is always scored so there is a baseline.
+    Return the list of width/score tuples, which stops short of maximum_width if time ran out.
+    """
+    last = min(maximum_width, len(data) - 1)
     scores = []
-    for width in range(1, MAXIMUM_WIDTH + 1):
-        # Stop if the width grows to the length of the data.
-        if width >= len(data):
+    for first in range(1, last + 1, BUDGET_WIDTH_BATCH):
+        stop = min(first + BUDGET_WIDTH_BATCH - 1, last)
+        if scores and DIRECT_COST * len(data) * (stop - first + 1) > time_left(deadline):
             break
+        matches = parallel_width_matches(data, stop, workers, minimum_width=first)
+        scores.extend(match_scores(matches, len(data), first))
+    return scores
 
-        # Compute the index of coincidence of the data with itself after
-        # shifting it along by the current key width.
-        score = index_of_coincidence(data[:-width], data[width:])
-        scores.append((width, score))
 
-    return scores
+def compute_sampled_width_scores(data, maximum_width=MAXIMUM_WIDTH, sample_size=SAMPLE_SIZE, workers=1, deadline=None):
+    """Compute approximate index of coincidence scores from a sample of the data.
+
+    Every width is estimated from a stratified sample, then widths whose confidence interval
+    crosses the filter_width_scores threshold are scored exactly, so the same widths are chosen.
+    Exact rescoring stops once the time.monotonic() deadline passes, apart from the baseline.
+    Return the list of width/score tuples, and the set of widths whose score is still an estimate.
+    """
+    estimates = estimate_width_scores(data, maximum_width, sample_size)
+    scores = {width: score for width, score, _, _ in estimates}
+    highs = {width: high for width, _, _, high in estimates}
+    estimated = set(scores)
+
+    def rescore(width):
+        scores[width] = parallel_width_matches(data, width, workers, minimum_width=width)[0] / (len(data) - width)
+        estimated.discard(width)
+
+    # The baseline sets the threshold for every other width, so it is always exact.
+    if 1 in estimated:
+        rescore(1)
+
+    while estimated and time_left(deadline) > 0:
+        # The best score also sets the threshold once a third of it exceeds the other cutoffs,
+        # so score exactly any width that could still be the best in that case.
+        cutoff = max(MINIMUM_IMPROVEMENT_RATIO * scores[1], 1 / 256)
+        best_exact = max(scores[width] for width in scores if width not in estimated)
+        contender = max(estimated, key=highs.get)
+        if highs[contender] > best_exact and highs[contender] * SIGNIFICANT_SCORE_RATIO > cutoff:
+            rescore(contender)
+            continue
 
+        # Score exactly the widths that could fall on either side of the threshold.
+        threshold_score = width_score_threshold(sorted(scores.items()))
+        uncertain = [
+            width for width, _, low, high in estimates if width in estimated and low < threshold_score <= high
+        ]
+        if not uncertain:
+            break
+        for width in uncertain:
+            rescore(width)
 
-def filter_width_scores(scores):
-    """From a list of widths and scores, select the "valid" widths.
+    return sorted(scores.items()), estimated
 
-    Choose widths with an index of coincidence that is much higher than the index of coincidence of the baseline
-    (the file data as a whole), Exclude widths that are multiples of widths that have already been chosen.
+
+def compute_adaptive_width_scores(data, maximum_width=MAXIMUM_WIDTH, sample_size=ADAPTIVE_SAMPLE_SIZE, workers=1):
+    """Compute index of coincidence scores, scoring exactly only the widths that could be chosen.
+
+    Every width is estimated from a small sample, and widths that can no longer reach the filter_width_scores
+    threshold are dropped. The rest are estimated again from samples ADAPTIVE_GROWTH times larger, until each
+    is certain to pass the threshold or the sample nears the size of the data. Passing widths that aren't a
+    multiple of another are then scored exactly, so the same widths are chosen with the same scores.
+    Return the list of width/score tuples, and the set of widths whose score is still an estimate.
     """
+    length = len(data)
+    scores = {}
+    estimated = set()
+
+    def rescore(width):
+        scores[width] = parallel_width_matches(data, width, workers, minimum_width=width)[0] / (length - width)
+        estimated.discard(width)
+
+    # The baseline sets the threshold for every other width, so it is always exact.
+    rescore(1)
+    cutoff = max(MINIMUM_IMPROVEMENT_RATIO * scores[1], 1 / 256)
+    candidates = list(range(2, min(maximum_width, length - 1) + 1))
+    settled = False
+    while candidates:
+        estimates = estimate_width_scores(data, maximum_width, sample_size, widths=candidates)
+        for width, score, _, _ in estimates:
+            scores[width] = score
+            estimated.add(width)
+
+        # The threshold lies between the cutoffs set by the lowest and highest the best score could be.
+        floor = max(cutoff, SIGNIFICANT_SCORE_RATIO * max(low for _, _, low, _ in estimates))
+        ceiling = max(cutoff, SIGNIFICANT_SCORE_RATIO * max(high for _, _, _, high in estimates))
+        candidates = [width for width, _, _, high in estimates if high >= floor]
+        settled = all(low >= ceiling for width, _, low, _ in estimates if width in candidates)
+        if settled or sample_size * ADAPTIVE_GROWTH >= length:
+            break
+        sample_size *= ADAPTIVE_GROWTH
+
+    if settled:
+        # Every candidate passes whatever the best score is, so only the widths that will be chosen need
+        # exact scores, multiples of a smaller candidate are never chosen.
+        chosen = []
+        for width in candidates:
+            if not any(width % existing == 0 for existing in chosen):
+                chosen.append(width)
+        candidates = chosen
+    for width in candidates:
+        rescore(width)
+
+    return sorted(scores.items()), estimated
+
+
+def _score_array(scores):
+    """Return a list of (width, score) pairs as a two column array, or an array of them unchanged."""
+    if isinstance(scores, np.ndarray):
+        return scores
+    # Flattening the pairs is several times faster than having NumPy convert them one by one.
+    return np.fromiter(itertools.chain.from_iterable(scores), np.float64, 2 * len(scores)).reshape(-1, 2)
+
+
+def width_score_threshold(scores):
+    """Return the score a width must reach to be chosen from a list or array of widths and scores."""
+    scores = _score_array(scores)
     # Build a cutoff based on soame multiple of the width 1 score.
-    baseline = scores[0][1]
+    baseline = scores[0, 1]
     minimum_ioc = MINIMUM_IMPROVEMENT_RATIO * baseline
 
     # Build another cutoff based on a fraction of the best score.
-    best_score = max(score for _, score in scores)
+    best_score = scores[:, 1].max()
     threshold_score = best_score * SIGNIFICANT_SCORE_RATIO
 
     # Pick highest cutoff as the threshold. Have 1/256 as another threshold in case index of coincidence of data is 0.
-    threshold_score = max(minimum_ioc, threshold_score, 1 / 256)
+    return float(max(minimum_ioc, threshold_score, 1 / 256))
 
-    possible_widths = []
-    for width, score in scores:
-        # Ignore any scores which don't meet threshold.
-        if score < threshold_score:
-            continue
 
-        # Ignore multiples of widths that have already been chosen.
-        if any([width % existing == 0 for existing, _ in possible_widths]):
-            continue
+def filter_width_scores(scores, peaks=False):
+    """From a list of widths and scores, select the "valid" widths.
 
-        possible_widths.append((width, score))
+    Choose widths with an index of coincidence that is much higher than the index of coincidence of the baseline
+    (the file data as a whole), Exclude widths that are multiples of widths that have already been chosen.
+    If peaks is set, also exclude widths scoring lower than the width before or after them in the list.
+    """
+    array = _score_array(scores)
+    passing = array[:, 1] >= width_score_threshold(array)
+    if peaks:
+        # Widths at either end of the list only have a neighbour on one side.
+        passing[1:] &= array[1:, 1] >= array[:-1, 1]
+        passing[:-1] &= array[:-1, 1] >= array[1:, 1]
+
+    # Multiples of each chosen width are marked in a sieve, so later candidates are checked in one lookup.
+    widths = array[:, 0].astype(np.int64)
+    multiples = np.zeros(widths.max() + 1, dtype=bool)
+    possible_widths = []
+    for index in np.flatnonzero(passing).tolist():
+        width = widths[index]
+        if multiples[width]:
+            continue
+        multiples[width::width] = True
+        # Rows of an array are NumPy scalars, which are returned as plain numbers like a list's.
+        possible_widths.append((int(width), float(scores[index][1])))
     return possible_widths
 
 
-def get_features(data):
+def analyse(
+    data,
+    maximum_width=MAXIMUM_WIDTH,
+    sampling_size=None,
+    workers=1,
+    metrics=None,
+    adaptive=False,
+    deadline=None,
+    histogram=None,
+):
     """Estimate obfuscation key width on data, using index of coincidence.
 
-    Return an array of width/score tuples, as well as the base index of
-    coincidence score of the data, to be used as a baseline.
+    Data longer than sampling_size is scored from a sample, see compute_sampled_width_scores.
+    Otherwise if adaptive, data large enough to sample is scored exactly only for the widths
+    that could be chosen, see compute_adaptive_width_scores.
+    Exact scoring is split between workers threads, see compute_width_scores.
+    If scoring exactly won't comfortably finish by the time.monotonic() deadline, large data is
+    sampled and smaller data scored in batches of widths until time runs out, and the analysis is
+    marked partial if it was sampled or cut short. Stages are timed in metrics, if given.
+    The byte histogram of the data is counted to choose the engine, unless one is given.
     """
-    # Compute index of coincidence scores for widths up to MAXIMUM_WIDTH.
-    scores = compute_width_scores(data)
+    sampled = sampling_size is not None and len(data) > sampling_size
+    adaptive = adaptive and not sampled and len(data) > ADAPTIVE_GROWTH * ADAPTIVE_SAMPLE_SIZE
+    budgeted = False
+    # Sampling in place of exact scoring to save time also leaves the analysis partial.
+    partial = False
+    if not sampled and not adaptive:
+        # Score with whichever engine is cheapest for this data and width range, if it fits the time left.
+        engine = choose_engine(data, maximum_width, histogram)
+        if scoring_cost(data, maximum_width, engine, histogram) > BUDGET_FRACTION * time_left(deadline):
+            sampled = partial = len(data) > SAMPLE_SIZE
+            budgeted = not sampled
+
+    estimated = set()
+    if sampled:
+        with stage(metrics, "sampled_width_scores", len(data)):
+            scores, estimated = compute_sampled_width_scores(data, maximum_width, workers=workers, deadline=deadline)
+        partial = partial or time_left(deadline) <= 0
+    elif adaptive:
+        with stage(metrics, "adaptive_width_scores", len(data)):
+            scores, estimated = compute_adaptive_width_scores(data, maximum_width, workers=workers)
+    elif budgeted:
+        with stage(metrics, "budgeted_width_scores", len(data)):
+            scores = compute_budgeted_width_scores(data, maximum_width, workers, deadline)
+        partial = len(scores) < min(maximum_width, len(data) - 1)
+    else:
+        # Compute index of coincidence scores for widths up to maximum_width.
+        with stage(metrics, "compute_width_scores", len(data)):
+            scores = compute_width_scores(data, maximum_width, engine, workers)
+    count(metrics, "widths_evaluated", len(scores))
 
     # The first entry (for width 1) is the plain index of coincidence for this
     # file.
     baseline = scores[0][1]
 
     # Filter out low scoring / spurious widths.
-    widths = filter_width_scores(scores)
+    with stage(metrics, "filter_width_scores"):
+        widths = filter_width_scores(scores)
+
+    return Analysis(widths, baseline, scores, frozenset(estimated), partial=partial)
+
+
+def analyse_gated(
+    data,
+    minimum_entropy,
+    maximum_width=MAXIMUM_WIDTH,
+    sampling_size=None,
+    workers=1,
+    metrics=None,
+    adaptive=False,
+    deadline=None,
+):
+    """Estimate obfuscation key width on data with at least minimum_entropy, otherwise return None.
+
+    The entropy and byte histogram come from a single native pass over the data, which stops as soon
+    as the entropy is known to be too low. Width matches are counted during that same pass unless
+    sampling, adaptive scoring, the autocorrelation engine or a gate pass followed by a scan split between
+    workers threads is expected to be cheaper, or it might not finish by the deadline, see analyse.
+    Otherwise the histogram from the gate pass is reused to choose the engine. Stages are timed in metrics, if given.
+    """
+    # Only data passing the gate is scored, and its byte values will be spread fairly evenly.
+    spread = [len(data) / 256] * 256
+    sampled = sampling_size is not None and len(data) > sampling_size
+    sampled = sampled or (adaptive and len(data) > ADAPTIVE_GROWTH * ADAPTIVE_SAMPLE_SIZE)
+    # The fused pass scans on one thread. Splitting the scan between threads needs a gate pass of its own first,
+    # and only pays for it if the threads run on separate CPUs.
+    threads = len(split_ranges(0, len(data), min(resolve_workers(workers), available_workers())))
+    cost = scoring_cost(data, maximum_width)
+    fused = not sampled and choose_engine(data, maximum_width, spread) == ENGINE_DIRECT
+    fused = fused and cost <= GATE_COST * len(data) + cost / threads
+    fused = fused and cost <= BUDGET_FRACTION * time_left(deadline)
+
+    # When fused, this stage includes counting the width matches.
+    with stage(metrics, "entropy_gate", len(data)):
+        ent, histogram, matches = entropy_width_matches(data, maximum_width if fused else 0, minimum_entropy)
+    if matches is None:
+        return None
+
+    if fused:
+        scores = match_scores(matches, len(data))
+        count(metrics, "widths_evaluated", len(scores))
+        with stage(metrics, "filter_width_scores"):
+            analysis = Analysis(filter_width_scores(scores), scores[0][1], scores)
+    else:
+        analysis = analyse(data, maximum_width, sampling_size, workers, metrics, adaptive, deadline, histogram)
+    return analysis._replace(entropy=ent)
+
+
+def analyse_region(
+    data, offset, size, maximum_width=MAXIMUM_WIDTH, sampling_size=None, workers=1, metrics=None, deadline=None
+):
+    """Estimate obfuscation key width on the size bytes of data starting at offset, without copying them.
+
+    Widths and scores are for the region alone, as if it were the whole data.
+    """
+    with memoryview(data) as view, view[offset : offset + size] as region:
+        return analyse(region, maximum_width, sampling_size, workers, metrics, deadline=deadline)
 
-    # Return an array of width/score tuples, and the baseline score.
-    return widths, baseline
 
+def analyse_keys(data, analysis, plaintext=PLAINTEXT_BYTE, metrics=None):
+    """Return the analysis with a key recovered for each selected width, see recover_keys.
+
+    Only the selected widths are counted, all in one pass over the data.
+    """
+    with stage(metrics, "key_recovery", len(data)):
+        keys = recover_keys(data, [width for width, _ in analysis.widths], plaintext)
+    return analysis._replace(keys=tuple(keys))
 
-def main():
-    """Calculate and display the index of coincidence on the supplied file."""
-    # Use argparse to provide a user interface and collect arguments.
-    description = "Compute index of coincidence and find obfuscation widths."
-    parser = argparse.ArgumentParser(description=description)
 
-    # Only required argument is a file to scan.
-    parser.add_argument("filepath", help="File to analyse.")
-    args = parser.parse_args()
+def analyse_transforms(data, analysis, maximum_width=MAXIMUM_WIDTH, transforms=TRANSFORMS, workers=1, metrics=None):
+    """Return the analysis with the widths chosen from the scores of each transform of the data, see transform.py.
 
-    # Load in file data.
-    with open(args.filepath, "rb") as f:
-        file_data = f.read()
+    A plain repeating XOR key shows in every transform too, but less clearly than in the data itself. So only
+    widths scoring higher than any width of the data itself are kept, of which those scoring less than
+    SIGNIFICANT_SCORE_RATIO of the best transform width are dropped like other widths.
+    """
+    with stage(metrics, "transform_width_scores", len(data) * len(transforms)):
+        scores = transform_width_scores(data, maximum_width, transforms, workers)
+    count(metrics, "widths_evaluated", sum(len(transformed) for transformed in scores.values()))
+
+    best_plain = max((score for _, score in analysis.scores), default=0.0)
+    candidates = [
+        TransformWidth(transform, width, score)
+        for transform, transformed in scores.items()
+        if transformed
+        for width, score in filter_width_scores(transformed)
+        if score > best_plain
+    ]
+    best = max((candidate.score for candidate in candidates), default=0.0)
+    chosen = [candidate for candidate in candidates if candidate.score >= SIGNIFICANT_SCORE_RATIO * best]
+    return analysis._replace(transforms=tuple(chosen))
+
+
+def analyse_stream(stream, maximum_width=MAXIMUM_WIDTH, chunk_size=CHUNK_SIZE, workers=1, metrics=None, deadline=None):
+    """Estimate obfuscation key width on a file-like object, reading it a chunk at a time.
+
+    Scores are exact, and only chunk_size bytes of the stream are held in memory at once.
+    Each chunk is split between workers threads. Stages are timed in metrics, if given.
+    Once the time.monotonic() deadline passes, the stream read so far is scored and the analysis marked partial.
+    """
+    with stage(metrics, "compute_width_scores") as timer:
+        start = stream.tell()
+        matches, length = stream_width_matches(stream, maximum_width, chunk_size, workers, deadline)
+        timer.size = stream.tell() - start
+    scores = match_scores(matches, length)
+    count(metrics, "widths_evaluated", len(scores))
+    # The chunk read when the deadline passed isn't scored, leaving the stream ahead of the bytes scored.
+    partial = stream.tell() - start > length
+    with stage(metrics, "filter_width_scores"):
+        return Analysis(filter_width_scores(scores), scores[0][1], scores, partial=partial)
+
+
+def get_features(data, maximum_width=MAXIMUM_WIDTH, sampling_size=None, workers=1, metrics=None):
+    """Estimate obfuscation key width on data, using index of coincidence.
 
-    # Compute baseline index of coincidence and possible widths.
-    widths, baseline = get_features(file_data)
+    Return an array of width/score tuples, as well as the base index of
+    coincidence score of the data, to be used as a baseline.
+    """
+    analysis = analyse(data, maximum_width, sampling_size, workers, metrics)
 
-    # Display results.
-    print("Index of coincidence: %s" % baseline)
-    if widths:
-        print("Widths:")
-        for width, score in widths:
-            print("\tWidth %d raises index to %s" % (width, score))
+    # Return an array of width/score tuples, and the baseline score.
+    return analysis.widths, analysis.baseline
 
 
 if __name__ == "__main__":
+    # The command-line lives in cli.py, so that clients of the daemon don't load this library.
+    from .cli import main
+
     main()
@@ -0,0 +1,62 @@
+"""Count width matches on several threads at once.
+
+The native width_matches kernel releases the GIL while it scans, so threads share the one buffer
+without copying it. The data is split into ranges of positions, each thread counts matches for
+every width starting in its range, and the integer counts are summed, so results are identical
+to a single scan.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from _coincidence import width_matches
+
+# Smallest range of positions worth handing to a thread, smaller data is scanned by fewer threads.
+MIN_RANGE_SIZE = 256 * 1024
+
+
+def available_workers():
+    """Return the number of CPUs this process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def resolve_workers(workers):
+    """Return the number of threads to use, where zero or None means every available CPU."""
+    if not workers:
+        return available_workers()
+    return max(1, workers)
+
+
+def split_ranges(start, stop, workers, min_range_size=MIN_RANGE_SIZE):
+    """Return (start, stop) ranges covering the positions from start to stop, one for each thread to use."""
+    length = max(0, stop - start)
+    count = max(1, min(workers, length // max(min_range_size, 1)))
+    return [(start + length * index // count, start + length * (index + 1) // count) for index in range(count)]
+
+
+def match_scores(matches, length, first=1):
+    """Return width/score tuples for match counts of consecutive widths from first over length bytes of data.
+
+    Each width compares length - width pairs of bytes, so widths stop short of the length.
+    """
+    return [(width, count / (length - width)) for width, count in zip(range(first, length), matches, strict=False)]
+
+
+def parallel_width_matches(
+    data, maximum_width, workers=None, start=0, stop=-1, minimum_width=1, min_range_size=MIN_RANGE_SIZE
+):
+    """Count matches for widths from minimum_width to maximum_width, scanning with several threads.
+
+    Return the same list of match counts as width_matches(data, maximum_width, start, stop, minimum_width).
+    """
+    if stop < 0 or stop > len(data):
+        stop = len(data)
+    ranges = split_ranges(max(0, start), stop, resolve_workers(workers), min_range_size)
+    if len(ranges) == 1:
+        return width_matches(data, maximum_width, start, stop, minimum_width)
+
+    with ThreadPoolExecutor(len(ranges)) as pool:
+        partials = list(pool.map(lambda bounds: width_matches(data, maximum_width, *bounds, minimum_width), ranges))
+    return [sum(counts) for counts in zip(*partials, strict=True)]
@@ -0,0 +1,103 @@
+"""Estimate width scores from a stratified sample of positions, with confidence intervals.
+
+The data is split into equal strata and a block of consecutive positions is drawn at random from each one.
+Every width is scored on the sampled blocks, and the spread of scores between blocks gives a confidence
+interval for the score the whole data would have.
+"""
+
+import math
+import random
+
+from _coincidence import width_matches
+
+# Number of sampled positions spread across the data.
+SAMPLE_SIZE = 1024 * 1024
+
+# Consecutive positions sampled together from each stratum.
+# Blocks keep the native kernel working on long runs of memory.
+SAMPLE_BLOCK_SIZE = 4096
+
+# Width of confidence intervals in standard errors, three gives about 99.7% coverage.
+CONFIDENCE_Z = 3.0
+
+# Widths scored together in one pass over each block, rather than one pass per width, once there are this many.
+DENSE_WIDTHS = 16
+
+
+def sample_blocks(length, sample_size=SAMPLE_SIZE, block_size=SAMPLE_BLOCK_SIZE, seed=0):
+    """Return the (start, stop) position ranges to sample from data of the given length.
+
+    One block is drawn at random from each of the equal strata the data is divided into.
+    The same length and seed always give the same blocks, so results are repeatable.
+    """
+    strata = max(1, min(sample_size // block_size, length // block_size))
+    stratum_size = length / strata
+    # Sampling only needs to be spread evenly, not unpredictable.
+    rng = random.Random(seed)  # noqa: S311
+
+    blocks = []
+    for stratum in range(strata):
+        stratum_start = int(stratum * stratum_size)
+        stratum_stop = int((stratum + 1) * stratum_size)
+        start = rng.randrange(stratum_start, max(stratum_stop - block_size, stratum_start) + 1)
+        blocks.append((start, min(start + block_size, stratum_stop)))
+    return blocks
+
+
+def _block_width_matches(data, widths, start, stop):
+    """Count matches for each of the given widths, in order, for positions from start to stop."""
+    if len(widths) < DENSE_WIDTHS:
+        return [width_matches(data, width, start, stop, width)[0] for width in widths]
+    counts = width_matches(data, widths[-1], start, stop, widths[0])
+    return [counts[width - widths[0]] for width in widths]
+
+
+def estimate_width_scores(
+    data, maximum_width, sample_size=SAMPLE_SIZE, block_size=SAMPLE_BLOCK_SIZE, seed=0, widths=None
+):
+    """Estimate the index of coincidence for each width from a sample of the data.
+
+    Widths from 1 to maximum_width are estimated, or only those in the sorted widths list if given.
+    Return a list of (width, score, low, high) tuples, where low and high bound the
+    confidence interval of the score for the full data.
+    """
+    length = len(data)
+    if widths is None:
+        widths = list(range(1, max(0, min(maximum_width, length - 1)) + 1))
+    widths = [width for width in widths if width < length]
+    blocks = sample_blocks(length, sample_size, block_size, seed)
+    fraction = min(1.0, sum(stop - start for start, stop in blocks) / max(length, 1))
+
+    # Score every width on each sampled block.
+    block_matches = [_block_width_matches(data, widths, start, stop) for start, stop in blocks] if widths else []
+
+    estimates = []
+    for index, width in enumerate(widths):
+        rates = []
+        matches = 0
+        pairs = 0
+        for (start, stop), counts in zip(blocks, block_matches, strict=True):
+            # Pairs are only counted while the shifted position is inside the data.
+            block_pairs = min(stop, length - width) - start
+            if block_pairs <= 0:
+                continue
+            rates.append(counts[index] / block_pairs)
+            matches += counts[index]
+            pairs += block_pairs
+
+        if not pairs:
+            continue
+        score = matches / pairs
+
+        # Strata are equally sized, so the standard error comes from the spread of block rates.
+        # Never let it drop below the binomial error of the sampled pairs, which catches samples
+        # where every block happened to score the same.
+        variance = score * (1 - score) / pairs
+        if len(rates) > 1:
+            mean = sum(rates) / len(rates)
+            spread = sum((rate - mean) ** 2 for rate in rates) / (len(rates) - 1)
+            variance = max(variance, spread / len(rates))
+        error = CONFIDENCE_Z * math.sqrt(variance * (1 - fraction))
+        estimates.append((width, score, max(0.0, score - error), min(1.0, score + error)))
+
+    return estimates
@@ -0,0 +1,69 @@
+"""Score widths over a stream of data, a chunk at a time.
+
+Only the last maximum_width bytes are carried between chunks, so memory use is bounded by the chunk size
+rather than by the size of the data.
+"""
+
+import time
+
+from _coincidence import width_matches
+
+from .parallel import match_scores, parallel_width_matches
+
+# Bytes read from the stream at a time.
+CHUNK_SIZE = 1024 * 1024
+
+
+def read_chunks(stream, chunk_size=CHUNK_SIZE):
+    """Yield chunks of up to chunk_size bytes from a file-like object until it is exhausted."""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def stream_width_matches(stream, maximum_width, chunk_size=CHUNK_SIZE, workers=1, deadline=None):
+    """Count matches for each width over a file-like object, reading it in chunks.
+
+    Return the list of match counts for widths from 1 up to maximum_width or the length of the stream,
+    the same as the width_matches kernel, and the total length of the stream.
+    Each chunk is split between workers threads, see parallel_width_matches.
+    Once the time.monotonic() deadline passes, no more chunks are counted and the counts and length
+    are those of the stream read so far.
+    """
+    counts = [0] * maximum_width
+    carry = b""
+    length = 0
+
+    for chunk in read_chunks(stream, chunk_size):
+        if length and deadline is not None and time.monotonic() >= deadline:
+            break
+        length += len(chunk)
+        buffer = carry + chunk
+
+        # Positions more than maximum_width from the end can already be compared at every width.
+        # The rest are carried into the next chunk, where the bytes they pair with will be.
+        stop = len(buffer) - maximum_width
+        if stop > 0:
+            for index, count in enumerate(parallel_width_matches(buffer, maximum_width, workers, 0, stop)):
+                counts[index] += count
+            carry = buffer[stop:]
+        else:
+            carry = buffer
+
+    # The carried bytes are the end of the data, so their remaining pairs are all within them.
+    for index, count in enumerate(width_matches(carry, maximum_width)):
+        counts[index] += count
+
+    # Widths stop once they reach the length of the data.
+    return counts[: max(0, min(maximum_width, length - 1))], length
+
+
+def stream_width_scores(stream, maximum_width, chunk_size=CHUNK_SIZE, workers=1, deadline=None):
+    """Compute the index of coincidence for each width over a file-like object, reading it in chunks.
+
+    Scores are identical to compute_width_scores on the full data, or on the data read by the deadline.
+    """
+    matches, length = stream_width_matches(stream, maximum_width, chunk_size, workers, deadline)
+    return match_scores(matches, length)
@@ -0,0 +1,62 @@
+"""Score byte transforms of data for key widths, for keys a plain repeating XOR scan can't see.
+
+An additive key incremented every byte, or a key chained through the previous ciphertext byte, leaves no
+repeats at the key width in the data itself, but does in its first differences. Data delta encoded after
+a repeating key was applied repeats in its running sums. Every transform is counted in one native pass,
+each block transformed in a scratch buffer while it is in cache, so no transformed copy of the data is made.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+from _coincidence import transform_width_matches
+
+from .parallel import match_scores, resolve_workers, split_ranges
+
+# Transforms by name, in the order the native kernel numbers them.
+# sub_delta and xor_delta are the difference and XOR of each byte with the next, for keys that step
+# every byte or chain through the previous byte. add_sum and xor_sum are running sums of the bytes,
+# for content delta encoded after being encoded with a repeating key.
+TRANSFORMS = ("sub_delta", "xor_delta", "add_sum", "xor_sum")
+
+# Delta transforms have one position fewer than the data.
+DELTA_TRANSFORMS = ("sub_delta", "xor_delta")
+
+
+class TransformWidth(NamedTuple):
+    """A width chosen from the scores of a transform of the data."""
+
+    transform: str
+    width: int
+    score: float
+
+
+def transform_length(transform, length):
+    """Return the number of positions in the transform of length bytes."""
+    if transform in DELTA_TRANSFORMS:
+        return max(0, length - 1)
+    return length
+
+
+def transform_width_scores(data, maximum_width, transforms=TRANSFORMS, workers=1):
+    """Return a dictionary of width/score tuples for each named transform of data, for widths up to maximum_width.
+
+    Scores are those compute_width_scores would give the transformed data, from one scan shared by every
+    transform, split between workers threads where zero or None means every available CPU.
+    """
+    codes = [TRANSFORMS.index(transform) for transform in transforms]
+    ranges = split_ranges(0, len(data), resolve_workers(workers))
+    if len(ranges) == 1:
+        counts = transform_width_matches(data, maximum_width, codes)
+    else:
+        with ThreadPoolExecutor(len(ranges)) as pool:
+            partials = list(
+                pool.map(lambda bounds: transform_width_matches(data, maximum_width, codes, *bounds), ranges)
+            )
+        counts = [[sum(column) for column in zip(*matches, strict=True)] for matches in zip(*partials, strict=True)]
+
+    scores = {}
+    for transform, matches in zip(transforms, counts, strict=True):
+        # Delta transforms have a position fewer than the data.
+        scores[transform] = match_scores(matches, transform_length(transform, len(data)))
+    return scores
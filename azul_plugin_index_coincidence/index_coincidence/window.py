@@ -0,0 +1,130 @@
+"""Score widths over sliding windows of the data, to locate obfuscated regions inside larger content.
+
+Windows advance step bytes at a time. Match counts are taken once for each step-sized block of
+positions, and each window's counts are kept as a rolling sum, adding the block coming into the
+window and removing the block going out. The only other work per window is correcting for pairs
+that start inside the window but end past it, which only involves its last maximum_width bytes.
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+from _coincidence import width_matches
+
+from .main import filter_width_scores
+from .parallel import match_scores, resolve_workers
+
+# Bytes covered by each window.
+WINDOW_SIZE = 1024 * 1024
+
+# Bytes each window starts after the last, windows overlap unless this matches the window size.
+WINDOW_STEP = 256 * 1024
+
+
+class Region(NamedTuple):
+    """A range of the data where a key width was chosen."""
+
+    offset: int
+    size: int
+    width: int
+    # Best score for the width across the windows in the region.
+    score: float
+
+
+def _block_matches(data, maximum_width, step, workers):
+    """Return match counts for the positions in each step-sized block, counted on workers threads."""
+    bounds = [(start, min(start + step, len(data))) for start in range(0, len(data), step)]
+    if resolve_workers(workers) == 1:
+        return [width_matches(data, maximum_width, start, stop) for start, stop in bounds]
+    with ThreadPoolExecutor(resolve_workers(workers)) as pool:
+        return list(pool.map(lambda block: width_matches(data, maximum_width, *block), bounds))
+
+
+def _crossing_matches(view, maximum_width, stop, widths):
+    """Count matches for pairs that start before stop but end at or after it, for each width."""
+    start = stop - maximum_width
+    every = width_matches(view, maximum_width, start, stop)
+    with view[start:stop] as tail:
+        inside = width_matches(tail, maximum_width)
+    # The inside counts stop one width short, as a pair can't span all of the last maximum_width bytes.
+    inside += [0] * (widths - len(inside))
+    return [total - within for total, within in zip(every[:widths], inside, strict=True)]
+
+
+def check_window(window_size, step):
+    """Raise ValueError unless windows of window_size bytes can start every step bytes."""
+    if step <= 0 or window_size <= 0 or window_size % step:
+        raise ValueError(f"window size {window_size} must be a positive multiple of the step {step}")
+
+
+def window_width_matches(data, maximum_width, window_size=WINDOW_SIZE, step=WINDOW_STEP, workers=1):
+    """Yield (offset, size, counts) for each window, counts being the matches within it for each width.
+
+    Counts are identical to width_matches on the window's bytes alone. Windows start every step bytes,
+    and the last window ends at the end of the data, so it may be shorter than window_size.
+    """
+    check_window(window_size, step)
+    if window_size <= maximum_width:
+        raise ValueError(f"window size {window_size} must be larger than the maximum width {maximum_width}")
+
+    length = len(data)
+    if length < 2:
+        return
+    blocks = _block_matches(data, maximum_width, step, workers)
+    widths = len(blocks[0])
+    per_window = window_size // step
+
+    # Rolling sum over the blocks in the current window.
+    window = deque()
+    counts = [0] * widths
+    # The view is released once the windows are done, so mapped data can be closed.
+    with memoryview(data) as view:
+        for index, block in enumerate(blocks):
+            window.append(block)
+            counts = [count + added for count, added in zip(counts, block, strict=True)]
+            if len(window) > per_window:
+                removed = window.popleft()
+                counts = [count - dropped for count, dropped in zip(counts, removed, strict=True)]
+
+            stop = min((index + 1) * step, length)
+            # Windows begin once they are full, unless the data is shorter than a window.
+            if len(window) < per_window and stop < length:
+                continue
+            offset = (index + 1 - len(window)) * step
+            if stop < length:
+                crossing = _crossing_matches(view, maximum_width, stop, widths)
+                yield offset, stop - offset, [count - cross for count, cross in zip(counts, crossing, strict=True)]
+            else:
+                yield offset, stop - offset, list(counts)
+
+
+def window_width_scores(data, maximum_width, window_size=WINDOW_SIZE, step=WINDOW_STEP, workers=1):
+    """Yield (offset, size, scores) for each window, scores being its list of width/score tuples.
+
+    Scores are identical to compute_width_scores on the window's bytes alone.
+    """
+    for offset, size, counts in window_width_matches(data, maximum_width, window_size, step, workers):
+        yield offset, size, match_scores(counts, size)
+
+
+def find_regions(data, maximum_width, window_size=WINDOW_SIZE, step=WINDOW_STEP, workers=1):
+    """Return the regions of the data where a key width is chosen, as a list of Region tuples.
+
+    Widths are chosen in each window as filter_width_scores does for the whole data, and
+    overlapping or adjacent windows choosing the same width are merged into a single region.
+    """
+    regions = []
+    # Region being built for each width, as a list so it can be extended.
+    open_regions = {}
+    for offset, size, scores in window_width_scores(data, maximum_width, window_size, step, workers):
+        chosen = dict(filter_width_scores(scores)) if scores else {}
+        for width in list(open_regions):
+            if width not in chosen:
+                regions.append(Region(*open_regions.pop(width)))
+        for width, score in chosen.items():
+            region = open_regions.setdefault(width, [offset, 0, width, score])
+            region[1] = offset + size - region[0]
+            region[3] = max(region[3], score)
+    regions.extend(Region(*region) for region in open_regions.values())
+    return sorted(regions)
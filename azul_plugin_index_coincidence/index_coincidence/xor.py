@@ -0,0 +1,89 @@
+"""Recover repeating XOR keys from per-column byte histograms, and decode data with them.
+
+Data XORed with a key of a given width splits into columns, the bytes at each offset modulo the width,
+which were all XORed with the same key byte. The most common byte in a column is taken to be a common
+plaintext byte, such as 0x00 in executables, XORed with that column's key byte.
+"""
+
+from typing import NamedTuple
+
+import numpy as np
+
+from .stream import CHUNK_SIZE
+
+# Byte assumed to be the most common in the plaintext.
+PLAINTEXT_BYTE = 0x00
+
+
+class KeyRecovery(NamedTuple):
+    """A key recovered for a width, and the entropy of the data decoded with it."""
+
+    width: int
+    key: bytes
+    entropy: float
+
+
+def column_histograms(data, width, chunk_size=CHUNK_SIZE):
+    """Return a width by 256 array counting each byte value at each offset modulo width.
+
+    The data is counted chunk_size bytes at a time, so the working memory doesn't grow with the data.
+    """
+    return column_histograms_many(data, [width], chunk_size)[0]
+
+
+def column_histograms_many(data, widths, chunk_size=CHUNK_SIZE):
+    """Return the column_histograms array for each of widths, counting every width in one pass over the data."""
+    histograms = [np.zeros(width * 256, dtype=np.int64) for width in widths]
+    # Chunks start anywhere in a width's columns, so its offsets run a width past the chunk to slice from any start.
+    columns = [np.tile(np.arange(width, dtype=np.int32) * 256, chunk_size // width + 2) for width in widths]
+    with memoryview(data) as view:
+        for start in range(0, len(view), chunk_size):
+            chunk = np.frombuffer(view[start : start + chunk_size], dtype=np.uint8)
+            for width, offsets, counts in zip(widths, columns, histograms, strict=True):
+                column = start % width
+                counts += np.bincount(offsets[column : column + len(chunk)] + chunk, minlength=width * 256)
+    return [counts.reshape(width, 256) for width, counts in zip(widths, histograms, strict=True)]
+
+
+def recover_key(histograms, plaintext=PLAINTEXT_BYTE):
+    """Return the key most likely to have encoded each column to the given histograms."""
+    return bytes((np.argmax(histograms, axis=1) ^ plaintext).astype(np.uint8))
+
+
+def decoded_entropy(histograms, key):
+    """Return the Shannon entropy of the data counted in histograms once decoded with key."""
+    # XOR is its own inverse, so decoded value v in a column was encoded as v ^ key byte.
+    values = np.arange(256)
+    decoded = histograms[np.arange(len(key))[:, None], values ^ np.frombuffer(key, dtype=np.uint8)[:, None]]
+    counts = decoded.sum(axis=0)
+    counts = counts[counts > 0]
+    probabilities = counts / counts.sum()
+    # Subtracting from zero rather than negating, so a single byte value gives 0.0 rather than -0.0.
+    return float(0.0 - np.sum(probabilities * np.log2(probabilities)))
+
+
+def recover_keys(data, widths, plaintext=PLAINTEXT_BYTE, chunk_size=CHUNK_SIZE):
+    """Return a KeyRecovery for each width, assuming plaintext is the most common plaintext byte."""
+    recoveries = []
+    for width, histograms in zip(widths, column_histograms_many(data, widths, chunk_size), strict=True):
+        key = recover_key(histograms, plaintext)
+        recoveries.append(KeyRecovery(width, key, decoded_entropy(histograms, key)))
+    return recoveries
+
+
+def xor_bytes(data, key, phase=0):
+    """Return data XORed with the repeating key, starting phase bytes into the key."""
+    pad = np.resize(np.roll(np.frombuffer(key, dtype=np.uint8), -phase), len(data))
+    return (np.frombuffer(data, dtype=np.uint8) ^ pad).tobytes()
+
+
+def xor_decode(data, key, out, chunk_size=CHUNK_SIZE):
+    """Write data XORed with the repeating key to the file-like object out, a chunk at a time."""
+    width = len(key)
+    chunk_size = max(width, chunk_size - chunk_size % width)
+    # The key is repeated once for every chunk, rather than by xor_bytes for each.
+    pad = np.resize(np.frombuffer(key, dtype=np.uint8), chunk_size)
+    with memoryview(data) as view:
+        for start in range(0, len(view), chunk_size):
+            chunk = np.frombuffer(view[start : start + chunk_size], dtype=np.uint8)
+            out.write((chunk ^ pad[: len(chunk)]).tobytes())
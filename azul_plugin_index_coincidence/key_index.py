@@ -0,0 +1,62 @@
+"""Keep XOR keys recovered from earlier content in an SQLite store, to test every one of them against new content.
+
+The store can be shared by several plugin processes. Each notices keys the others added when it next scans.
+"""
+
+import sqlite3
+import threading
+import time
+
+from .index_coincidence.known_keys import KeyScanner
+
+
+class KeyIndex:
+    """Keys seen before, kept in an SQLite store at path, or only in memory if path is empty."""
+
+    def __init__(self, path=None):
+        self.keys = set()
+        self._scanner = None
+        # Jobs may be run from more than one thread, so the connection is shared under a lock.
+        self.lock = threading.Lock()
+        self.store = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        with self.store:
+            self.store.execute("CREATE TABLE IF NOT EXISTS keys (key BLOB PRIMARY KEY, added REAL)")
+        self.refresh()
+
+    def __len__(self):
+        """Return the number of keys in the index."""
+        return len(self.keys)
+
+    def refresh(self):
+        """Load any keys added to the store by other processes."""
+        with self.lock:
+            (stored,) = self.store.execute("SELECT COUNT(*) FROM keys").fetchone()
+            if stored != len(self.keys):
+                keys = {bytes(key) for (key,) in self.store.execute("SELECT key FROM keys")}
+                if self._scanner is not None:
+                    for key in sorted(keys - self.keys):
+                        self._scanner.add(key)
+                self.keys = keys
+
+    def add(self, key):
+        """Add key to the index, if it isn't there already."""
+        with self.lock:
+            if not key or key in self.keys:
+                return
+            with self.store:
+                self.store.execute("INSERT OR IGNORE INTO keys VALUES (?, ?)", (key, time.time()))
+            self.keys.add(key)
+            if self._scanner is not None:
+                self._scanner.add(key)
+
+    def scanner(self):
+        """Return a KeyScanner for the keys in the index, built once and then given each key as it is added."""
+        self.refresh()
+        with self.lock:
+            if self._scanner is None:
+                self._scanner = KeyScanner(sorted(self.keys))
+            return self._scanner
+
+    def close(self):
+        """Close the store."""
+        self.store.close()
@@ -1,23 +1,59 @@
 """Find index-of-coincidence widths to find obfuscation key widths and data repetition."""
 
+import mmap
+import os
+import tempfile
+import time
+
 from azul_runner import FV, BinaryPlugin, Feature, Job, State, add_settings, cmdline_run
 
-from .entropy import entropy
-from .index_coincidence.main import get_features
+from .cache import MEMORY_ENTRIES, STORE_SIZE, ResultCache, cache_key
+from .entropy import REGION_BLOCK_SIZE, entropy, entropy_regions, entropy_stream, preflight_entropy
+from .index_coincidence.fingerprint import fingerprint
+from .index_coincidence.main import (
+    MAXIMUM_WIDTH,
+    MINIMUM_IMPROVEMENT_RATIO,
+    SIGNIFICANT_SCORE_RATIO,
+    analyse_gated,
+    analyse_keys,
+    analyse_region,
+    analyse_stream,
+    analyse_transforms,
+    scoring_cost,
+    time_left,
+)
+from .index_coincidence.stream import CHUNK_SIZE
+from .index_coincidence.transform import TRANSFORMS
+from .index_coincidence.window import WINDOW_STEP, Region, check_window, find_regions
+from .index_coincidence.xor import PLAINTEXT_BYTE, xor_decode
+from .key_index import KeyIndex
+from .metrics import Metrics, count, stage
+
+# Only want to run on high entropy files.
+# The value of this plugin is when it finds widths, and the nature of those files
+# means they will have very high entropy.
+MINIMUM_ENTROPY = 6.0
+
+# Content is only opted out by a preflight if the entropy of the bytes it read is this far below the gate,
+# as bytes read from a few places in the content don't give its entropy exactly.
+PREFLIGHT_MARGIN = 0.5
 
 
 class AzulPluginIndexCoincidence(BinaryPlugin):
     """Find index-of-coincidence widths to find obfuscation key widths and data repetition."""
 
     CONTACT = "ASD's ACSC"
-    VERSION = "2025.03.18"
-    # FUTURE: enable dispatcher to filter binaries of interest on 'entrpy'
-    # This would allow us to filter input for this plugin to entropy value range/min
-    #
-    # Feature the index of coincidence for a file.
+    VERSION = "2026.10.18"
+    # Feature the entropy of a file, which would allow the dispatcher to filter input for this plugin
+    # to an entropy range, and its index of coincidence.
     # If this index improves by assuming the file is obfuscated by a key with a certain width,
     # feature those widths and their improved index.
     FEATURES = [
+        Feature(
+            "entropy",
+            "Shannon entropy of the content in bits per byte",
+            float,
+        ),
         Feature(
             "index_of_coincidence",
             "Probability that two randomly selected bytes have the same value",
@@ -28,33 +64,407 @@ class AzulPluginIndexCoincidence(BinaryPlugin):
             "Possible key widths which improve the index of coincidence",
             int,
         ),
+        Feature(
+            "index_of_coincidence_region_width",
+            "Possible key widths which improve the index of coincidence within a region of the content",
+            int,
+        ),
+        Feature(
+            "index_of_coincidence_transform_width",
+            "Possible key widths which improve the index of coincidence of a byte transform of the content, "
+            "labelled with the transform and its score",
+            int,
+        ),
+        Feature(
+            "index_of_coincidence_fingerprint",
+            "Hex encoded levels of the index of coincidence at every width up to 300, relative to the median width",
+            str,
+        ),
+        Feature(
+            "known_xor_key",
+            "Hex encoded XOR key from the key index that encodes a known plaintext marker in the content, "
+            "labelled with the marker",
+            str,
+        ),
+        Feature(
+            "index_of_coincidence_key",
+            "Hex encoded XOR key recovered for a width, labelled with the entropy of the content it decodes",
+            str,
+        ),
     ]
     SETTINGS = add_settings(
-        filter_max_content_size=(int, 5 * 1024 * 1024),
+        filter_max_content_size=(int, 128 * 1024 * 1024),
         filter_data_types={"content": []},
+        # Largest key width to test, widths beyond a few hundred are scored by autocorrelation.
+        maximum_width=(int, MAXIMUM_WIDTH),
+        # Content larger than this is scored from a sample, with uncertain widths rescored exactly.
+        sampling_minimum_size=(int, 5 * 1024 * 1024),
+        # Smaller mapped content is estimated from growing samples, and only the widths that would be chosen
+        # are scored exactly, giving the same features with far less work on content with a clear key width.
+        adaptive_scoring=(bool, False),
+        # Memory-map the locally cached content for random access, otherwise stream it a chunk at a time.
+        # Sampling and autocorrelation need random access, streamed content is always scored exactly.
+        memory_map=(bool, True),
+        # Bytes of content read at a time when streaming.
+        stream_chunk_size=(int, CHUNK_SIZE),
+        # Threads that share the scan of large content, zero uses every CPU available to the plugin.
+        workers=(int, 0),
+        # Content larger than a window is also scored over windows of this many bytes, starting every
+        # window_step bytes, to locate obfuscated regions. Windows cost a second pass over the content, so
+        # zero, the default, disables windowed scoring. The size must be a multiple of the step.
+        window_size=(int, 0),
+        window_step=(int, WINDOW_STEP),
+        # Mapped content failing the entropy gate is split into blocks of this many bytes, and runs of
+        # blocks that pass the gate are scored as regions, up to entropy_region_maximum_size bytes in total.
+        # Zero disables scoring regions of low entropy content.
+        entropy_block_size=(int, REGION_BLOCK_SIZE),
+        entropy_region_maximum_size=(int, 32 * 1024 * 1024),
+        # Results are cached by content hash, plugin version and scoring settings, so repeated content isn't
+        # rescored. The most recent cache_entries results are kept in memory, and if cache_path is set,
+        # up to cache_size bytes of results are also kept in an SQLite database there.
+        cache_entries=(int, MEMORY_ENTRIES),
+        cache_path=(str, ""),
+        cache_size=(int, STORE_SIZE),
+        # Stage timings and counters are aggregated if any of these are set. They are written after every job
+        # to metrics_path, as JSON if it ends with .json and Prometheus text otherwise, served in Prometheus
+        # text on metrics_port of metrics_host, and attached to each job's info as stage_seconds if metrics_job_info
+        # is set. Only the loopback interface is served by default, an empty host serves every interface.
+        metrics_path=(str, ""),
+        metrics_port=(int, 0),
+        metrics_host=(str, "127.0.0.1"),
+        metrics_job_info=(bool, False),
+        # Recover an XOR key for each width of mapped content, assuming key_plaintext_byte is the most common byte
+        # of the plaintext. Content decoded with a key to below the entropy gate is added as a child.
+        key_recovery=(bool, False),
+        key_plaintext_byte=(int, PLAINTEXT_BYTE),
+        # Also score the first differences and running sums of mapped content, in one pass costing about a
+        # plain scan per transform, to find additive, chained or delta encoded keys the plain scan can't.
+        transform_scoring=(bool, False),
+        # Report a fingerprint of the scores of every width, quantised to a two bit level each, so content sharing
+        # an encoder can be found by comparing fingerprints, see index_coincidence/fingerprint.py.
+        fingerprint=(bool, False),
+        # Seconds each job may spend analysing content, zero for no limit. As the time runs out, scoring switches
+        # to sampling or fewer widths, and optional stages are skipped, so the job still reports what it found.
+        # Such jobs complete with errors saying the results are partial, and aren't cached, unless windowed
+        # scoring was all that was skipped.
+        time_budget=(float, 0.0),
+        # Before fetching the whole content, read preflight_size bytes from its start, and preflight_probes blocks
+        # of entropy_block_size bytes spread evenly across the rest. Content whose preflight is clearly below the
+        # entropy gate, with no block passing it, is opted out without being fetched, even if unread regions of it
+        # would have passed. Zero disables the preflight.
+        preflight_size=(int, 0),
+        preflight_probes=(int, 0),
+        # Keys recovered by key_recovery that decode content to below the entropy gate are kept in an SQLite key
+        # index at key_index_path. Mapped content is first scanned for plaintext markers, such as a DOS stub, encoded
+        # with any indexed key, and content matching one is reported as a known_xor_key without scoring widths.
+        # Empty disables the key index.
+        key_index_path=(str, ""),
     )
 
+    def __init__(self, config=None):
+        super().__init__(config)
+        # Checked here so a bad setting fails when the plugin loads, rather than in every job large enough for it.
+        if self.cfg.window_size:
+            check_window(self.cfg.window_size, self.cfg.window_step)
+        self.cache = ResultCache(self.cfg.cache_entries, self.cfg.cache_path, self.cfg.cache_size)
+        self.key_index = KeyIndex(self.cfg.key_index_path) if self.cfg.key_index_path else None
+
+        # Nothing is measured unless something will read the metrics.
+        self.metrics = None
+        if self.cfg.metrics_path or self.cfg.metrics_port or self.cfg.metrics_job_info:
+            self.metrics = Metrics()
+            # Another plugin instance in the process may already be serving on the port, which isn't worth
+            # failing the plugin for, as its metrics are still written and attached to jobs as configured.
+            if self.cfg.metrics_port:
+                try:
+                    self.metrics.serve(self.cfg.metrics_port, self.cfg.metrics_host)
+                except OSError as e:
+                    self.logger.warning("not serving metrics on port %d: %s", self.cfg.metrics_port, e)
+
     def execute(self, job: Job):
         """Run across data for any file type.
 
-        Low entropy files will be opted-out.
+        Low entropy files will be opted-out, unless a high entropy region within them has a width.
         """
-        # Read in the sample data.
-        data = job.get_data().read()
+        if self.metrics is not None:
+            self.metrics.start_job()
+        deadline = time.monotonic() + self.cfg.time_budget if self.cfg.time_budget > 0 else None
+        # Other processes sharing the key index may have added keys, which changes the results.
+        if self.key_index is not None:
+            self.key_index.refresh()
 
-        # Only want to run on high entropy files.
-        # The value of this plugin is when it finds widths, and the nature of those files
-        # means they will have very high entropy.
-        if entropy(data) < 6.0:
+        key = cache_key(job.get_data().get_hash(), self.VERSION, self.scoring_parameters())
+        with stage(self.metrics, "cache_lookup"):
+            result = self.cache.get(key)
+        cached = result is not None
+        if not cached:
+            result = self.compute_features(job, deadline)
+            # Partial results aren't kept, so the content is analysed in full if it comes up again.
+            if not result["partial"]:
+                self.cache.put(key, result)
+        self.logger.debug("result cache %s", self.cache.stats())
+
+        outcome = "opt_out" if result["features"] is None else "partial" if result["partial"] else "completed"
+        count(self.metrics, "jobs", outcome=outcome, cached=str(cached).lower())
+        if result["features"] is None:
+            count(self.metrics, "opt_outs", reason=result["opt_out"])
+        self.report_metrics()
+
+        if result["features"] is None:
             return State.Label.OPT_OUT
+        for name, value, options in result["features"]:
+            self.add_feature_values(name, FV(value, **options))
+        if result["children"]:
+            self.add_decoded_children(job, result["children"])
+        if result["partial"]:
+            return State(
+                State.Label.COMPLETED_WITH_ERRORS,
+                message=f"Time budget of {self.cfg.time_budget} seconds ran out, results are partial",
+            )
+
+    def add_decoded_children(self, job: Job, keys):
+        """Add the content decoded with each hex encoded key as a child, decoding it a chunk at a time."""
+        with open(job.get_data().get_filepath(), "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for key in keys:
+                # The runner reads the child after execute returns, and the file is deleted when it's closed.
+                decoded = tempfile.TemporaryFile()
+                with stage(self.metrics, "decode", len(data)):
+                    xor_decode(data, bytes.fromhex(key), decoded)
+                decoded.seek(0)
+                self.add_child_with_data_file({"action": "xor decoded", "key": key}, decoded)
+
+    def report_metrics(self):
+        """Write the metrics to metrics_path and attach the job's stage timings to its info, if configured."""
+        if self.metrics is None:
+            return
+        if self.cfg.metrics_job_info:
+            self.add_info({"stage_seconds": self.metrics.last_job})
+        if self.cfg.metrics_path:
+            self.metrics.dump(self.cfg.metrics_path)
+
+    def scoring_parameters(self):
+        """Return everything other than the content that changes the features produced."""
+        return {
+            "minimum_entropy": MINIMUM_ENTROPY,
+            "minimum_improvement_ratio": MINIMUM_IMPROVEMENT_RATIO,
+            "significant_score_ratio": SIGNIFICANT_SCORE_RATIO,
+            "maximum_width": self.cfg.maximum_width,
+            "sampling_minimum_size": self.cfg.sampling_minimum_size,
+            "adaptive_scoring": self.cfg.adaptive_scoring,
+            "memory_map": self.cfg.memory_map,
+            "window_size": self.cfg.window_size,
+            "window_step": self.cfg.window_step,
+            "entropy_block_size": self.cfg.entropy_block_size,
+            "entropy_region_maximum_size": self.cfg.entropy_region_maximum_size,
+            "key_recovery": self.cfg.key_recovery,
+            "transform_scoring": self.cfg.transform_scoring,
+            "fingerprint": self.cfg.fingerprint,
+            "key_plaintext_byte": self.cfg.key_plaintext_byte,
+            "preflight_margin": PREFLIGHT_MARGIN,
+            "preflight_size": self.cfg.preflight_size,
+            "preflight_probes": self.cfg.preflight_probes,
+            "known_keys": len(self.key_index) if self.key_index is not None else 0,
+        }
+
+    def compute_features(self, job: Job, deadline=None):
+        """Return the result for the job's content, to be cached.
+
+        The result has a list of (feature, value, FV options), hex keys to decode children with, the reason
+        for opting out, and whether the time.monotonic() deadline cut the analysis short.
+        The features are None when opting out, otherwise the reason is.
+        """
+        # The sample data is streamed or mapped, never read into memory all at once.
+        stream = job.get_data()
+        if self.preflight_low_entropy(stream):
+            return {"features": None, "children": [], "opt_out": "preflight_low_entropy", "partial": False}
 
         # Use the index_coincidence package to compute the results.
-        widths, baseline = get_features(data)
-        self.add_feature_values("index_of_coincidence", baseline)
+        if self.cfg.memory_map:
+            # Fetching the local copy of the content is timed apart from scoring it.
+            with stage(self.metrics, "read") as timer:
+                path = stream.get_filepath()
+                timer.size = os.path.getsize(path)
+            # Empty content can't be mapped, and has no entropy anyway.
+            if not os.path.getsize(path):
+                return {"features": None, "children": [], "opt_out": "empty", "partial": False}
+
+            # The entropy gate and width scoring share a single pass over mapped content.
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                # Content encoded with a key seen before needs no scoring, whatever its entropy.
+                if self.key_index is not None:
+                    with stage(self.metrics, "known_keys", len(data)):
+                        matches = self.key_index.scanner().scan(data)
+                    if matches:
+                        with stage(self.metrics, "entropy", len(data)):
+                            features = [("entropy", entropy(data), {})]
+                        features += [
+                            ("known_xor_key", match.key.hex(), {"label": match.marker, "offset": match.offset})
+                            for match in matches
+                        ]
+                        return {"features": features, "children": [], "opt_out": None, "partial": False}
+                analysis = analyse_gated(
+                    data,
+                    MINIMUM_ENTROPY,
+                    self.cfg.maximum_width,
+                    self.cfg.sampling_minimum_size,
+                    self.cfg.workers,
+                    self.metrics,
+                    self.cfg.adaptive_scoring,
+                    deadline,
+                )
+                ent = analysis.entropy if analysis is not None else None
+                partial = analysis is not None and analysis.partial
+                if analysis is not None and self.cfg.key_recovery:
+                    if time_left(deadline) > 0:
+                        analysis = analyse_keys(data, analysis, self.cfg.key_plaintext_byte, self.metrics)
+                    else:
+                        partial = True
+                if analysis is not None and self.cfg.transform_scoring:
+                    # Each transform costs about as much as scoring the content exactly with the direct engine.
+                    if len(TRANSFORMS) * scoring_cost(data, self.cfg.maximum_width) <= time_left(deadline):
+                        analysis = analyse_transforms(
+                            data, analysis, self.cfg.maximum_width, workers=self.cfg.workers, metrics=self.metrics
+                        )
+                    else:
+                        partial = True
+                # Content failing the gate may still hold high entropy regions worth scoring alone.
+                # Content passing it is also scored over windows, if it is larger than a window
+                # and the windows are larger than the widths scored in them.
+                # Windows cost about as much as scoring the content exactly, so need that much time left.
+                # They only add to the widths already scored, so the results aren't partial without them.
+                regions = []
+                if analysis is None:
+                    regions, partial = self.score_entropy_regions(data, deadline)
+                elif self.cfg.maximum_width < self.cfg.window_size < len(data):
+                    if scoring_cost(data, self.cfg.maximum_width) > time_left(deadline):
+                        self.logger.debug("skipped windowed scoring, too little of the time budget left")
+                    else:
+                        with stage(self.metrics, "windows", len(data)):
+                            regions = find_regions(
+                                data,
+                                self.cfg.maximum_width,
+                                self.cfg.window_size,
+                                self.cfg.window_step,
+                                self.cfg.workers,
+                            )
+                # Low entropy content is only of interest if a high entropy region in it has a width.
+                if analysis is None and not regions:
+                    return {"features": None, "children": [], "opt_out": "low_entropy", "partial": partial}
+                # The gate stops counting as soon as the entropy is too low, so it's counted again in full.
+                if ent is None:
+                    with stage(self.metrics, "entropy", len(data)):
+                        ent = entropy(data)
+        else:
+            with stage(self.metrics, "entropy_gate") as timer:
+                ent = entropy_stream(stream, self.cfg.stream_chunk_size)
+                timer.size = stream.tell()
+            if ent < MINIMUM_ENTROPY:
+                return {"features": None, "children": [], "opt_out": "low_entropy", "partial": False}
+            stream.seek(0)
+            analysis = analyse_stream(
+                stream, self.cfg.maximum_width, self.cfg.stream_chunk_size, self.cfg.workers, self.metrics, deadline
+            )
+            partial = analysis.partial
+            # Windowed scoring needs random access to the content, and key recovery a second pass over it.
+            regions = []
+
+        features = [("entropy", ent, {})]
+        if analysis is not None:
+            features.extend(self.analysis_features(analysis))
+        # Only keys that decode the content to something resembling plaintext are worth a child.
+        children = []
+        if analysis is not None:
+            children = [recovery.key.hex() for recovery in analysis.keys if recovery.entropy < MINIMUM_ENTROPY]
+        if self.key_index is not None:
+            for key in children:
+                self.key_index.add(bytes.fromhex(key))
+        for region in regions:
+            # Regions locate a width within the content, with the best score of the windows it spans.
+            features.append(
+                (
+                    "index_of_coincidence_region_width",
+                    region.width,
+                    {"label": str(region.score), "offset": region.offset, "size": region.size},
+                )
+            )
+        return {"features": features, "children": children, "opt_out": None, "partial": partial}
+
+    def preflight_low_entropy(self, stream):
+        """Return whether a preflight read of the start and a few blocks of the stream shows it has low entropy.
+
+        The stream is left at its start. Blocks passing the entropy gate may be the start of a high entropy
+        region, so content with any isn't opted out when mapped content is scored in regions.
+        """
+        if self.cfg.preflight_size <= 0:
+            return False
+        block_size = self.cfg.entropy_block_size or REGION_BLOCK_SIZE
+        with stage(self.metrics, "preflight") as timer:
+            preflight = preflight_entropy(stream, self.cfg.preflight_size, self.cfg.preflight_probes, block_size)
+            timer.size = preflight.size
+        stream.seek(0)
+
+        # Having read everything, the preflight is as good as the entropy gate.
+        margin = 0.0 if preflight.complete else PREFLIGHT_MARGIN
+        if preflight.entropy >= MINIMUM_ENTROPY - margin:
+            return False
+        regions = self.cfg.memory_map and self.cfg.entropy_region_maximum_size > 0
+        return not (regions and preflight.block_maximum >= MINIMUM_ENTROPY)
+
+    def score_entropy_regions(self, data, deadline=None):
+        """Return a Region for each width chosen in the high entropy regions of low entropy content.
+
+        Only the regions are scored, so a payload hidden in low entropy content is found without scoring it all.
+        Also return whether the time.monotonic() deadline left any region unscored or partly scored.
+        """
+        if self.cfg.entropy_region_maximum_size <= 0:
+            return [], False
+
+        with stage(self.metrics, "entropy_blocks", len(data)):
+            candidates = entropy_regions(
+                data, MINIMUM_ENTROPY, self.cfg.entropy_block_size, self.cfg.entropy_region_maximum_size
+            )
+        regions = []
+        for offset, size in candidates:
+            if time_left(deadline) <= 0:
+                return regions, True
+            analysis = analyse_region(
+                data,
+                offset,
+                size,
+                self.cfg.maximum_width,
+                workers=self.cfg.workers,
+                metrics=self.metrics,
+                deadline=deadline,
+            )
+            regions.extend(Region(offset, size, width, score) for width, score in analysis.widths)
+            if analysis.partial:
+                return regions, True
+        return regions, False
+
+    def analysis_features(self, analysis):
+        """Return the features for the analysis of the whole content."""
+        features = [("index_of_coincidence", analysis.baseline, {})]
 
-        for width, improved_index in widths:
+        for width, improved_index in analysis.widths:
             # The width is the feature, and has a label with the improved index of coincidence score.
-            self.add_feature_values("index_of_coincidence_width", FV(width, label=str(improved_index)))
+            # Scores estimated from a sample of large content are marked as such.
+            label = str(improved_index)
+            if width in analysis.estimated:
+                label += " (sampled)"
+            features.append(("index_of_coincidence_width", width, {"label": label}))
+        if self.cfg.fingerprint:
+            features.append(("index_of_coincidence_fingerprint", fingerprint(analysis.scores).hex(), {}))
+        for transformed in analysis.transforms:
+            features.append(
+                (
+                    "index_of_coincidence_transform_width",
+                    transformed.width,
+                    {"label": f"{transformed.transform} {transformed.score}"},
+                )
+            )
+        for recovery in analysis.keys:
+            features.append(("index_of_coincidence_key", recovery.key.hex(), {"label": str(recovery.entropy)}))
+        return features
 
 
 def main():
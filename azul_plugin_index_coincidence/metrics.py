@@ -0,0 +1,183 @@
+"""Time the stages of an analysis and count what they processed, aggregated for Prometheus or JSON.
+
+Stages are timed with a monotonic clock into histograms, along with the bytes each stage processed.
+Counters record other events, such as widths evaluated and the reason content was opted out.
+Code being measured takes an optional Metrics, and stage(None, ...) costs next to nothing.
+"""
+
+import http.server
+import json
+import os
+import threading
+import time
+
+# Upper bounds of the stage duration histogram buckets in seconds, the same as the Prometheus client defaults.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Prefix of every exported metric name.
+PREFIX = "index_coincidence"
+
+
+class _Stage:
+    """Times one run of a stage, and records it in the metrics when it finishes."""
+
+    def __init__(self, metrics, name, size):
+        self.metrics = metrics
+        self.name = name
+        # Bytes processed by the stage, which can be set once known.
+        self.size = size
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, self.size)
+
+
+class _NullStage:
+    """Stands in for a stage when nothing is being measured."""
+
+    size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def __setattr__(self, name, value):
+        pass
+
+
+NULL_STAGE = _NullStage()
+
+
+def stage(metrics, name, size=0):
+    """Return a context manager timing the named stage in metrics, or doing nothing if metrics is None."""
+    if metrics is None:
+        return NULL_STAGE
+    return metrics.stage(name, size)
+
+
+def count(metrics, name, value=1, **labels):
+    """Add value to the named counter in metrics, unless metrics is None."""
+    if metrics is not None:
+        metrics.count(name, value, **labels)
+
+
+class Metrics:
+    """Stage duration histograms and counters, aggregated across every job measured.
+
+    Durations of the stages in the most recent job are also kept in last_job, for attaching to its results.
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        # Stage name to bucket counts, with a final bucket for everything, and the sum of durations.
+        self.histograms = {}
+        self.sums = {}
+        # (name, sorted label items) to value.
+        self.counters = {}
+        self.last_job = {}
+
+    def start_job(self):
+        """Start recording the stages of a new job in last_job."""
+        self.last_job = {}
+
+    def stage(self, name, size=0):
+        """Return a context manager timing the named stage, with the number of bytes it processed."""
+        return _Stage(self, name, size)
+
+    def observe(self, name, seconds, size=0):
+        """Record a run of the named stage that took seconds and processed size bytes."""
+        with self.lock:
+            histogram = self.histograms.setdefault(name, [0] * (len(self.buckets) + 1))
+            for index, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram[index] += 1
+            histogram[-1] += 1
+            self.sums[name] = self.sums.get(name, 0.0) + seconds
+            self.last_job[name] = self.last_job.get(name, 0.0) + seconds
+        if size:
+            self.count("stage_bytes", size, stage=name)
+
+    def count(self, name, value=1, **labels):
+        """Add value to the named counter with the given labels."""
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def snapshot(self):
+        """Return every metric as a JSON-serialisable dictionary."""
+        with self.lock:
+            return {
+                "stages": {
+                    name: {
+                        "buckets": dict(
+                            zip([str(bound) for bound in self.buckets] + ["+Inf"], histogram, strict=True)
+                        ),
+                        "count": histogram[-1],
+                        "sum": self.sums[name],
+                    }
+                    for name, histogram in self.histograms.items()
+                },
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in self.counters.items()
+                ],
+            }
+
+    def prometheus(self):
+        """Return every metric in the Prometheus text exposition format."""
+        lines = [f"# TYPE {PREFIX}_stage_seconds histogram"]
+        with self.lock:
+            for name, histogram in sorted(self.histograms.items()):
+                for bound, total in zip([str(bound) for bound in self.buckets] + ["+Inf"], histogram, strict=True):
+                    lines.append(f'{PREFIX}_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {total}')
+                lines.append(f'{PREFIX}_stage_seconds_sum{{stage="{name}"}} {self.sums[name]}')
+                lines.append(f'{PREFIX}_stage_seconds_count{{stage="{name}"}} {histogram[-1]}')
+
+            declared = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in declared:
+                    lines.append(f"# TYPE {PREFIX}_{name}_total counter")
+                    declared.add(name)
+                label_text = ",".join(f'{key}="{label}"' for key, label in labels)
+                lines.append(f"{PREFIX}_{name}_total{{{label_text}}} {value}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path):
+        """Write every metric to path, as JSON if it ends with .json and Prometheus text otherwise.
+
+        The file is replaced in one step, so readers never see it half written.
+        """
+        text = json.dumps(self.snapshot()) if path.endswith(".json") else self.prometheus()
+        partial = f"{path}.tmp"
+        with open(partial, "w") as f:
+            f.write(text)
+        os.replace(partial, path)
+
+    def serve(self, port, host="127.0.0.1"):
+        """Serve the metrics in Prometheus text format over HTTP on host and port, from a background thread.
+
+        Only the loopback interface is served by default. Raises OSError if the port can't be bound.
+        """
+        metrics = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
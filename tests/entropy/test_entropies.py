@@ -1,3 +1,5 @@
+import array
+import random
 import unittest
 
 from azul_plugin_index_coincidence import entropy
@@ -56,3 +58,67 @@ class EntropiesTest(unittest.TestCase):
         self.assertGreater(ent[2], 0)
         self.assertLessEqual(ent[1], len(buf))
         self.assertAllAlmostEqual(ent[0], [8.0] * ent[2])
+
+    def test_buffers(self):
+        buf = bytearray([x for x in range(TEST_BLOCK_SIZE)] * TEST_BLOCK_COUNT)
+
+        ent = entropy.block_entropies(memoryview(buf), TEST_BLOCK_SIZE)
+        self.assertAllAlmostEqual(ent[0], [8.0] * TEST_BLOCK_COUNT)
+        self.assertEqual(ent[1:], [TEST_BLOCK_SIZE, TEST_BLOCK_COUNT])
+
+        ent = entropy.count_entropies(buf, TEST_BLOCK_COUNT)
+        self.assertAllAlmostEqual(ent[0], [8.0] * TEST_BLOCK_COUNT)
+        self.assertEqual(ent[1:], [TEST_BLOCK_SIZE, TEST_BLOCK_COUNT])
+
+    def test_negative(self):
+        with self.assertRaises(ValueError):
+            entropy.block_entropies(b"\x00" * TEST_BLOCK_SIZE, -1)
+        with self.assertRaises(ValueError):
+            entropy.count_entropies(b"\x00" * TEST_BLOCK_SIZE, -1)
+
+    def test_regions(self):
+        """Test runs of high entropy blocks are merged into regions, largest first within the size limit."""
+        high = bytes(bytearray([x for x in range(TEST_BLOCK_SIZE)]))
+        low = b"\x00" * TEST_BLOCK_SIZE
+        buf = low + high * 3 + low + high + low
+
+        regions = entropy.entropy_regions(buf, 6.0, TEST_BLOCK_SIZE)
+        self.assertEqual(regions, [(TEST_BLOCK_SIZE, 3 * TEST_BLOCK_SIZE), (5 * TEST_BLOCK_SIZE, TEST_BLOCK_SIZE)])
+
+        regions = entropy.entropy_regions(buf, 6.0, TEST_BLOCK_SIZE, 3 * TEST_BLOCK_SIZE + 10)
+        self.assertEqual(regions, [(TEST_BLOCK_SIZE, 3 * TEST_BLOCK_SIZE), (5 * TEST_BLOCK_SIZE, 10)])
+
+        self.assertEqual(entropy.entropy_regions(buf, 6.0, TEST_BLOCK_SIZE, 0), [])
+        self.assertEqual(entropy.entropy_regions(low * 4, 6.0, TEST_BLOCK_SIZE), [])
+
+    def test_sliding(self):
+        """Test sliding windows match the entropy of each window computed alone, in a compact array."""
+        rng = random.Random(1)
+        buf = bytes(rng.choices(range(256), weights=range(1, 257), k=20_000)) + b"\x00" * 1000
+
+        for window, step in [(1000, 1), (1000, 7), (256, 256), (300, 1000)]:
+            ents = entropy.sliding_entropies(buf, window, step)
+            self.assertIsInstance(ents, array.array)
+            self.assertEqual(ents.typecode, "d")
+            expected = [
+                entropy.entropy(buf[start : start + window]) for start in range(0, len(buf) - window + 1, step)
+            ]
+            self.assertAllAlmostEqual(ents, expected, places=9)
+
+        # The last window is all zero bytes, and windows must fit in the buffer.
+        self.assertAlmostEqual(entropy.sliding_entropies(buf, 1000, 1)[-1], 0.0)
+        self.assertEqual(len(entropy.sliding_entropies(buf[:999], 1000)), 0)
+        self.assertEqual(len(entropy.sliding_entropies(memoryview(buf), len(buf))), 1)
+
+        # Windows too large for the table of counts compute each term instead.
+        window = 1024 * 1024 + 1
+        large = buf * (window // len(buf) + 1)
+        ents = entropy.sliding_entropies(large, window, 4096)
+        self.assertEqual(len(ents), (len(large) - window) // 4096 + 1)
+        self.assertAlmostEqual(ents[0], entropy.entropy(large[:window]), places=9)
+        self.assertAlmostEqual(ents[-1], entropy.entropy(large[4096 * (len(ents) - 1) :][:window]), places=9)
+
+        with self.assertRaises(ValueError):
+            entropy.sliding_entropies(buf, 0)
+        with self.assertRaises(ValueError):
+            entropy.sliding_entropies(buf, 256, 0)
@@ -1,4 +1,7 @@
+import mmap
+import tempfile
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 from math import log
 from random import randrange
 
@@ -44,7 +47,36 @@ class EntropyTest(unittest.TestCase):
         ent = entropy.entropy(buf)
         self.assertAlmostEqual(ent, ent_baseline)
 
+    def test_counts(self):
+        # byte counts either side of the lookup table and lane sizes, checked
+        # against the definition to within 1e-9
+        for size in [1, 3, 5, 255, 65535, 65536, 65537, 300001]:
+            buf = bytes(bytearray([randrange(0, 7) ** 2 for _ in range(size)]))
+            pr = [buf.count(bytes([x])) / size for x in range(256)]
+            ent_baseline = -1 * sum(x * log(x, 2) if x > 0 else 0.0 for x in pr)
+            self.assertAlmostEqual(entropy.entropy(buf), ent_baseline, places=9)
+
+        # a single repeated value is never reported just below or above zero
+        self.assertEqual(entropy.entropy(b"\x41" * 100003), 0.0)
+
     def test_kwargs(self):
         buf = bytes(bytearray([x for x in range(TEST_BUF_LEN)]))
         ent = entropy.entropy(buf=buf)
         self.assertAlmostEqual(ent, 8.0)
+
+    def test_buffers(self):
+        buf = bytes(bytearray([x for x in range(TEST_BUF_LEN)]))
+        self.assertAlmostEqual(entropy.entropy(bytearray(buf)), 8.0)
+        self.assertAlmostEqual(entropy.entropy(memoryview(buf)[: TEST_BUF_LEN // 2]), 7.0)
+
+        with tempfile.TemporaryFile() as fh:
+            fh.write(buf)
+            fh.flush()
+            with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                self.assertAlmostEqual(entropy.entropy(mapped), 8.0)
+
+    def test_threads(self):
+        bufs = [bytes(bytearray([x % (n + 1) for x in range(1 << 20)])) for n in range(8)]
+        with ThreadPoolExecutor(4) as pool:
+            ents = list(pool.map(entropy.entropy, bufs))
+        self.assertEqual(ents, [entropy.entropy(buf) for buf in bufs])
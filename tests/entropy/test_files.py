@@ -1,4 +1,6 @@
+import io
 import os
+import random
 import tempfile
 import unittest
 
@@ -33,6 +35,15 @@ class EntropyFilesTest(unittest.TestCase):
             if fpath:
                 os.unlink(fpath)
 
+    def test_empty_file(self):
+        fd, fpath = tempfile.mkstemp()
+        try:
+            self.assertEqual(entropy.entropy_file(fpath, use_mmap=True), 0.0)
+            self.assertEqual(entropy.block_entropies_file(fpath, 0, use_mmap=True), [[], 0, 0])
+        finally:
+            os.close(fd)
+            os.unlink(fpath)
+
     def test_entropies(self):
         buf = bytes(bytearray([0x41]) * TEST_BLOCK_SIZE * TEST_BLOCK_COUNT)
 
@@ -54,3 +65,70 @@ class EntropyFilesTest(unittest.TestCase):
                 os.close(fd)
             if fpath:
                 os.unlink(fpath)
+
+
+class EntropyStreamTest(unittest.TestCase):
+    def assertAllAlmostEqual(self, first, second, places=7, msg=None):
+        self.assertEqual(len(first), len(second), msg)
+        self.assertEqual(
+            [round(x - y, places) for x, y in zip(first, second)],
+            [0.0] * len(first),
+            msg,
+        )
+
+    def test_entropy_stream(self):
+        buf = bytes(bytearray([random.randrange(0, 256) for _ in range(10000)]))
+        self.assertAlmostEqual(entropy.entropy_stream(io.BytesIO(buf), chunk_size=333), entropy.entropy(buf))
+        self.assertEqual(entropy.entropy_stream(io.BytesIO(b"")), 0.0)
+
+    def test_preflight_entropy(self):
+        """Preflights read the prefix and probes, and are exact when they read everything."""
+        buf = bytes(TEST_BLOCK_SIZE * TEST_BLOCK_COUNT) + random.randbytes(TEST_BLOCK_SIZE * 4)
+        preflight = entropy.preflight_entropy(io.BytesIO(buf), len(buf) * 2)
+        self.assertAlmostEqual(preflight.entropy, entropy.entropy(buf))
+        self.assertEqual((preflight.size, preflight.complete), (len(buf), True))
+
+        # The random tail is missed by the prefix, and found by a probe at the end.
+        preflight = entropy.preflight_entropy(io.BytesIO(buf), 1000, block_size=TEST_BLOCK_SIZE)
+        self.assertEqual(preflight, entropy.Preflight(0.0, 0.0, 1000, False))
+        preflight = entropy.preflight_entropy(io.BytesIO(buf), 1000, probes=3, block_size=TEST_BLOCK_SIZE)
+        self.assertEqual((preflight.size, preflight.complete), (1000 + 3 * TEST_BLOCK_SIZE, False))
+        self.assertGreater(preflight.entropy, 0.0)
+        self.assertGreater(preflight.block_maximum, 7.0)
+
+        # Probes that would overlap read the rest whole.
+        preflight = entropy.preflight_entropy(
+            io.BytesIO(buf), 1000, probes=TEST_BLOCK_COUNT + 4, block_size=TEST_BLOCK_SIZE
+        )
+        self.assertAlmostEqual(preflight.entropy, entropy.entropy(buf))
+        self.assertEqual((preflight.size, preflight.complete), (len(buf), True))
+
+    def test_chunked_files(self):
+        """Small chunks give the same results as processing the whole file at once."""
+        buf = bytes(bytearray([random.randrange(0, 256) for _ in range(TEST_BLOCK_SIZE * TEST_BLOCK_COUNT + 100)]))
+
+        fd = None
+        fpath = None
+        try:
+            fd, fpath = tempfile.mkstemp()
+            self.assertEqual(os.write(fd, buf), len(buf))
+
+            self.assertAlmostEqual(entropy.entropy_file(fpath, chunk_size=1000), entropy.entropy(buf))
+            self.assertAlmostEqual(entropy.entropy_file(fpath, use_mmap=True), entropy.entropy(buf))
+            for block_size in [0, 300, 1000]:
+                ent = entropy.block_entropies_file(fpath, block_size, chunk_size=1000)
+                expected = entropy.block_entropies(buf, block_size)
+                self.assertAllAlmostEqual(ent[0], expected[0])
+                self.assertEqual(ent[1:], expected[1:])
+                self.assertEqual(entropy.block_entropies_file(fpath, block_size, use_mmap=True), expected)
+            for block_count in [0, 7, TEST_BLOCK_COUNT]:
+                ent = entropy.count_entropies_file(fpath, block_count, chunk_size=1000)
+                expected = entropy.count_entropies(buf, block_count)
+                self.assertAllAlmostEqual(ent[0], expected[0])
+                self.assertEqual(ent[1:], expected[1:])
+                self.assertEqual(entropy.count_entropies_file(fpath, block_count, use_mmap=True), expected)
+        finally:
+            if fd:
+                os.close(fd)
+            if fpath:
+                os.unlink(fpath)
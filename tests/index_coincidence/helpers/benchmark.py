@@ -0,0 +1,321 @@
+"""Benchmark width scoring and entropy on deterministic synthetic corpora, and check for regressions.
+
+Random, text, PE-like and compressed corpora are generated from fixed seeds and XOR encoded at a range of
+key widths with encode.py. Each engine is run in a fresh process per corpus size, reporting throughput,
+latency percentiles and peak RSS, along with the recall and precision of the key widths it chose.
+
+Timings depend on the machine, so each sample is also run through a reference workload that none of the
+code under test takes part in, and the baseline keeps each engine's throughput as a ratio to the reference
+workload's on the same samples, along with the accuracy of each engine.
+
+Run from this directory with the package installed:
+
+    python benchmark.py                   # compare with benchmark_baseline.json, exit 1 on a regression
+    python benchmark.py --save-baseline   # record the results as the new baseline
+    python benchmark.py --sizes 1K 100M --engines direct gated
+"""
+
+import argparse
+import functools
+import json
+import multiprocessing
+import os
+import random
+import resource
+import statistics
+import sys
+import time
+import zlib
+
+import numpy as np
+from encode import random_key, xor_encode
+
+from azul_plugin_index_coincidence.entropy import entropy
+from azul_plugin_index_coincidence.index_coincidence.main import (
+    ENGINE_AUTOCORRELATION,
+    ENGINE_DIRECT,
+    MAXIMUM_WIDTH,
+    analyse_gated,
+    compute_adaptive_width_scores,
+    compute_sampled_width_scores,
+    compute_width_scores,
+    filter_width_scores,
+)
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+# Corpora are built from independently seeded units, so large corpora don't repeat themselves.
+UNIT_SIZE = 1024 * 1024
+
+KINDS = ["random", "text", "pe", "compressed"]
+SIZES = ["1K", "64K", "1M", "16M"]
+# Width zero leaves the corpus unencoded, to count widths chosen where there is no key.
+WIDTHS = [0, 3, 16, 29, 100, 255]
+ENGINES = ["direct", "autocorrelation", "sampled", "adaptive", "gated", "entropy"]
+
+# Throughput may fall this far below the baseline before it is a regression, to allow for noisy timings.
+THROUGHPUT_TOLERANCE = 0.25
+
+
+# Plugin entropy gate, used by the gated engine.
+MINIMUM_ENTROPY = 6.0
+
+WORDS = (
+    b"the of and to in is that it was for on are as with his they at be this from have or by one had not but "
+    b"what all were when we there can an your which their said if do will each about how up out them then she "
+    b"many some so these would other into has more her two like him see time could no make than first been its"
+).split()
+
+
+def parse_size(text):
+    """Return the number of bytes in a size such as 512, 64K or 100M."""
+    units = {"K": 1024, "M": 1024 * 1024, "G": 1024 * 1024 * 1024}
+    if text[-1].upper() in units:
+        return int(text[:-1]) * units[text[-1].upper()]
+    return int(text)
+
+
+def text_unit(rng, size):
+    """Return size bytes of English-like text."""
+    words = [WORDS[i] for i in rng.integers(0, len(WORDS), size // 3 + 1)]
+    lines = [b" ".join(words[i : i + 12]) for i in range(0, len(words), 12)]
+    return b"\n".join(lines)[:size]
+
+
+def pe_unit(rng, size):
+    """Return size bytes laid out like a PE file: header, code, strings and mostly empty data."""
+    header = bytearray(1024)
+    header[:2] = b"MZ"
+    header[0x3C:0x40] = (0x80).to_bytes(4, "little")
+    header[0x40:0x67] = b"This program cannot be run in DOS mode."
+    header[0x80:0x84] = b"PE\x00\x00"
+
+    # Instruction bytes are far from uniform, common opcodes and small immediates dominate.
+    opcodes = np.array([0x00, 0x8B, 0x89, 0x48, 0xE8, 0xFF, 0x83, 0x0F, 0xC3, 0xCC, 0x90, 0x24, 0x45, 0x4C])
+    weights = np.array([6, 4, 4, 4, 2, 3, 2, 2, 1, 1, 1, 1, 1, 1])
+    code = rng.choice(opcodes, size // 2, p=weights / weights.sum())
+    operands = rng.random(size // 2) < 0.3
+    code[operands] = rng.integers(0, 256, np.count_nonzero(operands))
+    strings = b"\x00".join(text_unit(rng, size // 4).split(b" "))
+    data = np.where(rng.random(size // 4) < 0.1, rng.integers(0, 256, size // 4), 0)
+    return (bytes(header) + code.astype(np.uint8).tobytes() + strings + data.astype(np.uint8).tobytes())[:size]
+
+
+def compressed_unit(rng, size):
+    """Return size bytes of text compressed with zlib at its default level."""
+    out = b""
+    while len(out) < size:
+        out += zlib.compress(text_unit(rng, 4 * size))
+    return out[:size]
+
+
+def random_unit(rng, size):
+    """Return size uniformly random bytes."""
+    return rng.integers(0, 256, size, dtype=np.uint8).tobytes()
+
+
+UNITS = {"random": random_unit, "text": text_unit, "pe": pe_unit, "compressed": compressed_unit}
+
+
+@functools.lru_cache(maxsize=1)
+def make_corpus(kind, size, seed=0):
+    """Return size bytes of the given kind of corpus, the same every time for the same seed."""
+    units = []
+    for index in range(0, size, UNIT_SIZE):
+        rng = np.random.default_rng([seed, KINDS.index(kind), index // UNIT_SIZE])
+        units.append(UNITS[kind](rng, min(UNIT_SIZE, size - index)))
+    return b"".join(units)
+
+
+def make_sample(kind, size, width, seed=0):
+    """Return the corpus XOR encoded with a random key of the given width, or unencoded for width zero."""
+    data = make_corpus(kind, size, seed)
+    if not width:
+        return data
+    return xor_encode(data, random_key(width, random.Random(f"{seed}/{kind}/{size}/{width}")))
+
+
+def run_engine(engine, data):
+    """Run an engine over the data, returning the widths it chose, or None if it doesn't choose widths."""
+    if engine == "entropy":
+        entropy(data)
+        return None
+    if engine == "direct":
+        scores = compute_width_scores(data, MAXIMUM_WIDTH, ENGINE_DIRECT)
+    elif engine == "autocorrelation":
+        scores = compute_width_scores(data, MAXIMUM_WIDTH, ENGINE_AUTOCORRELATION)
+    elif engine == "sampled":
+        scores, _ = compute_sampled_width_scores(data, MAXIMUM_WIDTH)
+    elif engine == "adaptive":
+        scores, _ = compute_adaptive_width_scores(data, MAXIMUM_WIDTH)
+    elif engine == "gated":
+        # The plugin's path for mapped content, which opts out low entropy data.
+        analysis = analyse_gated(data, MINIMUM_ENTROPY, MAXIMUM_WIDTH)
+        return [] if analysis is None else [width for width, _ in analysis.widths]
+    else:
+        raise ValueError(f"unknown engine {engine!r}, expected one of {ENGINES}")
+    return [width for width, _ in filter_width_scores(scores)] if scores else []
+
+
+def run_group(engine, size, kinds, widths, repeat):
+    """Benchmark one engine on every sample of one size, returning its results.
+
+    Run in a fresh process so peak RSS belongs to this engine and size alone.
+    """
+    latencies = []
+    reference_seconds = 0.0
+    total = 0
+    accuracy = {}
+    for kind in kinds:
+        found = chosen = correct = keyed = 0
+        for width in widths:
+            data = make_sample(kind, size, width)
+            for _ in range(repeat):
+                start = time.perf_counter()
+                result = run_engine(engine, data)
+                latencies.append(time.perf_counter() - start)
+                total += len(data)
+                # Timed next to each run, so both see the same state of the machine.
+                start = time.perf_counter()
+                reference_workload(data)
+                reference_seconds += time.perf_counter() - start
+            if result is None:
+                continue
+            keyed += bool(width)
+            found += width in result
+            chosen += len(result)
+            correct += result.count(width) if width else 0
+        if engine != "entropy":
+            # Recall is the share of keys whose width was chosen, precision the share of chosen widths that were keys.
+            accuracy[kind] = {
+                "recall": found / keyed if keyed else 1.0,
+                "precision": correct / chosen if chosen else 1.0,
+            }
+
+    latencies.sort()
+    return {
+        "throughput": total / sum(latencies) / 1e6,
+        "reference_throughput": total / reference_seconds / 1e6,
+        "p50": statistics.median(latencies),
+        "p90": latencies[int(0.9 * (len(latencies) - 1))],
+        "p99": latencies[int(0.99 * (len(latencies) - 1))],
+        # Linux reports the high water mark in KiB.
+        "peak_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "accuracy": accuracy,
+    }
+
+
+def reference_workload(data):
+    """Count the byte values of data with NumPy, which every engine's throughput is compared with.
+
+    None of the code under test takes part, so a regression in any engine, the direct engine included,
+    shows as a lower ratio, while a slower or faster machine slows or speeds both alike.
+    """
+    np.bincount(np.frombuffer(data, dtype=np.uint8), minlength=256)
+
+
+def relative_throughput(result):
+    """Return the throughput of a result as a ratio to the reference workload's on the same samples."""
+    return result["throughput"] / result["reference_throughput"]
+
+
+def baseline_entries(results):
+    """Return the results as baseline entries, keeping only what doesn't depend on the machine."""
+    return {
+        key: {"accuracy": result["accuracy"], "relative_throughput": relative_throughput(result)}
+        for key, result in results.items()
+    }
+
+
+def compare(results, baseline, tolerance=THROUGHPUT_TOLERANCE):
+    """Return a description of each regression in the results against the baseline."""
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        expected = baseline[key]
+        ratio = relative_throughput(result)
+        before = expected.get("relative_throughput")
+        if before is not None and ratio < before * (1 - tolerance):
+            regressions.append(f"{key}: throughput {ratio:.3f} times the reference, baseline {before:.3f} times")
+        # Corpora are deterministic, so any drop in accuracy is a real change.
+        for kind, accuracy in result["accuracy"].items():
+            for measure, value in accuracy.items():
+                before = expected["accuracy"].get(kind, {}).get(measure)
+                if before is not None and value < before:
+                    regressions.append(f"{key}: {kind} {measure} {value:.3f}, baseline {before:.3f}")
+    return regressions
+
+
+def main():
+    """Run the benchmarks and report results, comparing them with or saving them as the baseline."""
+    parser = argparse.ArgumentParser(description="Benchmark width scoring on synthetic XOR corpora.")
+    parser.add_argument("--engines", nargs="+", default=ENGINES, choices=ENGINES)
+    parser.add_argument("--sizes", nargs="+", default=SIZES, help="Corpus sizes, such as 1K, 64K or 100M.")
+    parser.add_argument("--kinds", nargs="+", default=KINDS, choices=KINDS)
+    parser.add_argument("--widths", nargs="+", type=int, default=WIDTHS, help="Key widths, zero for no key.")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs of each sample.")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="Baseline results file.")
+    parser.add_argument("--save-baseline", action="store_true", help="Save the results as the baseline.")
+    parser.add_argument("--output", help="Also write the results as JSON to this file.")
+    args = parser.parse_args()
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    print(
+        "%-28s %10s %9s %9s %9s %9s %9s  %s"
+        % ("engine/size", "MB/s", "ratio", "p50 s", "p90 s", "p99 s", "RSS MiB", "recall")
+    )
+    for engine in args.engines:
+        for size in args.sizes:
+            with context.Pool(1) as pool:
+                result = pool.apply(run_group, (engine, parse_size(size), args.kinds, args.widths, args.repeat))
+            key = f"{engine}/{size}"
+            results[key] = result
+            recall = " ".join(f"{kind}={accuracy['recall']:.2f}" for kind, accuracy in result["accuracy"].items())
+            print(
+                "%-28s %10.1f %9.4f %9.4f %9.4f %9.4f %9.1f  %s"
+                % (
+                    key,
+                    result["throughput"],
+                    relative_throughput(result),
+                    result["p50"],
+                    result["p90"],
+                    result["p99"],
+                    result["peak_rss"],
+                    recall,
+                )
+            )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(baseline_entries(results))
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Saved baseline to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --save-baseline to record one")
+        return
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f))
+    if regressions:
+        print("\nREGRESSIONS:")
+        for regression in regressions:
+            print(f"\t{regression}")
+        sys.exit(1)
+    print("\nNo regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,46 @@
 import random
 import sys
 
+import numpy as np
+
 """
 Obfuscate the given file by generating a random XOR key with length from 2 up
 to 300. The output filename is based on the original name, but includes the key
 length.
 """
-filename = sys.argv[1]
-with open(filename, "rb") as f:
-    data = bytearray(f.read())
 
-width = random.randint(2, 300)
-key = [random.randint(0, 255) for i in range(width)]
 
-for i in range(len(data)):
-    data[i] ^= key[i % len(key)]
+def random_key(width, rng=random):
+    """Return a random XOR key of the given width."""
+    return bytes(rng.randint(0, 255) for i in range(width))
+
+
+def xor_encode(data, key):
+    """Return data XORed with the key repeated along its length."""
+    data = np.frombuffer(data, dtype=np.uint8)
+    return (data ^ np.resize(np.frombuffer(key, dtype=np.uint8), len(data))).tobytes()
+
+
+def pe_like(length, rng=random):
+    """Return data dominated by zero bytes, like the data sections of an executable."""
+    return bytes(rng.choices(range(256), weights=[40] + [1] * 255, k=length))
+
+
+def xor_sample(length, key_width, seed):
+    """Return PE-like data XORed with a random key of the given width, both drawn from seed."""
+    rng = random.Random(seed)
+    key = random_key(key_width, rng)
+    return xor_encode(pe_like(length, rng), key)
+
+
+if __name__ == "__main__":
+    filename = sys.argv[1]
+    with open(filename, "rb") as f:
+        data = f.read()
+
+    width = random.randint(2, 300)
+    key = random_key(width)
 
-outname = "%s_%03d.enc" % (filename, width)
-with open(outname, "wb") as f:
-    f.write(data)
+    outname = "%s_%03d.enc" % (filename, width)
+    with open(outname, "wb") as f:
+        f.write(xor_encode(data, key))
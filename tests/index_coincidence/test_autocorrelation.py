@@ -0,0 +1,70 @@
+import random
+import unittest
+
+from azul_plugin_index_coincidence.index_coincidence.autocorrelation import (
+    autocorrelation_matches,
+    transform_size,
+)
+from azul_plugin_index_coincidence.index_coincidence.main import (
+    ENGINE_AUTOCORRELATION,
+    ENGINE_DIRECT,
+    choose_engine,
+    compute_width_scores,
+    get_features,
+)
+
+
+class TestAutocorrelation(unittest.TestCase):
+    def test_transform_size(self):
+        """
+        Test transform sizes are the smallest 5-smooth number at least as large as requested.
+        """
+        self.assertEqual(transform_size(1), 1)
+        self.assertEqual(transform_size(7), 8)
+        self.assertEqual(transform_size(11), 12)
+        self.assertEqual(transform_size(1000), 1000)
+        self.assertEqual(transform_size(1001), 1024)
+        self.assertEqual(transform_size(4097), 4320)
+
+    def test_matches_direct_engine(self):
+        """
+        Test the autocorrelation engine counts exactly the same matches as the direct engine.
+        """
+        rng = random.Random(42)
+        for length in [0, 1, 2, 3, 50, 999, 20000]:
+            # Skewed data exercises both the FFT and the position pairing paths.
+            data = bytes(rng.choice([0, 0, 0, 0, 7, rng.randrange(256)]) for _ in range(length))
+            for maximum_width in [1, 300, 5000]:
+                self.assertEqual(
+                    compute_width_scores(data, maximum_width, ENGINE_AUTOCORRELATION),
+                    compute_width_scores(data, maximum_width, ENGINE_DIRECT),
+                )
+
+        self.assertEqual(autocorrelation_matches(b"\x01\x02\x01\x02", 10), [0, 2, 0])
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            compute_width_scores(b"abcd", engine="unknown")
+
+    def test_choose_engine(self):
+        """
+        Test the autocorrelation engine is picked once the direct engine would be much slower.
+        """
+        self.assertEqual(choose_engine(b"", 300), ENGINE_DIRECT)
+        self.assertEqual(choose_engine(bytes(list(range(256))) * 256, 300), ENGINE_DIRECT)
+        self.assertEqual(choose_engine(bytes(1 << 20), 1 << 19), ENGINE_AUTOCORRELATION)
+
+    def test_long_key_width(self):
+        """
+        Test keys longer than the default maximum width are found when the width range is raised.
+        """
+        rng = random.Random(7)
+        key = bytes(rng.randrange(256) for _ in range(1024))
+        data = bytes(rng.randrange(4) ^ key[i % len(key)] for i in range(64 * 1024))
+
+        widths, _ = get_features(data, 4096)
+        self.assertEqual([width for width, _ in widths], [1024])
+
+
+if __name__ == "__main__":
+    unittest.main()
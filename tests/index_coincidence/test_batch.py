@@ -0,0 +1,135 @@
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from azul_plugin_index_coincidence.index_coincidence.batch import (
+    analyse_file,
+    index_records,
+    iter_paths,
+    run_batch,
+    write_records,
+)
+from azul_plugin_index_coincidence.index_coincidence.fingerprint import FingerprintIndex, fingerprint
+from azul_plugin_index_coincidence.index_coincidence.main import analyse
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+        os.makedirs(os.path.join(self.root, "b", "c"))
+        self.data = bytes(list(range(256))) * 8
+        self.paths = []
+        for name in ["a", os.path.join("b", "d"), os.path.join("b", "c", "e")]:
+            path = os.path.join(self.root, name)
+            with open(path, "wb") as f:
+                f.write(self.data)
+            self.paths.append(path)
+        self.empty = os.path.join(self.root, "empty")
+        open(self.empty, "wb").close()
+        self.short = os.path.join(self.root, "short")
+        with open(self.short, "wb") as f:
+            f.write(b"x")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_iter_paths(self):
+        """
+        Test directories are walked recursively, files before subdirectories, and stdin gives a list of paths.
+        """
+        self.assertEqual(list(iter_paths([os.path.join(self.root, "b")])), self.paths[1:])
+        stdin = io.StringIO(f"{self.paths[0]}\n\n{os.path.join(self.root, 'b')}\n")
+        self.assertEqual(list(iter_paths(["-", "x"], stdin)), self.paths + ["x"])
+
+    def test_analyse_file(self):
+        record = analyse_file(self.paths[0])
+        analysis = analyse(self.data)
+        self.assertEqual(record["path"], self.paths[0])
+        self.assertEqual(record["size"], len(self.data))
+        self.assertEqual(record["baseline"], analysis.baseline)
+        self.assertEqual(record["widths"], [[256, 1.0]])
+        self.assertEqual(record["scores"], [list(score) for score in analysis.scores])
+        self.assertAlmostEqual(record["entropy"], 8.0)
+        self.assertEqual(record["estimated"], [])
+        self.assertEqual(record["fingerprint"], fingerprint(analysis.scores).hex())
+        self.assertGreaterEqual(record["seconds"], 0.0)
+
+        # Files that can't be analysed give an error rather than stopping the batch.
+        self.assertIn("error", analyse_file(self.empty))
+        self.assertIn("error", analyse_file(self.short))
+        self.assertIn("error", analyse_file(self.paths[0], maximum_width=0))
+        self.assertIn("error", analyse_file(os.path.join(self.root, "missing")))
+
+    def test_run_batch(self):
+        """
+        Test a batch gives one record per file, in path order when requested, even with files too short to score.
+        """
+        paths = list(iter_paths([self.root]))
+        self.assertIn(self.short, paths)
+        records = list(run_batch(paths, processes=2, ordered=True))
+        self.assertEqual([record["path"] for record in records], paths)
+        errors = [record["path"] for record in records if "error" in record]
+        self.assertEqual(sorted(errors), sorted([self.empty, self.short]))
+
+        records = list(run_batch(paths, processes=2))
+        self.assertEqual(sorted(record["path"] for record in records), sorted(paths))
+
+        out = io.StringIO()
+        write_records(records, out)
+        self.assertEqual([json.loads(line) for line in out.getvalue().splitlines()], records)
+
+    def test_batch_options(self):
+        """
+        Test keys and transform widths are added to batch records when requested, including from the command line.
+        """
+        key = [256, bytes(range(256)).hex(), 0.0]
+        records = list(run_batch(self.paths, processes=2, ordered=True, plaintext=0, transforms=True, workers=2))
+        for record in records:
+            self.assertEqual(record["keys"], [key])
+            self.assertEqual(record["transforms"], [])
+        self.assertNotIn("keys", analyse_file(self.paths[0]))
+        self.assertEqual(analyse_file(self.paths[0], adaptive=True)["widths"], [[256, 1.0]])
+
+        output = subprocess.run(
+            [sys.executable, "-m", "azul_plugin_index_coincidence.index_coincidence.cli", "--no-daemon"]
+            + ["--recover-keys", "--plaintext-byte", "0x20", self.paths[0], self.paths[1]],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout
+        records = [json.loads(line) for line in output.splitlines()]
+        self.assertEqual(sorted(record["path"] for record in records), self.paths[:2])
+        for record in records:
+            self.assertEqual(record["keys"], [[256, bytes(byte ^ 0x20 for byte in range(256)).hex(), 0.0]])
+
+        # A width range with no widths in it is refused before any file is analysed.
+        result = subprocess.run(
+            [sys.executable, "-m", "azul_plugin_index_coincidence.index_coincidence.cli", "--no-daemon"]
+            + ["--maximum-width", "0", self.paths[0]],
+            capture_output=True,
+            text=True,
+        )
+        self.assertEqual(result.returncode, 2)
+        self.assertIn("--maximum-width must be at least 1", result.stderr)
+
+    def test_index_records(self):
+        """
+        Test records are added to a fingerprint index, and given the similar files already in it if requested.
+        """
+        index = FingerprintIndex()
+        records = [analyse_file(path) for path in self.paths] + [analyse_file(self.empty)]
+        self.assertEqual(list(index_records(records, index, batch_size=2)), records)
+        self.assertEqual(len(index), 3)
+
+        records = list(index_records([analyse_file(path) for path in self.paths[:2]], FingerprintIndex(), True))
+        self.assertEqual(records[0]["similar"], [])
+        self.assertEqual(records[1]["similar"], [[self.paths[0], 1.0]])
+
+
+if __name__ == "__main__":
+    unittest.main()
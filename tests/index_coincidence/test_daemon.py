@@ -0,0 +1,106 @@
+import os
+import socket
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from azul_plugin_index_coincidence.index_coincidence.batch import analyse_buffer, analyse_file
+from azul_plugin_index_coincidence.index_coincidence import client
+from azul_plugin_index_coincidence.index_coincidence.client import connect, default_socket_path, peer_uid
+from azul_plugin_index_coincidence.index_coincidence.daemon import AnalysisServer
+
+
+class TestDaemon(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.socket_path = os.path.join(self.tmp.name, "daemon.sock")
+        self.data = bytes(list(range(256))) * 8
+        self.path = os.path.join(self.tmp.name, "data")
+        with open(self.path, "wb") as f:
+            f.write(self.data)
+
+        self.server = AnalysisServer(self.socket_path, processes=1)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+    @staticmethod
+    def without_seconds(record):
+        return {key: value for key, value in record.items() if key != "seconds"}
+
+    def test_requests(self):
+        """
+        Test files and buffers analysed by the daemon give the same records as a batch.
+        """
+        with connect(self.socket_path) as client:
+            record = client.analyse_file(self.path)
+            self.assertEqual(self.without_seconds(record), self.without_seconds(analyse_file(self.path)))
+            self.assertEqual(record["widths"], [[256, 1.0]])
+
+            record = client.analyse_buffer(self.data, maximum_width=100)
+            self.assertEqual(self.without_seconds(record), self.without_seconds(analyse_buffer(self.data, 100)))
+            self.assertEqual(record["widths"], [])
+
+            # Errors are reported in the record, and the connection stays usable.
+            self.assertIn("error", client.analyse_file(os.path.join(self.tmp.name, "missing")))
+            self.assertIn("error", client.analyse_buffer(b""))
+            self.assertIn("error", client.analyse_buffer(b"x"))
+            self.assertEqual(client.analyse_file(self.path)["path"], self.path)
+
+    def test_bad_request(self):
+        """
+        Test a malformed request is answered with an error before the daemon closes the connection.
+        """
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(self.socket_path)
+            sock.sendall(b"not json\n")
+            with sock.makefile("rb") as reader:
+                self.assertIn(b"bad request", reader.readline())
+                self.assertEqual(reader.readline(), b"")
+
+    def test_connect(self):
+        """
+        Test there is no client without a daemon, and a second daemon can't take over the socket.
+        """
+        self.assertIsNone(connect(os.path.join(self.tmp.name, "missing.sock")))
+        with self.assertRaises(OSError):
+            AnalysisServer(self.socket_path, processes=1)
+        self.assertEqual(oct(os.stat(self.socket_path).st_mode & 0o777), oct(0o600))
+
+    def test_peer_user(self):
+        """
+        Test the client only trusts a daemon run by the same user.
+        """
+        with connect(self.socket_path) as connected:
+            self.assertEqual(peer_uid(connected.sock), os.getuid())
+        with mock.patch.object(client.os, "getuid", return_value=os.getuid() + 1):
+            with self.assertRaises(PermissionError):
+                connect(self.socket_path)
+
+    def test_default_socket_path(self):
+        """
+        Test the socket falls back to a directory only this user may enter, and refuses one others can.
+        """
+        environ = {
+            key: value for key, value in os.environ.items() if key not in ("XDG_RUNTIME_DIR", client.SOCKET_ENV)
+        }
+        with mock.patch.dict(os.environ, environ, clear=True), mock.patch.object(tempfile, "tempdir", self.tmp.name):
+            path = default_socket_path()
+            directory = os.path.dirname(path)
+            self.assertEqual(os.path.dirname(directory), self.tmp.name)
+            self.assertEqual(oct(os.stat(directory).st_mode & 0o777), oct(0o700))
+            self.assertEqual(default_socket_path(), path)
+
+            os.chmod(directory, 0o733)
+            with self.assertRaises(PermissionError):
+                default_socket_path()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import random
+import tempfile
+import unittest
+
+from azul_plugin_index_coincidence.index_coincidence.fingerprint import (
+    FingerprintIndex,
+    fingerprint,
+    fingerprint_levels,
+    signature,
+    similarity,
+)
+from azul_plugin_index_coincidence.index_coincidence.main import analyse
+
+
+class TestFingerprint(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(12)
+        self.plaintexts = [
+            bytes(rng.choice([0, 0, 0, 0, 0xFF, 0x8B, 0x48, rng.randrange(256)]) for _ in range(50000))
+            for _ in range(3)
+        ]
+        self.keys = {width: bytes(rng.randrange(256) for _ in range(width)) for width in (13, 23)}
+        self.random = rng.randbytes(50000)
+
+    def encoded(self, index, width):
+        key = self.keys[width]
+        return fingerprint(analyse(bytes(b ^ key[i % width] for i, b in enumerate(self.plaintexts[index]))).scores)
+
+    def test_fingerprint(self):
+        """
+        Test each width is given a level by how far its score is above the median.
+        """
+        scores = [(width, 0.01) for width in range(1, 11)]
+        scores[3] = (4, 0.02)
+        scores[4] = (5, 0.04)
+        scores[8] = (9, 0.5)
+        value = fingerprint(scores, widths=12)
+        self.assertEqual(value, bytes([0b00000001, 0b10000000, 0b11000000]))
+        self.assertEqual(fingerprint_levels(value).tolist(), [0, 0, 0, 1, 2, 0, 0, 0, 3, 0, 0, 0])
+        self.assertEqual(len(fingerprint(analyse(self.random).scores)), 75)
+
+        # Random data has nothing standing out, so nothing to match on.
+        self.assertIsNone(signature(fingerprint(analyse(self.random).scores)))
+        self.assertEqual(similarity(fingerprint([]), fingerprint([])), 0.0)
+
+    def test_similarity(self):
+        """
+        Test content encoded with the same key is more similar than content encoded with a key of another width.
+        """
+        first = self.encoded(0, 23)
+        self.assertEqual(similarity(first, first), 1.0)
+        self.assertGreater(similarity(first, self.encoded(1, 23)), 0.5)
+        self.assertLess(similarity(first, self.encoded(1, 13)), 0.2)
+
+    def test_index(self):
+        """
+        Test the index finds similar fingerprints, keeps them in its store, and groups them into clusters.
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "fingerprints.sqlite")
+            index = FingerprintIndex(path)
+            index.add_many([(f"{width}-{i}", self.encoded(i, width)) for width in (13, 23) for i in range(3)])
+            index.add("random", fingerprint(analyse(self.random).scores))
+            self.assertEqual(len(index), 7)
+
+            matches = index.query(self.encoded(0, 23))
+            self.assertEqual(matches[0], ("23-0", 1.0))
+            self.assertEqual(sorted(name for name, _ in matches), ["23-0", "23-1", "23-2"])
+            self.assertEqual(index.query(fingerprint(analyse(self.random).scores)), [])
+            index.close()
+
+            # Replacing a fingerprint also replaces the buckets it was found by.
+            index = FingerprintIndex(path)
+            self.assertEqual(index.clusters(), [["13-0", "13-1", "13-2"], ["23-0", "23-1", "23-2"]])
+            index.add("23-2", self.encoded(2, 13))
+            self.assertEqual(index.clusters(), [["13-0", "13-1", "13-2", "23-2"], ["23-0", "23-1"]])
+            self.assertEqual(len(index), 7)
+            index.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
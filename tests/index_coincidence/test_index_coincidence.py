@@ -1,8 +1,19 @@
 import json
 import os
+import random
+import time
 import unittest
 
+import numpy as np
+from _coincidence import entropy_width_matches
+
+from azul_plugin_index_coincidence.entropy import entropy
 from azul_plugin_index_coincidence.index_coincidence.main import (
+    MAXIMUM_WIDTH,
+    analyse,
+    analyse_gated,
+    analyse_region,
+    compute_budgeted_width_scores,
     compute_width_scores,
     filter_width_scores,
     get_features,
@@ -59,6 +70,25 @@ class TestIndexCoincidence(unittest.TestCase):
         # For data with length zero, expect an empty list.
         self.assertEqual(compute_width_scores(b""), [])
 
+    def test_compute_width_scores_reference(self):
+        """
+        Test that the native kernel matches the pure python index_of_coincidence reference.
+        """
+        rng = random.Random(1234)
+        key = bytes(rng.randrange(256) for _ in range(37))
+        for length in [1, 2, 7, 8, 9, 33, 301, 1000, 20011]:
+            # Mix random data with a repeating key so there are plenty of matches at some widths.
+            data = bytes(rng.randrange(16) ^ key[i % len(key)] for i in range(length))
+            expected = [
+                (width, index_of_coincidence(data[:-width], data[width:]))
+                for width in range(1, min(MAXIMUM_WIDTH + 1, length))
+            ]
+            self.assertEqual(compute_width_scores(data), expected)
+
+        # Buffer protocol objects are scored without a copy.
+        data = bytearray(b"\x01\x02\x03\x04" * 100)
+        self.assertEqual(compute_width_scores(memoryview(data)), compute_width_scores(bytes(data)))
+
     def test_filter_width_scores(self):
         """
         Load a collection of examples from a JSON file, which contains a collection of scores,
@@ -77,6 +107,28 @@ class TestIndexCoincidence(unittest.TestCase):
             self.assertEqual(len(filtered), 1)
             self.assertEqual(filtered[0][0], expected_width)
 
+    def test_filter_many_widths(self):
+        """
+        Test widths are chosen across a large width range as if checked against every chosen width.
+        """
+        rng = random.Random(3)
+        scores = [(1, 0.0)] + [(width, 0.01 + rng.random() / 1000) for width in range(2, 20000)]
+        chosen = []
+        for width, score in scores[1:]:
+            if not any(width % existing == 0 for existing, _ in chosen):
+                chosen.append((width, score))
+        self.assertEqual(filter_width_scores(scores), chosen)
+
+        # Only widths scoring at least as high as their neighbours are kept when looking for peaks.
+        scores = [(1, 0.0), (2, 0.5), (3, 0.6), (4, 0.2), (5, 0.5), (6, 0.1)]
+        self.assertEqual(filter_width_scores(scores), [(2, 0.5), (3, 0.6), (5, 0.5)])
+        self.assertEqual(filter_width_scores(scores, peaks=True), [(3, 0.6), (5, 0.5)])
+
+        # An array of scores gives the same plain numbers as a list.
+        filtered = filter_width_scores(np.array(scores))
+        self.assertEqual(filtered, [(2, 0.5), (3, 0.6), (5, 0.5)])
+        self.assertEqual({(type(width), type(score)) for width, score in filtered}, {(int, float)})
+
     def test_get_features(self):
         """
         Test the highest level function.
@@ -94,6 +146,65 @@ class TestIndexCoincidence(unittest.TestCase):
         expected_baseline = 0
         self.assertEqual(baseline, expected_baseline)
 
+    def test_analyse_gated(self):
+        """
+        Test the single pass entropy gate opts out low entropy data, and scores the rest exactly.
+        """
+        self.assertIsNone(analyse_gated(b"\x00" * 1024, 6.0))
+        self.assertIsNone(analyse_gated(b"\x00" * (3 << 20), 6.0))
+
+        rng = random.Random(99)
+        key = bytes(rng.randrange(256) for _ in range(13))
+        data = bytes(rng.randrange(256) ^ key[i % len(key)] for i in range(50000))
+        gated = analyse_gated(data, 6.0)
+        self.assertEqual(gated._replace(entropy=None), analyse(data))
+        self.assertAlmostEqual(gated.entropy, entropy(data))
+
+        # The gate pass gives the byte histogram, so scoring split between threads or by autocorrelation needn't
+        # count it again, and gives the same analysis.
+        self.assertEqual(entropy_width_matches(data, 0, 6.0)[1], [data.count(value) for value in range(256)])
+        for maximum_width, workers in [(MAXIMUM_WIDTH, 2), (4096, 1)]:
+            gated = analyse_gated(data, 6.0, maximum_width, workers=workers)
+            self.assertEqual(gated._replace(entropy=None), analyse(data, maximum_width, workers=workers))
+
+        gated = analyse_gated(bytes(list(range(256))) * 2, 6.0)
+        self.assertEqual(gated.widths, [(256, 1.0)])
+
+    def test_analyse_region(self):
+        """
+        Test a region is analysed as if it were the whole data.
+        """
+        data = b"\x00" * 1000 + bytes(list(range(256))) * 4 + b"\x00" * 1000
+        self.assertEqual(analyse_region(data, 1000, 1024), analyse(data[1000:2024]))
+        self.assertEqual(analyse_region(data, 1000, 1024).widths, [(256, 1.0)])
+
+    def test_deadline(self):
+        """
+        Test analysis past its deadline still gives a baseline and the widths scored in time, marked partial.
+        """
+        rng = random.Random(7)
+        key = bytes(rng.randrange(256) for _ in range(13))
+        data = bytes(rng.randrange(16) ^ key[i % len(key)] for i in range(50000))
+        exact = analyse(data)
+
+        partial = analyse(data, deadline=time.monotonic())
+        self.assertTrue(partial.partial)
+        self.assertEqual(partial.baseline, exact.baseline)
+        self.assertEqual(partial.scores, exact.scores[: len(partial.scores)])
+        self.assertEqual(partial.widths, [(13, exact.scores[12][1])])
+        self.assertEqual(analyse_gated(data, 0.0, deadline=time.monotonic()).scores, partial.scores)
+
+        # Batches carry on until every width is scored while there is time.
+        self.assertEqual(compute_budgeted_width_scores(data, deadline=time.monotonic() + 60), exact.scores)
+
+        # Large data is sampled instead, which is also partial.
+        data = rng.randbytes(3 << 20)
+        sampled = analyse(data, deadline=time.monotonic())
+        self.assertTrue(sampled.partial)
+        self.assertTrue(sampled.estimated)
+
+        self.assertFalse(analyse(data[:1000], deadline=time.monotonic() + 60).partial)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,82 @@
+import random
+import unittest
+
+from azul_plugin_index_coincidence.index_coincidence.known_keys import (
+    MARKERS,
+    KeyScanner,
+    KnownKeyMatch,
+)
+from azul_plugin_index_coincidence.index_coincidence.xor import xor_bytes
+
+STUB = MARKERS["DOS stub"][0]
+
+
+class TestKnownKeys(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(4)
+        self.keys = [bytes(rng.randrange(256) for _ in range(width)) for width in (1, 5, 16, 37)]
+        self.random = bytes(rng.randrange(256) for _ in range(100000))
+        self.scanner = KeyScanner(self.keys)
+
+    def test_xor_bytes(self):
+        self.assertEqual(xor_bytes(b"\x00\x01\x02", b"\x10\x20"), b"\x10\x21\x12")
+        self.assertEqual(xor_bytes(b"\x00\x01\x02", b"\x10\x20", phase=1), b"\x20\x11\x22")
+
+    def test_anchored(self):
+        """
+        Test headers are only found at the start of the data, encoded from the start of the key.
+        """
+        data = xor_bytes(MARKERS["MZ"][0] + self.random, self.keys[2])
+        self.assertEqual(self.scanner.scan(data), [KnownKeyMatch(self.keys[2], "MZ", 0)])
+        self.assertEqual(self.scanner.scan(b"\x00" + data), [])
+
+    def test_anywhere(self):
+        """
+        Test markers are found at any offset and any phase of the key, including across chunks.
+        """
+        for key in self.keys:
+            for offset in (0, 7, 4093, 50001):
+                data = bytearray(self.random)
+                data[offset : offset + len(STUB)] = xor_bytes(STUB, key, phase=offset * 3)
+                self.assertEqual(
+                    self.scanner.scan(data, chunk_size=4096), [KnownKeyMatch(key, "DOS stub", offset)], (key, offset)
+                )
+
+        # The first marker found for each key is reported.
+        data = xor_bytes(self.random[:1000] + STUB + MARKERS["Win32 stub"][0], self.keys[1])
+        data += xor_bytes(STUB, self.keys[3])
+        self.assertEqual(
+            self.scanner.scan(data),
+            [
+                KnownKeyMatch(self.keys[1], "DOS stub", 1000),
+                KnownKeyMatch(self.keys[3], "DOS stub", len(data) - len(STUB)),
+            ],
+        )
+
+    def test_no_match(self):
+        self.assertEqual(self.scanner.scan(self.random), [])
+        self.assertEqual(self.scanner.scan(b""), [])
+        self.assertEqual(self.scanner.scan(STUB[:5]), [])
+        self.assertEqual(KeyScanner([]).scan(xor_bytes(STUB, self.keys[0])), [])
+
+    def test_add(self):
+        """
+        Test keys added to a scanner are found the same as keys it was built with.
+        """
+        scanner = KeyScanner(self.keys[:2])
+        scanner.add(b"")
+        for key in self.keys[2:]:
+            scanner.add(key)
+        self.assertEqual(scanner.keys, self.keys)
+        for data in [xor_bytes(STUB, self.keys[3], phase=5), xor_bytes(MARKERS["MZ"][0], self.keys[2])]:
+            self.assertEqual(scanner.scan(data), self.scanner.scan(data))
+            self.assertEqual(len(scanner.scan(data)), 1)
+        self.assertEqual(scanner.prefixes.tolist(), self.scanner.prefixes.tolist())
+
+    def test_short_marker(self):
+        with self.assertRaises(ValueError):
+            KeyScanner(self.keys, {"short": (b"MZ", False)})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import io
+import random
+import unittest
+
+from _coincidence import width_matches
+
+from azul_plugin_index_coincidence.index_coincidence.main import (
+    analyse,
+    analyse_gated,
+    compute_width_scores,
+)
+from azul_plugin_index_coincidence.index_coincidence.parallel import (
+    match_scores,
+    parallel_width_matches,
+    resolve_workers,
+    split_ranges,
+)
+from azul_plugin_index_coincidence.index_coincidence.stream import stream_width_scores
+
+
+class TestParallel(unittest.TestCase):
+    def test_split_ranges(self):
+        self.assertEqual(split_ranges(0, 10, 3, 1), [(0, 3), (3, 6), (6, 10)])
+        self.assertEqual(split_ranges(5, 10, 8, 2), [(5, 7), (7, 10)])
+        self.assertEqual(split_ranges(0, 0, 4, 1), [(0, 0)])
+        self.assertEqual(split_ranges(0, 100, 4), [(0, 100)])
+
+    def test_resolve_workers(self):
+        self.assertEqual(resolve_workers(3), 3)
+        self.assertEqual(resolve_workers(-1), 1)
+        self.assertGreaterEqual(resolve_workers(0), 1)
+        self.assertEqual(resolve_workers(None), resolve_workers(0))
+
+    def test_match_scores(self):
+        self.assertEqual(match_scores([2, 1], 5), [(1, 0.5), (2, 1 / 3)])
+        self.assertEqual(match_scores([3, 2], 5, first=2), [(2, 1.0), (3, 1.0)])
+        # Widths stop short of the length, whatever counts are given.
+        self.assertEqual(match_scores([1, 0, 0], 2), [(1, 1.0)])
+        self.assertEqual(match_scores([], 0), [])
+
+    def test_matches_serial(self):
+        """
+        Test counts summed over threads are identical to a single scan, for any split.
+        """
+        rng = random.Random(11)
+        key = bytes(rng.randrange(256) for _ in range(13))
+        for length in [0, 1, 2, 50, 3001]:
+            data = bytes(rng.randrange(8) ^ key[i % len(key)] for i in range(length))
+            for workers in [1, 2, 3, 7]:
+                for start, stop, minimum_width in [(0, -1, 1), (10, 2000, 1), (0, -1, 13)]:
+                    self.assertEqual(
+                        parallel_width_matches(data, 300, workers, start, stop, minimum_width, min_range_size=1),
+                        width_matches(data, 300, start, stop, minimum_width),
+                    )
+
+    def test_scores_identical(self):
+        """
+        Test parallel scoring gives byte-for-byte the same results as the serial path.
+        """
+        rng = random.Random(12)
+        key = bytes(rng.randrange(256) for _ in range(41))
+        data = bytes(rng.randrange(256) ^ key[i % len(key)] for i in range(1 << 20))
+
+        self.assertEqual(compute_width_scores(data, workers=4), compute_width_scores(data))
+        self.assertEqual(analyse(data, sampling_size=1 << 18, workers=4), analyse(data, sampling_size=1 << 18))
+        self.assertEqual(analyse_gated(data, 6.0, workers=4), analyse_gated(data, 6.0))
+        self.assertEqual(stream_width_scores(io.BytesIO(data), 300, workers=4), compute_width_scores(data))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import random
+import unittest
+
+from azul_plugin_index_coincidence.index_coincidence.main import (
+    analyse,
+    compute_adaptive_width_scores,
+    compute_sampled_width_scores,
+    compute_width_scores,
+)
+from azul_plugin_index_coincidence.index_coincidence.sampling import (
+    estimate_width_scores,
+    sample_blocks,
+)
+
+from .helpers.encode import xor_sample
+
+
+class TestSampling(unittest.TestCase):
+    def test_sample_blocks(self):
+        """
+        Test one block is drawn from each stratum, and blocks are repeatable.
+        """
+        blocks = sample_blocks(1_000_000, sample_size=40_000, block_size=1000)
+        self.assertEqual(len(blocks), 40)
+        for index, (start, stop) in enumerate(blocks):
+            self.assertEqual(stop - start, 1000)
+            self.assertGreaterEqual(start, index * 25_000)
+            self.assertLessEqual(stop, (index + 1) * 25_000)
+        self.assertEqual(blocks, sample_blocks(1_000_000, sample_size=40_000, block_size=1000))
+
+        # Small data still gets a single block.
+        self.assertEqual(sample_blocks(10, block_size=1000), [(0, 10)])
+
+    def test_estimate_intervals(self):
+        """
+        Test confidence intervals contain the exact score for nearly every width.
+        """
+        data = xor_sample(200_000, 23, seed=1)
+        exact = dict(compute_width_scores(data))
+        estimates = estimate_width_scores(data, 300, sample_size=32_768, block_size=512)
+        self.assertEqual([width for width, _, _, _ in estimates], list(exact))
+
+        covered = sum(1 for width, _, low, high in estimates if low <= exact[width] <= high)
+        self.assertGreaterEqual(covered / len(estimates), 0.95)
+
+        # Estimating only some widths gives the same estimates for them.
+        subset = estimate_width_scores(data, 300, sample_size=32_768, block_size=512, widths=[1, 23, 46, 299])
+        self.assertEqual(subset, [estimate for estimate in estimates if estimate[0] in (1, 23, 46, 299)])
+
+    def test_sampled_widths_match_exact(self):
+        """
+        Test sampled scoring picks the same widths as exact scoring.
+        """
+        for key_width in [5, 23, 64, 257]:
+            data = xor_sample(300_000, key_width, seed=key_width)
+            scores, estimated = compute_sampled_width_scores(data, sample_size=32_768)
+
+            # Most widths never need exact scoring.
+            self.assertGreater(len(estimated), len(scores) // 2)
+            self.assertNotIn(1, estimated)
+
+            sampled = analyse(data, sampling_size=100_000)
+            exact = analyse(data)
+            self.assertEqual(sampled.baseline, exact.baseline)
+            self.assertEqual([w for w, _ in sampled.widths], [w for w, _ in exact.widths])
+            self.assertIn(key_width, [w for w, _ in exact.widths])
+
+        # Data no larger than the sampling size is scored exactly.
+        self.assertEqual(analyse(data, sampling_size=len(data)).estimated, frozenset())
+
+    def test_adaptive_widths_match_exact(self):
+        """
+        Test adaptive scoring picks the same widths with the same scores as exact scoring.
+        """
+        for key_width in [0, 5, 23, 64, 257]:
+            data = xor_sample(400_000, key_width, seed=key_width) if key_width else random.Random(0).randbytes(400_000)
+            scores, estimated = compute_adaptive_width_scores(data, sample_size=16_384)
+
+            # Only the baseline and the key width need exact scores.
+            self.assertNotIn(1, estimated)
+            self.assertEqual(len(scores) - len(estimated), 2 if key_width else 1)
+
+            adaptive = analyse(data, adaptive=True)
+            exact = analyse(data)
+            self.assertEqual(adaptive.baseline, exact.baseline)
+            self.assertEqual(adaptive.widths, exact.widths)
+            self.assertFalse({width for width, _ in adaptive.widths} & adaptive.estimated)
+
+        # Data too small to sample is scored exactly.
+        self.assertEqual(analyse(data[:1000], adaptive=True).estimated, frozenset())
+
+
+if __name__ == "__main__":
+    unittest.main()
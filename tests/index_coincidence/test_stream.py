@@ -0,0 +1,58 @@
+import io
+import random
+import time
+import unittest
+
+from azul_plugin_index_coincidence.index_coincidence.main import (
+    analyse,
+    analyse_stream,
+    compute_width_scores,
+)
+from azul_plugin_index_coincidence.index_coincidence.stream import (
+    stream_width_matches,
+    stream_width_scores,
+)
+
+
+class TestStream(unittest.TestCase):
+    def test_stream_width_scores(self):
+        """
+        Test scores from a stream match scores from the whole data, for any chunk size.
+        """
+        rng = random.Random(5)
+        key = bytes(rng.randrange(256) for _ in range(29))
+        for length in [0, 1, 2, 299, 300, 301, 5000]:
+            data = bytes(rng.randrange(8) ^ key[i % len(key)] for i in range(length))
+            expected = compute_width_scores(data)
+            for chunk_size in [1, 7, 300, 1024, 1 << 20]:
+                self.assertEqual(stream_width_scores(io.BytesIO(data), 300, chunk_size), expected)
+
+    def test_stream_width_matches_length(self):
+        matches, length = stream_width_matches(io.BytesIO(b"\x01\x02\x01\x02"), 10, 3)
+        self.assertEqual(matches, [0, 2, 0])
+        self.assertEqual(length, 4)
+
+    def test_analyse_stream(self):
+        """
+        Test streamed analysis picks the same widths as analysing the whole data.
+        """
+        data = bytes(list(range(256))) * 8
+        streamed = analyse_stream(io.BytesIO(data), chunk_size=1000)
+        self.assertEqual(streamed.widths, [(256, 1.0)])
+        self.assertEqual(streamed, analyse(data))
+
+    def test_analyse_stream_deadline(self):
+        """
+        Test a stream still being read at the deadline is scored on the chunks read so far, and marked partial.
+        """
+        data = bytes(list(range(256))) * 8
+        streamed = analyse_stream(io.BytesIO(data), chunk_size=1000, deadline=time.monotonic())
+        self.assertTrue(streamed.partial)
+        self.assertEqual(streamed.scores, compute_width_scores(data[:1000]))
+
+        # A deadline that isn't reached changes nothing.
+        self.assertEqual(analyse_stream(io.BytesIO(data), deadline=time.monotonic() + 60), analyse(data))
+
+
+if __name__ == "__main__":
+    unittest.main()
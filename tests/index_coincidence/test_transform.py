@@ -0,0 +1,87 @@
+import random
+import unittest
+
+from azul_plugin_index_coincidence.index_coincidence.main import (
+    analyse,
+    analyse_transforms,
+    compute_width_scores,
+)
+from azul_plugin_index_coincidence.index_coincidence.transform import (
+    TRANSFORMS,
+    TransformWidth,
+    transform_width_scores,
+)
+
+
+def transformed(data, transform):
+    """Return a transformed copy of data, for reference."""
+    if transform == "sub_delta":
+        return bytes((data[i + 1] - data[i]) & 0xFF for i in range(len(data) - 1))
+    if transform == "xor_delta":
+        return bytes(data[i + 1] ^ data[i] for i in range(len(data) - 1))
+    out = bytearray()
+    total = 0
+    for byte in data:
+        total = (total + byte) & 0xFF if transform == "add_sum" else total ^ byte
+        out.append(total)
+    return bytes(out)
+
+
+class TestTransform(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(5)
+        # Mostly zeros and a few common opcode bytes, like an executable.
+        self.plaintext = bytes(rng.choice([0, 0, 0, 0, 0xFF, 0x8B, 0x48, rng.randrange(256)]) for _ in range(100000))
+        self.key = bytes(rng.randrange(256) for _ in range(23))
+
+    def test_reference(self):
+        """
+        Test transform scores match scoring a transformed copy, for any split between threads.
+        """
+        rng = random.Random(6)
+        for length in [0, 1, 2, 3, 50, 20011]:
+            data = bytes(rng.randrange(4) for _ in range(length))
+            for maximum_width in [1, 7, 300]:
+                scores = transform_width_scores(data, maximum_width)
+                for transform in TRANSFORMS:
+                    self.assertEqual(
+                        scores[transform], compute_width_scores(transformed(data, transform), maximum_width)
+                    )
+
+        data = rng.randbytes(1 << 20)
+        self.assertEqual(transform_width_scores(data, 50, workers=4), transform_width_scores(data, 50))
+        self.assertEqual(list(transform_width_scores(data, 5, ["xor_sum"])), ["xor_sum"])
+
+    def test_rolling_keys(self):
+        """
+        Test keys the plain scan can't see are found by the transform that undoes them.
+        """
+        stepped = bytes((byte + self.key[i % 23] + i) & 0xFF for i, byte in enumerate(self.plaintext))
+        chained = bytearray()
+        previous = 0
+        for i, byte in enumerate(self.plaintext):
+            previous = byte ^ self.key[i % 23] ^ previous
+            chained.append(previous)
+        encoded = [byte ^ self.key[i % 23] for i, byte in enumerate(self.plaintext)]
+        delta = bytes((encoded[i] - (encoded[i - 1] if i else 0)) & 0xFF for i in range(len(encoded)))
+
+        # Delta encoding leaves a little of the key width showing in the content itself.
+        self.assertNotIn(23, [width for width, _ in analyse(stepped).widths])
+        self.assertNotIn(23, [width for width, _ in analyse(chained).widths])
+        for data, transform in [(stepped, "sub_delta"), (bytes(chained), "xor_delta"), (delta, "add_sum")]:
+            analysis = analyse_transforms(data, analyse(data))
+            self.assertEqual([(found.transform, found.width) for found in analysis.transforms], [(transform, 23)])
+            self.assertIsInstance(analysis.transforms[0], TransformWidth)
+
+        # A plain key shows in every transform, but less clearly, so isn't reported again for them.
+        data = bytes(encoded)
+        analysis = analyse(data)
+        self.assertEqual([width for width, _ in analysis.widths], [23])
+        self.assertEqual(analyse_transforms(data, analysis).transforms, ())
+
+        data = random.Random(7).randbytes(100000)
+        self.assertEqual(analyse_transforms(data, analyse(data)).transforms, ())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import mmap
+import random
+import tempfile
+import unittest
+
+from azul_plugin_index_coincidence.index_coincidence.main import compute_width_scores
+from azul_plugin_index_coincidence.index_coincidence.window import (
+    Region,
+    check_window,
+    find_regions,
+    window_width_scores,
+)
+
+
+class TestWindow(unittest.TestCase):
+    def test_window_width_scores(self):
+        """
+        Test rolling window scores match scoring each window's bytes alone.
+        """
+        rng = random.Random(1)
+        for length in [0, 1, 2, 5, 30, 31, 100, 1003]:
+            data = bytes(rng.randrange(4) for _ in range(length))
+            for maximum_width, window_size, step in [(5, 8, 4), (7, 8, 8), (20, 60, 20), (3, 12, 3)]:
+                windows = list(window_width_scores(data, maximum_width, window_size, step, workers=2))
+                for offset, size, scores in windows:
+                    self.assertLessEqual(size, window_size)
+                    self.assertEqual(scores, compute_width_scores(data[offset : offset + size], maximum_width))
+                if length > 1:
+                    # Windows start every step and the last one reaches the end of the data.
+                    self.assertEqual(
+                        [offset for offset, _, _ in windows[1:]], [step * i for i in range(1, len(windows))]
+                    )
+                    self.assertEqual(sum(windows[-1][:2]), length)
+
+    def test_invalid_windows(self):
+        with self.assertRaises(ValueError):
+            list(window_width_scores(b"abcd", 3, 10, 3))
+        with self.assertRaises(ValueError):
+            list(window_width_scores(b"abcd", 3, 10, 0))
+        with self.assertRaises(ValueError):
+            list(window_width_scores(b"abcd", 10, 10, 5))
+        for window_size, step in [(0, 4), (-8, 4), (8, 3)]:
+            with self.assertRaises(ValueError):
+                check_window(window_size, step)
+        check_window(8, 4)
+
+    def test_find_regions(self):
+        """
+        Test an obfuscated payload in the middle of random data is located.
+        """
+        rng = random.Random(9)
+        key = bytes(rng.randrange(256) for _ in range(13))
+        before = bytes(rng.randrange(256) for _ in range(65536))
+        payload = bytes(rng.randrange(4) ^ key[i % len(key)] for i in range(32768))
+        after = bytes(rng.randrange(256) for _ in range(65536))
+        data = before + payload + after
+
+        regions = find_regions(data, 300, 32768, 8192)
+        self.assertEqual([region[:3] for region in regions], [(40960, 81920, 13)])
+        self.assertGreater(regions[0].score, 0.2)
+
+        # Mapped data can be closed once the regions are found.
+        with tempfile.TemporaryFile() as f:
+            f.write(data)
+            f.flush()
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                self.assertEqual(find_regions(mapped, 300, 32768, 8192), regions)
+
+        self.assertEqual(find_regions(bytes(list(range(256))) * 4, 300, 512, 512), [Region(0, 1024, 256, 1.0)])
+
+
+if __name__ == "__main__":
+    unittest.main()
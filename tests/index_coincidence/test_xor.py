@@ -0,0 +1,99 @@
+import io
+import random
+import unittest
+
+from azul_plugin_index_coincidence.index_coincidence.main import analyse, analyse_keys
+from azul_plugin_index_coincidence.index_coincidence.xor import (
+    column_histograms,
+    column_histograms_many,
+    decoded_entropy,
+    recover_key,
+    recover_keys,
+    xor_bytes,
+    xor_decode,
+)
+
+from .helpers.encode import pe_like, random_key
+
+
+class TestXor(unittest.TestCase):
+    def test_column_histograms(self):
+        """
+        Test each byte is counted in the column of its offset modulo the width, across chunks.
+        """
+        data = bytes(range(10)) * 7
+        histograms = column_histograms(data, 10, chunk_size=25)
+        self.assertEqual(histograms.shape, (10, 256))
+        self.assertEqual(histograms.sum(), len(data))
+        for column in range(10):
+            self.assertEqual(histograms[column, column], 7)
+
+        # Chunk sizes smaller than the width still count every byte.
+        self.assertEqual(column_histograms(data, 10, chunk_size=3).tolist(), histograms.tolist())
+
+    def test_column_histograms_many(self):
+        """
+        Test counting several widths in one pass matches counting each width on its own, whatever the chunk size.
+        """
+        data = random.Random(5).randbytes(1000)
+        widths = [1, 7, 10, 23, 300]
+        expected = []
+        for width in widths:
+            histograms = [[0] * 256 for _ in range(width)]
+            for offset, byte in enumerate(data):
+                histograms[offset % width][byte] += 1
+            expected.append(histograms)
+        for chunk_size in (3, 25, 64, 4096):
+            many = column_histograms_many(data, widths, chunk_size)
+            self.assertEqual([histograms.tolist() for histograms in many], expected)
+        self.assertEqual(column_histograms_many(data, []), [])
+
+    def test_recover_key(self):
+        """
+        Test the key is recovered from data whose most common plaintext byte is known.
+        """
+        key = random_key(23, random.Random(1))
+        plain = pe_like(50_000, random.Random(2))
+        encoded = io.BytesIO()
+        xor_decode(plain, key, encoded, chunk_size=1000)
+
+        histograms = column_histograms(encoded.getvalue(), 23)
+        self.assertEqual(recover_key(histograms), key)
+        self.assertAlmostEqual(
+            decoded_entropy(histograms, key), decoded_entropy(column_histograms(plain, 23), bytes(23))
+        )
+
+        # Decoding with the recovered key gives back the plaintext.
+        decoded = io.BytesIO()
+        xor_decode(encoded.getvalue(), key, decoded, chunk_size=1000)
+        self.assertEqual(decoded.getvalue(), plain)
+
+        # Data decoding to a single byte value has an entropy of exactly zero, not negative zero.
+        self.assertEqual(str(decoded_entropy(column_histograms(bytes(range(23)) * 4, 23), bytes(range(23)))), "0.0")
+
+        # Assuming a different plaintext byte shifts every key byte.
+        self.assertEqual(recover_key(histograms, plaintext=0x20), bytes(k ^ 0x20 for k in key))
+
+    def test_xor_bytes(self):
+        self.assertEqual(xor_bytes(b"\x00\x01\x02", b"\x10\x20"), b"\x10\x21\x12")
+        self.assertEqual(xor_bytes(b"\x00\x01\x02", b"\x10\x20", phase=1), b"\x20\x11\x22")
+        self.assertEqual(xor_bytes(b"\x00\x01\x02", b"\x10\x20", phase=5), b"\x20\x11\x22")
+        self.assertEqual(xor_bytes(b"", b"\x10\x20"), b"")
+
+    def test_analyse_keys(self):
+        """
+        Test a key is recovered for each selected width, decoding to lower entropy than a wrong width.
+        """
+        key = random_key(29, random.Random(3))
+        encoded = io.BytesIO()
+        xor_decode(pe_like(100_000, random.Random(4)), key, encoded)
+        data = encoded.getvalue()
+
+        analysis = analyse_keys(data, analyse(data))
+        self.assertEqual([recovery.width for recovery in analysis.keys], [29])
+        self.assertEqual(analysis.keys[0].key, key)
+        self.assertLess(analysis.keys[0].entropy, recover_keys(data, [31])[0].entropy)
+
+
+if __name__ == "__main__":
+    unittest.main()
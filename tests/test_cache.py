@@ -0,0 +1,58 @@
+import os
+import tempfile
+import unittest
+
+from azul_plugin_index_coincidence.cache import ResultCache, cache_key
+
+
+class TestResultCache(unittest.TestCase):
+    def test_cache_key(self):
+        self.assertEqual(cache_key("abc", "1", {"a": 1, "b": 2}), cache_key("abc", "1", {"b": 2, "a": 1}))
+        self.assertNotEqual(cache_key("abc", "1", {"a": 1}), cache_key("abc", "2", {"a": 1}))
+        self.assertNotEqual(cache_key("abc", "1", {"a": 1}), cache_key("abd", "1", {"a": 1}))
+
+    def test_memory(self):
+        """
+        Test results are kept in memory, dropping the least recently used.
+        """
+        cache = ResultCache(memory_entries=2)
+        self.assertIsNone(cache.get("a"))
+        cache.put("a", {"features": [["index_of_coincidence", 0.1 + 0.2, {}]]})
+        cache.put("b", {"features": None})
+        self.assertEqual(cache.get("a"), {"features": [["index_of_coincidence", 0.1 + 0.2, {}]]})
+        cache.put("c", {"features": []})
+
+        # b was used least recently, so it was dropped.
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a")["features"][0][1], 0.30000000000000004)
+        self.assertEqual(cache.get("c"), {"features": []})
+        self.assertEqual(cache.stats(), {"hits": 3, "memory_hits": 3, "store_hits": 0, "misses": 2})
+
+    def test_store(self):
+        """
+        Test results outlive the process in the store, which evicts the least recently used beyond its size.
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "results.sqlite")
+            cache = ResultCache(path=path, store_size=100)
+            cache.put("a", "x" * 40)
+            cache.put("b", "y" * 40)
+            cache.close()
+
+            cache = ResultCache(memory_entries=0, path=path, store_size=100)
+            self.assertEqual(cache.get("a"), "x" * 40)
+            cache.put("c", "z" * 40)
+            # b was used least recently, so it was evicted to make room.
+            self.assertIsNone(cache.get("b"))
+            self.assertEqual(cache.get("a"), "x" * 40)
+            self.assertEqual(cache.get("c"), "z" * 40)
+            self.assertEqual(cache.stats(), {"hits": 3, "memory_hits": 0, "store_hits": 3, "misses": 1})
+
+            # Results too large for the store are only kept in memory.
+            cache.put("d", "w" * 200)
+            self.assertIsNone(cache.get("d"))
+            cache.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,19 @@
+import hashlib
+import json
+import os
+import random
+import socket
+import tempfile
 import unittest
 
 from azul_runner import FV, Event, JobResult, State, test_template
 
+from azul_plugin_index_coincidence.index_coincidence.fingerprint import fingerprint
+from azul_plugin_index_coincidence.entropy import entropy
+from azul_plugin_index_coincidence.index_coincidence.known_keys import MARKERS
+from azul_plugin_index_coincidence.index_coincidence.main import analyse, analyse_gated, analyse_transforms
+from azul_plugin_index_coincidence.index_coincidence.xor import xor_bytes
+from azul_plugin_index_coincidence.key_index import KeyIndex
 from azul_plugin_index_coincidence.main import AzulPluginIndexCoincidence
 
 
@@ -30,7 +42,7 @@ class TestIndexCoincidence(test_template.TestPlugin):
                     Event(
                         entity_type="binary",
                         entity_id="40aff2e9d2d8922e47afd4648e6967497158785fbd1da870e7110266bf944880",
-                        features={"index_of_coincidence": [FV(0.0)]},
+                        features={"entropy": [FV(8.0)], "index_of_coincidence": [FV(0.0)]},
                     )
                 ],
             ),
@@ -51,6 +63,7 @@ class TestIndexCoincidence(test_template.TestPlugin):
                         entity_type="binary",
                         entity_id="110009dcee21620b166f3abfecb5eff7a873be729d1c2d53822e7acc5f34eb9b",
                         features={
+                            "entropy": [FV(8.0)],
                             "index_of_coincidence": [FV(0.0)],
                             "index_of_coincidence_width": [FV(256, label="1.0")],
                         },
@@ -59,6 +72,363 @@ class TestIndexCoincidence(test_template.TestPlugin):
             ),
         )
 
+    def test_sampled(self):
+        """
+        Test content above the sampling size finds the same widths, with exact scores for uncertain widths.
+        """
+        data = bytes(list(range(256))) * 64
+        result = self.do_execution(data_in=[("content", data)], config={"sampling_minimum_size": 4096})
+        self.assertJobResult(
+            result,
+            JobResult(
+                state=State(State.Label.COMPLETED),
+                events=[
+                    Event(
+                        entity_type="binary",
+                        entity_id="a1f259d4365ed4320c377ce26f5c8c56dcdc9a89e7b641bfd8eabfbbeac86654",
+                        features={
+                            "entropy": [FV(8.0)],
+                            "index_of_coincidence": [FV(0.0)],
+                            "index_of_coincidence_width": [FV(256, label="1.0")],
+                        },
+                    )
+                ],
+            ),
+        )
+
+    def test_adaptive(self):
+        """
+        Test adaptive scoring gives the same features as exact scoring.
+        """
+        data = bytes(list(range(256))) * 4096
+        result = self.do_execution(data_in=[("content", data)], config={"adaptive_scoring": True})
+        self.assertJobResult(
+            result,
+            JobResult(
+                state=State(State.Label.COMPLETED),
+                events=[
+                    Event(
+                        entity_type="binary",
+                        entity_id="fbbab289f7f94b25736c58be46a994c441fd02552cc6022352e3d86d2fab7c83",
+                        features={
+                            "entropy": [FV(8.0)],
+                            "index_of_coincidence": [FV(0.0)],
+                            "index_of_coincidence_width": [FV(256, label="1.0")],
+                        },
+                    )
+                ],
+            ),
+        )
+
+    def test_key_recovery(self):
+        """
+        Test a key is recovered for each width, and the content decoded with it is added as a child.
+        """
+        data = bytes(list(range(256))) * 64
+        result = self.do_execution(data_in=[("content", data)], config={"key_recovery": True})
+        self.assertEqual(result.state, State(State.Label.COMPLETED))
+        self.assertEqual(
+            result.events[0].features["index_of_coincidence_key"], [FV(bytes(range(256)).hex(), label="0.0")]
+        )
+
+        # Every column decodes to the assumed plaintext byte.
+        self.assertEqual(len(result.events), 2)
+        child = result.events[1]
+        self.assertEqual(child.sha256, hashlib.sha256(bytes(len(data))).hexdigest())
+        self.assertEqual(child.relationship, {"action": "xor decoded", "key": bytes(range(256)).hex()})
+
+    def test_transform_scoring(self):
+        """
+        Test a key stepped every byte, which the plain scan misses, is reported with the transform showing it.
+        """
+        rng = random.Random(8)
+        plaintext = bytes(rng.choice([0, 0, 0, 0, 0xFF, 0x8B, 0x48, rng.randrange(256)]) for _ in range(100000))
+        key = bytes(rng.randrange(256) for _ in range(23))
+        data = bytes((byte + key[i % len(key)] + i) & 0xFF for i, byte in enumerate(plaintext))
+        analysis = analyse_transforms(data, analyse_gated(data, 0.0))
+        self.assertEqual([(found.transform, found.width) for found in analysis.transforms], [("sub_delta", 23)])
+        features = {
+            "entropy": [FV(analysis.entropy)],
+            "index_of_coincidence": [FV(analysis.baseline)],
+            "index_of_coincidence_width": [FV(width, label=str(score)) for width, score in analysis.widths],
+        }
+
+        for config, reported in [({"transform_scoring": True}, True), ({}, False)]:
+            expected = dict(features)
+            if reported:
+                expected["index_of_coincidence_transform_width"] = [
+                    FV(23, label=f"sub_delta {analysis.transforms[0].score}")
+                ]
+            result = self.do_execution(data_in=[("content", data)], config=config)
+            self.assertJobResult(
+                result,
+                JobResult(
+                    state=State(State.Label.COMPLETED),
+                    events=[
+                        Event(
+                            entity_type="binary",
+                            entity_id=hashlib.sha256(data).hexdigest(),
+                            features=expected,
+                        )
+                    ],
+                ),
+            )
+
+    def test_fingerprint(self):
+        """
+        Test the fingerprint of the width scores is reported when enabled.
+        """
+        data = bytes(list(range(256))) * 64
+        result = self.do_execution(data_in=[("content", data)], config={"fingerprint": True})
+        self.assertEqual(result.state, State(State.Label.COMPLETED))
+        self.assertEqual(
+            result.events[0].features["index_of_coincidence_fingerprint"],
+            [FV(fingerprint(analyse(data).scores).hex())],
+        )
+
+    def test_known_keys(self):
+        """
+        Test keys recovered from content are indexed, and content encoded with an indexed key is matched without scoring.
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "keys.sqlite")
+            data = bytes(list(range(256))) * 64
+            result = self.do_execution(
+                data_in=[("content", data)], config={"key_recovery": True, "key_index_path": path}
+            )
+            self.assertEqual(result.state, State(State.Label.COMPLETED))
+            self.assertEqual(KeyIndex(path).keys, {bytes(range(256))})
+
+            # Low entropy content is matched all the same, at the phase of the key the marker falls on.
+            plaintext = bytes(1000) + MARKERS["DOS stub"][0] + bytes(1000)
+            data = xor_bytes(plaintext, bytes(range(256)))
+            result = self.do_execution(data_in=[("content", data)], config={"key_index_path": path})
+            self.assertJobResult(
+                result,
+                JobResult(
+                    state=State(State.Label.COMPLETED),
+                    events=[
+                        Event(
+                            entity_type="binary",
+                            entity_id=hashlib.sha256(data).hexdigest(),
+                            features={
+                                "entropy": [FV(entropy(data))],
+                                "known_xor_key": [FV(bytes(range(256)).hex(), label="DOS stub", offset=1000)],
+                            },
+                        )
+                    ],
+                ),
+            )
+
+    def test_time_budget(self):
+        """
+        Test a job out of time still reports the baseline and the widths scored, completing with errors.
+        """
+        data = bytes(list(range(256))) * 64
+        result = self.do_execution(data_in=[("content", data)], config={"time_budget": 1e-9})
+        self.assertJobResult(
+            result,
+            JobResult(
+                state=State(
+                    State.Label.COMPLETED_WITH_ERRORS,
+                    message="Time budget of 1e-09 seconds ran out, results are partial",
+                ),
+                events=[
+                    Event(
+                        entity_type="binary",
+                        entity_id="a1f259d4365ed4320c377ce26f5c8c56dcdc9a89e7b641bfd8eabfbbeac86654",
+                        features={"entropy": [FV(8.0)], "index_of_coincidence": [FV(0.0)]},
+                    )
+                ],
+            ),
+        )
+
+    def test_streamed(self):
+        """
+        Test streaming the content instead of mapping it gives the same features.
+        """
+        data = bytes(list(range(256))) * 2
+        result = self.do_execution(data_in=[("content", data)], config={"memory_map": False, "stream_chunk_size": 100})
+        self.assertJobResult(
+            result,
+            JobResult(
+                state=State(State.Label.COMPLETED),
+                events=[
+                    Event(
+                        entity_type="binary",
+                        entity_id="110009dcee21620b166f3abfecb5eff7a873be729d1c2d53822e7acc5f34eb9b",
+                        features={
+                            "entropy": [FV(8.0)],
+                            "index_of_coincidence": [FV(0.0)],
+                            "index_of_coincidence_width": [FV(256, label="1.0")],
+                        },
+                    )
+                ],
+            ),
+        )
+
+    def test_regions(self):
+        """
+        Test an obfuscated payload inside otherwise random content is located by windowed scoring.
+        """
+        rng = random.Random(9)
+        key = bytes(rng.randrange(256) for _ in range(13))
+        before = bytes(rng.randrange(256) for _ in range(65536))
+        payload = bytes(rng.randrange(4) ^ key[i % len(key)] for i in range(32768))
+        after = bytes(rng.randrange(256) for _ in range(65536))
+        result = self.do_execution(
+            data_in=[("content", before + payload + after)], config={"window_size": 32768, "window_step": 8192}
+        )
+        self.assertJobResult(
+            result,
+            JobResult(
+                state=State(State.Label.COMPLETED),
+                events=[
+                    Event(
+                        entity_type="binary",
+                        entity_id="bb819e10124c9105363ed7d392d33f69c6aaafc4e69d5db41a9c6bc67808320c",
+                        features={
+                            "entropy": [FV(7.888578422042441)],
+                            "index_of_coincidence": [FV(0.002954119593015094)],
+                            "index_of_coincidence_width": [FV(13, label="0.052183095582535234")],
+                            "index_of_coincidence_region_width": [
+                                FV(13, label="0.24619142115707526", offset=40960, size=81920)
+                            ],
+                        },
+                    )
+                ],
+            ),
+        )
+
+    def test_invalid_windows(self):
+        """
+        Test window settings that can't be scored fail when the plugin loads.
+        """
+        for config in [{"window_size": 32768, "window_step": 0}, {"window_size": 32768, "window_step": 5000}]:
+            with self.assertRaises(ValueError):
+                AzulPluginIndexCoincidence(config)
+        # Windows are off by default, so the step isn't checked.
+        AzulPluginIndexCoincidence({"window_step": 0})
+
+    def test_entropy_regions(self):
+        """
+        Test a high entropy payload in low entropy content is scored on its own.
+        """
+        rng = random.Random(10)
+        key = bytes(rng.randrange(256) for _ in range(29))
+        payload = bytes(rng.randrange(16) ^ key[i % len(key)] for i in range(131072))
+        data = bytes(131072) + payload + bytes(65536)
+        result = self.do_execution(data_in=[("content", data)])
+        self.assertJobResult(
+            result,
+            JobResult(
+                state=State(State.Label.COMPLETED),
+                events=[
+                    Event(
+                        entity_type="binary",
+                        entity_id="2e188c0284d90a06dfd0b39d33332359e472fcf1a83e89423ebaa44fbed264e0",
+                        features={
+                            "entropy": [FV(4.065407247478359)],
+                            "index_of_coincidence_region_width": [
+                                FV(29, label="0.061605732469494745", offset=131072, size=131072)
+                            ],
+                        },
+                    )
+                ],
+            ),
+        )
+
+        # Without region scoring, the content is opted out as before.
+        result = self.do_execution(data_in=[("content", data)], config={"entropy_region_maximum_size": 0})
+        self.assertJobResult(result, JobResult(state=State(State.Label.OPT_OUT)))
+
+    def test_preflight(self):
+        """
+        Test content whose start has low entropy is opted out by a preflight, unless a probe finds a payload.
+        """
+        rng = random.Random(11)
+        key = bytes(rng.randrange(256) for _ in range(29))
+        payload = bytes(rng.randrange(16) ^ key[i % len(key)] for i in range(131072))
+        data = bytes(262144) + payload
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "metrics.json")
+            config = {"preflight_size": 65536, "metrics_path": path}
+            result = self.do_execution(data_in=[("content", data)], config=config)
+            self.assertJobResult(result, JobResult(state=State(State.Label.OPT_OUT)))
+            with open(path) as f:
+                metrics = json.load(f)
+            self.assertIn("preflight", metrics["stages"])
+            self.assertNotIn("read", metrics["stages"])
+            self.assertIn(
+                {"name": "opt_outs", "labels": {"reason": "preflight_low_entropy"}, "value": 1}, metrics["counters"]
+            )
+
+        result = self.do_execution(
+            data_in=[("content", data)], config={"preflight_size": 65536, "preflight_probes": 2}
+        )
+        self.assertEqual(result.state, State(State.Label.COMPLETED))
+        self.assertIn("index_of_coincidence_region_width", result.events[0].features)
+
+    def test_cached(self):
+        """
+        Test results from the on-disk cache are the same as computing them.
+        """
+        data = bytes(list(range(256))) * 2
+        with tempfile.TemporaryDirectory() as tmp:
+            config = {"cache_path": os.path.join(tmp, "results.sqlite")}
+            for _ in range(2):
+                result = self.do_execution(data_in=[("content", data)], config=config)
+                self.assertJobResult(
+                    result,
+                    JobResult(
+                        state=State(State.Label.COMPLETED),
+                        events=[
+                            Event(
+                                entity_type="binary",
+                                entity_id="110009dcee21620b166f3abfecb5eff7a873be729d1c2d53822e7acc5f34eb9b",
+                                features={
+                                    "entropy": [FV(8.0)],
+                                    "index_of_coincidence": [FV(0.0)],
+                                    "index_of_coincidence_width": [FV(256, label="1.0")],
+                                },
+                            )
+                        ],
+                    ),
+                )
+
+            for _ in range(2):
+                result = self.do_execution(data_in=[("content", b"\x00" * 1024)], config=config)
+                self.assertJobResult(result, JobResult(state=State(State.Label.OPT_OUT)))
+
+    def test_metrics(self):
+        """
+        Test stage timings and counters are written to the metrics file after each job.
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "metrics.json")
+            result = self.do_execution(data_in=[("content", b"\x00" * 1024)], config={"metrics_path": path})
+            self.assertJobResult(result, JobResult(state=State(State.Label.OPT_OUT)))
+
+            with open(path) as f:
+                metrics = json.load(f)
+            self.assertIn("read", metrics["stages"])
+            self.assertIn("entropy_gate", metrics["stages"])
+            self.assertIn({"name": "opt_outs", "labels": {"reason": "low_entropy"}, "value": 1}, metrics["counters"])
+            self.assertIn(
+                {"name": "jobs", "labels": {"cached": "false", "outcome": "opt_out"}, "value": 1}, metrics["counters"]
+            )
+
+    def test_metrics_port_in_use(self):
+        """
+        Test a plugin whose metrics port is already served by another instance still loads.
+        """
+        with socket.socket() as taken:
+            taken.bind(("127.0.0.1", 0))
+            taken.listen()
+            with self.assertLogs(level="WARNING"):
+                plugin = AzulPluginIndexCoincidence({"metrics_port": taken.getsockname()[1]})
+        self.assertIsNotNone(plugin.metrics)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,48 @@
+import os
+import tempfile
+import unittest
+
+from azul_plugin_index_coincidence.index_coincidence.known_keys import MARKERS
+from azul_plugin_index_coincidence.index_coincidence.xor import xor_bytes
+from azul_plugin_index_coincidence.key_index import KeyIndex
+
+
+class TestKeyIndex(unittest.TestCase):
+    def test_memory(self):
+        index = KeyIndex()
+        self.assertEqual(len(index), 0)
+        index.add(b"\x01\x02")
+        index.add(b"\x01\x02")
+        index.add(b"")
+        self.assertEqual(index.keys, {b"\x01\x02"})
+
+        data = xor_bytes(MARKERS["DOS stub"][0], b"\x01\x02")
+        self.assertEqual([match.key for match in index.scanner().scan(data)], [b"\x01\x02"])
+
+    def test_store(self):
+        """
+        Test keys are kept in the store, and keys added by another index sharing it are picked up.
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "keys.sqlite")
+            first = KeyIndex(path)
+            first.add(b"\x01\x02")
+            second = KeyIndex(path)
+            self.assertEqual(second.keys, {b"\x01\x02"})
+
+            scanner = first.scanner()
+            self.assertIs(first.scanner(), scanner)
+            second.add(b"\x03")
+            # Keys added since are given to the same scanner rather than building another.
+            self.assertIs(first.scanner(), scanner)
+            self.assertEqual(first.keys, {b"\x01\x02", b"\x03"})
+            data = xor_bytes(MARKERS["DOS stub"][0], b"\x03")
+            self.assertEqual([match.key for match in scanner.scan(data)], [b"\x03"])
+            first.add(b"\x04")
+            self.assertEqual([match.key for match in scanner.scan(xor_bytes(data, b"\x07"))], [b"\x04"])
+            first.close()
+            second.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
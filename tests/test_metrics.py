@@ -0,0 +1,107 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+import urllib.request
+
+from azul_plugin_index_coincidence.index_coincidence.main import analyse, analyse_gated, analyse_stream
+from azul_plugin_index_coincidence.metrics import NULL_STAGE, Metrics, count, stage
+
+
+class TestMetrics(unittest.TestCase):
+    def test_disabled(self):
+        """
+        Test stages and counters do nothing without metrics.
+        """
+        with stage(None, "anything", 10) as timer:
+            timer.size = 20
+        self.assertIs(stage(None, "anything"), NULL_STAGE)
+        self.assertEqual(NULL_STAGE.size, 0)
+        count(None, "anything")
+
+    def test_stages(self):
+        metrics = Metrics(buckets=(1.0, 100.0))
+        with metrics.stage("read") as timer:
+            timer.size = 5
+        metrics.observe("read", 10.0, 7)
+        metrics.count("jobs", outcome="completed")
+        metrics.count("jobs", outcome="completed")
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot["stages"]["read"]["buckets"], {"1.0": 1, "100.0": 2, "+Inf": 2})
+        self.assertEqual(snapshot["stages"]["read"]["count"], 2)
+        self.assertGreaterEqual(snapshot["stages"]["read"]["sum"], 10.0)
+        self.assertIn({"name": "stage_bytes", "labels": {"stage": "read"}, "value": 12}, snapshot["counters"])
+        self.assertIn({"name": "jobs", "labels": {"outcome": "completed"}, "value": 2}, snapshot["counters"])
+        self.assertEqual(list(metrics.last_job), ["read"])
+
+        metrics.start_job()
+        self.assertEqual(metrics.last_job, {})
+
+    def test_prometheus(self):
+        metrics = Metrics(buckets=(1.0,))
+        metrics.observe("read", 0.5)
+        metrics.count("opt_outs", reason="low_entropy")
+        self.assertEqual(
+            metrics.prometheus(),
+            "# TYPE index_coincidence_stage_seconds histogram\n"
+            'index_coincidence_stage_seconds_bucket{stage="read",le="1.0"} 1\n'
+            'index_coincidence_stage_seconds_bucket{stage="read",le="+Inf"} 1\n'
+            'index_coincidence_stage_seconds_sum{stage="read"} 0.5\n'
+            'index_coincidence_stage_seconds_count{stage="read"} 1\n'
+            "# TYPE index_coincidence_opt_outs_total counter\n"
+            'index_coincidence_opt_outs_total{reason="low_entropy"} 1\n',
+        )
+
+    def test_dump(self):
+        metrics = Metrics()
+        metrics.observe("read", 0.5)
+        with tempfile.TemporaryDirectory() as tmp:
+            metrics.dump(os.path.join(tmp, "metrics.json"))
+            with open(os.path.join(tmp, "metrics.json")) as f:
+                self.assertEqual(json.load(f), metrics.snapshot())
+            metrics.dump(os.path.join(tmp, "metrics.prom"))
+            with open(os.path.join(tmp, "metrics.prom")) as f:
+                self.assertEqual(f.read(), metrics.prometheus())
+            self.assertEqual(sorted(os.listdir(tmp)), ["metrics.json", "metrics.prom"])
+
+    def test_serve(self):
+        metrics = Metrics()
+        metrics.count("jobs")
+        server = metrics.serve(0)
+        try:
+            # Only the loopback interface is served by default.
+            self.assertEqual(server.server_address[0], "127.0.0.1")
+            with urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics") as response:
+                self.assertEqual(response.read().decode(), metrics.prometheus())
+            with self.assertRaises(OSError):
+                Metrics().serve(server.server_address[1])
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_analysis_stages(self):
+        """
+        Test analysis records the time spent in each stage and the widths evaluated.
+        """
+        data = bytes(list(range(256))) * 4
+        metrics = Metrics()
+        self.assertEqual(analyse(data, metrics=metrics), analyse(data))
+        self.assertEqual(sorted(metrics.last_job), ["compute_width_scores", "filter_width_scores"])
+
+        metrics.start_job()
+        analyse_gated(data, 6.0, metrics=metrics)
+        self.assertEqual(sorted(metrics.last_job), ["entropy_gate", "filter_width_scores"])
+
+        metrics.start_job()
+        analyse_stream(io.BytesIO(data), metrics=metrics)
+        self.assertEqual(sorted(metrics.last_job), ["compute_width_scores", "filter_width_scores"])
+
+        counters = {(c["name"], tuple(c["labels"].items())): c["value"] for c in metrics.snapshot()["counters"]}
+        self.assertEqual(counters[("widths_evaluated", ())], 900)
+        self.assertEqual(counters[("stage_bytes", (("stage", "compute_width_scores"),))], 2048)
+
+
+if __name__ == "__main__":
+    unittest.main()